@@ -1,14 +1,12 @@
-
-
 from pathlib import Path
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import logging
 import asyncio
-import base64
-import re
 import inspect
+import itertools
 import json
 from typing import Dict, Any, Optional
 import time
@@ -16,15 +14,49 @@ import uuid
 
 # Import original services with fallback
 try:
-    from app.services import stt, llm, tts
-    from app.services.agent import agent_response
+    from app.services import stt, llm, tts, pipeline
+    from app.services.synthesis import (
+        SynthesisStage, StreamingSynthesisStage, TTS_SESSION_CONCURRENCY, TTS_STREAMING
+    )
+    from app.services.tts_cache import tts_cache, cache_key
+    from app.services.audio_frames import (
+        encode_audio_frame, CODEC_MP3, FLAG_STREAM, FLAG_CLIP_END, FLAG_TURN_END
+    )
+    from app.services.budget import (
+        TurnBudget, SEARCH_MIN_REMAINING, SHORT_REPLY_REMAINING, SHORT_REPLY_INSTRUCTION, TTS_MIN_TIMEOUT
+    )
+    from app.services.context import ConversationContext, estimate_tokens
+    from app.persona import diagram_guidance
+    from app.services.client_identity import issue_client_token, verify_client_token
+    from app.services.response_cache import response_cache, cache_key_for
+    from app.services.search_cache import search_cache
+    from app.services.speculation import Speculator
+    from app.services.router import router
+    from app.services.metrics import (
+        TurnTimeline, render_metrics, PROMETHEUS_CONTENT_TYPE, ACTIVE_SESSIONS, AUDIO_FRAMES_SENT,
+        AUDIO_BYTES_SENT, TTS_CACHE_LOOKUPS, RESPONSE_CACHE_LOOKUPS, PERSONA_TOKENS_SAVED
+    )
 except ImportError as e:
     logging.warning(f"Import warning: {e}")
     # We'll handle this in the websocket endpoint
 
+try:
+    from app.services.vad import VoiceActivityDetector, VAD_ENABLED
+except ImportError:
+    logging.warning("Voice activity detection not available (numpy missing)")
+    VoiceActivityDetector = None
+    VAD_ENABLED = False
+
+try:
+    from app.services.audio_codecs import UpstreamDecoder, negotiate_codec, available_codecs
+except ImportError:
+    logging.warning("Compressed upstream audio not available (numpy missing), expecting raw PCM")
+    UpstreamDecoder = None
+
 try:
     from app.services.memory import MemoryManager
 
+    # Opened (and migrated) at startup, so importing the app never writes to the database
     memory_manager = MemoryManager()
 except ImportError:
     logging.warning("Memory manager not available")
@@ -61,7 +93,40 @@ async def health_check():
         "status": "healthy",
         "timestamp": time.time(),
         "version": "2.0.0",
-        "active_sessions": len(active_sessions)
+        "active_sessions": len(active_sessions),
+        "tts_cache": tts_cache.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "search_cache": search_cache.get_stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage turn latency histograms and per-provider request/error counters."""
+    ACTIVE_SESSIONS.set(len(ws_manager.connections))
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/sessions/{session_id}/stats")
+async def session_stats(session_id: str):
+    """Per-session audio statistics (VAD speech/silence and transcriber counters)."""
+    session = ws_manager.get_session(session_id)
+    if not session:
+        return JSONResponse({"error": "Unknown session"}, status_code=404)
+
+    vad = session.get("vad")
+    transcriber = session.get("transcriber")
+    return {
+        "session_id": session_id,
+        "vad": vad.get_stats() if vad else None,
+        "transcriber": transcriber.get_stats() if transcriber and hasattr(transcriber, "get_stats") else None,
+        "upstream_audio": session["upstream_decoder"].get_stats() if session.get("upstream_decoder") else None,
+        "interrupted_turns": session.get("interrupted_turns", 0),
+        "last_turn_budget": session.get("last_turn_budget"),
+        "last_turn_latency": session.get("last_turn_latency"),
+        "last_turn_prompt_tokens": session.get("last_turn_prompt_tokens"),
+        "context": session["context"].get_stats() if session.get("context") else None,
+        "speculation": session["speculator"].get_stats() if session.get("speculator") else None
     }
 
 
@@ -71,6 +136,8 @@ class SimpleWebSocketManager:
     def __init__(self):
         self.connections: Dict[str, WebSocket] = {}
         self.session_data: Dict[str, Dict] = {}
+        # Background folding (or, for anonymous sessions, deletion) of closed sessions' memories
+        self._cleanup_tasks = set()
 
     async def connect(self, websocket: WebSocket, session_id: str):
         await websocket.accept()
@@ -84,32 +151,83 @@ class SimpleWebSocketManager:
                 "voice": "en-US-natalie",
                 "speech_rate": 1.0
             },
-            "transcriber": None
+            "transcriber": None,
+            "vad": VoiceActivityDetector() if VAD_ENABLED else None,
+            "upstream_decoder": UpstreamDecoder() if UpstreamDecoder else None,
+            "turn_id": 0,
+            "active_turn": None,
+            "interrupted_turns": 0,
+            "timeline": None,
+            "tts_slots": asyncio.Semaphore(TTS_SESSION_CONCURRENCY),
+            # Keyed on the session until the client's config names a stable client id
+            "context": ConversationContext(
+                memory_manager, session_id, summarizer=self._summarizer_for(session_id), ephemeral=True
+            ) if memory_manager else None,
+            "speculator": create_speculator(session_id)
         }
         logger.info(f"WebSocket session {session_id} connected")
 
+    def _summarizer_for(self, session_id: str):
+        """Rolling-summary function using the session's Gemini key at the time it runs."""
+        def summarize(texts):
+            api_key = self.session_data.get(session_id, {}).get("api_keys", {}).get("gemini")
+            if not api_key:
+                raise ValueError("no Gemini API key configured")
+            return llm.summarize_texts(texts, api_key)
+        return summarize
+
     async def disconnect(self, session_id: str):
         if session_id in self.connections:
+            # Stop any turn still generating for this session
+            self.interrupt_turn(session_id, notify=False)
+
             # Cleanup transcriber
             session = self.session_data.get(session_id)
             if session and session.get("transcriber"):
-                transcriber = session["transcriber"]
-                try:
-                    if hasattr(transcriber, "close"):
-                        close_method = getattr(transcriber, "close")
-                        if callable(close_method):
-                            if inspect.iscoroutinefunction(close_method):
-                                await close_method()
-                            else:
-                                close_method()
-                except Exception as e:
-                    logger.warning(f"Error closing transcriber: {e}")
+                await self.close_transcriber(session["transcriber"])
+
+            llm.reset_chat_session(session_id)
+            if session and session.get("context"):
+                context = session["context"]
+                if context.ephemeral:
+                    # Anonymous session: its memories can never be recalled again
+                    task = asyncio.create_task(context.discard())
+                else:
+                    # The recent turns were never folded; store them so the next session can recall them
+                    task = asyncio.create_task(context.close(session.get("chat_history", [])))
+                self._cleanup_tasks.add(task)
+                task.add_done_callback(self._cleanup_done)
+            if session and session.get("speculator"):
+                session["speculator"].close()
 
             del self.connections[session_id]
             if session_id in self.session_data:
                 del self.session_data[session_id]
             logger.info(f"WebSocket session {session_id} disconnected")
 
+    def _cleanup_done(self, task: asyncio.Task):
+        self._cleanup_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Closing conversation context failed: {task.exception()}")
+
+    async def finish_cleanup(self, timeout: float = 10.0):
+        """Wait for closing sessions' memory writes and deletions (before the memory store closes)."""
+        if self._cleanup_tasks:
+            await asyncio.wait(list(self._cleanup_tasks), timeout=timeout)
+
+    @staticmethod
+    async def close_transcriber(transcriber):
+        try:
+            if hasattr(transcriber, "close"):
+                close_method = getattr(transcriber, "close")
+                if callable(close_method):
+                    if inspect.iscoroutinefunction(close_method):
+                        await close_method()
+                    else:
+                        close_method()
+        except Exception as e:
+            logger.warning(f"Error closing transcriber: {e}")
+
     async def send_message(self, session_id: str, message: dict):
         if session_id in self.connections:
             try:
@@ -118,6 +236,59 @@ class SimpleWebSocketManager:
                 logger.error(f"Error sending message to {session_id}: {e}")
                 await self.disconnect(session_id)
 
+    async def send_bytes(self, session_id: str, data: bytes):
+        if session_id in self.connections:
+            try:
+                await self.connections[session_id].send_bytes(data)
+            except Exception as e:
+                logger.error(f"Error sending binary frame to {session_id}: {e}")
+                await self.disconnect(session_id)
+
+    def next_turn_id(self, session_id: str) -> int:
+        session = self.session_data.get(session_id)
+        if session is None:
+            return 0
+        session["turn_id"] += 1
+        return session["turn_id"]
+
+    def start_turn(self, session_id: str, turn_coro) -> Optional[asyncio.Task]:
+        """Run a new turn for the session, cancelling (barging in on) the one still in flight."""
+        session = self.session_data.get(session_id)
+        if session is None:
+            turn_coro.close()
+            return None
+
+        self.interrupt_turn(session_id)
+        task = asyncio.create_task(turn_coro)
+        session["active_turn"] = task
+        return task
+
+    def interrupt_turn(self, session_id: str, notify: bool = True) -> bool:
+        """
+        Cancel the session's in-flight turn (LLM stream and pending TTS) and, if notify is set,
+        tell the client to flush queued audio for every turn up to the current one. The flush is sent even
+        when the turn already finished server-side, since the client may still be playing it.
+        Returns whether a running turn was cancelled.
+        """
+        session = self.session_data.get(session_id)
+        if not session:
+            return False
+
+        task = session.get("active_turn")
+        cancelled = bool(task and not task.done())
+        if cancelled:
+            task.cancel()
+            session["interrupted_turns"] += 1
+            logger.info(f"Interrupted turn {session['turn_id']} for {session_id}")
+        session["active_turn"] = None
+
+        if notify and session["turn_id"]:
+            asyncio.create_task(self.send_message(session_id, {
+                "type": "flush",
+                "turn_id": session["turn_id"]
+            }))
+        return cancelled
+
     def get_session(self, session_id: str) -> Dict:
         return self.session_data.get(session_id, {})
 
@@ -140,8 +311,11 @@ async def websocket_endpoint(websocket: WebSocket):
         await ws_manager.connect(websocket, session_id)
         loop = asyncio.get_event_loop()
 
-        async def handle_transcript(text: str):
+        async def handle_transcript(text: str, timeline: TurnTimeline):
             """Handle transcript processing."""
+            # The turn's latency budget starts as soon as the final transcript arrives
+            budget = TurnBudget()
+            outcome = "interrupted"
             try:
                 session = ws_manager.get_session(session_id)
                 chat_history = session.get("chat_history", [])
@@ -156,6 +330,7 @@ async def websocket_endpoint(websocket: WebSocket):
                         "type": "error",
                         "text": f"Please configure these API keys: {', '.join(missing_keys)}"
                     })
+                    outcome = "missing_keys"
                     return
 
                 # Send final transcript
@@ -164,26 +339,24 @@ async def websocket_endpoint(websocket: WebSocket):
                     "text": text
                 })
 
-                # Get LLM response
+                # Stream LLM response, speaking each sentence as soon as it completes
                 try:
-                    # Use the original agent_response function with API keys
-                    full_response, updated_history = await get_agent_response(
-                        text, chat_history, api_keys
+                    full_response, updated_history = await stream_agent_response(
+                        session_id, text, chat_history, session.get("settings", {}), api_keys, budget, timeline
                     )
 
                     # Update chat history
                     ws_manager.update_session(session_id, {"chat_history": updated_history})
 
-                    # Send assistant response
+                    # Send the complete assistant response
                     await ws_manager.send_message(session_id, {
                         "type": "assistant",
                         "text": full_response
                     })
-
-                    # Generate TTS
-                    await process_tts(session_id, full_response, session.get("settings", {}), api_keys)
+                    outcome = "completed"
 
                 except Exception as e:
+                    outcome = "error"
                     logger.error(f"Error in agent response: {e}")
                     await ws_manager.send_message(session_id, {
                         "type": "error",
@@ -191,16 +364,62 @@ async def websocket_endpoint(websocket: WebSocket):
                     })
 
             except Exception as e:
+                outcome = "error"
                 logger.error(f"Error in transcript handler: {e}")
                 await ws_manager.send_message(session_id, {
                     "type": "error",
                     "text": "Sorry, an error occurred while processing your request."
                 })
 
+            finally:
+                report = budget.report()
+                latency = {stage: round(seconds, 3) for stage, seconds in timeline.observe(outcome).items()}
+                ws_manager.update_session(session_id, {
+                    "last_turn_budget": report, "last_turn_latency": latency,
+                    "last_turn_prompt_tokens": llm.take_prompt_usage(session_id)
+                })
+                logger.info(f"Turn budget for {session_id}: {report}")
+
+        def take_timeline() -> TurnTimeline:
+            """Detach the timeline of the utterance that just ended; the next audio chunk starts a new one."""
+            session = ws_manager.get_session(session_id)
+            timeline = session.get("timeline") or TurnTimeline()
+            session["timeline"] = None
+            timeline.mark("final")
+            return timeline
+
+        def on_partial_transcript(text: str):
+            session = ws_manager.get_session(session_id)
+            timeline = session.get("timeline")
+            if timeline:
+                timeline.mark("partial")
+
+            speculator = session.get("speculator")
+            if speculator and speculator.enabled:
+                try:
+                    on_loop = asyncio.get_running_loop() is loop
+                except RuntimeError:
+                    on_loop = False
+                if on_loop:
+                    speculator.on_partial(text)
+                else:
+                    loop.call_soon_threadsafe(speculator.on_partial, text)
+
         def on_final_transcript(text: str):
-            """Callback for final transcript."""
+            """Callback for final transcript; a new transcript barges in on the previous turn."""
             logger.info(f"Final transcript for {session_id}: {text}")
-            asyncio.run_coroutine_threadsafe(handle_transcript(text), loop)
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+
+            if on_loop:
+                ws_manager.start_turn(session_id, handle_transcript(text, take_timeline()))
+            else:
+                def start():
+                    ws_manager.start_turn(session_id, handle_transcript(text, take_timeline()))
+
+                loop.call_soon_threadsafe(start)
 
         # Main message loop
         while True:
@@ -212,18 +431,35 @@ async def websocket_endpoint(websocket: WebSocket):
                     transcriber = session.get("transcriber")
 
                     if transcriber:
+                        # Decode compressed client audio (µ-law / Opus) to the PCM the transcriber expects
+                        audio = message["bytes"]
+                        decoder = session.get("upstream_decoder")
+                        if decoder:
+                            audio = decoder.decode(audio)
+
+                        # Gate silence locally before it reaches (and is billed by) the transcriber
+                        vad = session.get("vad")
+                        chunks = vad.process(audio) if vad else [audio]
+
+                        # First speech audio of an utterance opens the turn's timeline
+                        if chunks and session.get("timeline") is None and (vad is None or vad.in_speech):
+                            timeline = TurnTimeline()
+                            timeline.mark("audio_start")
+                            session["timeline"] = timeline
+
                         try:
-                            if inspect.iscoroutinefunction(transcriber.stream_audio):
-                                await transcriber.stream_audio(message["bytes"])
-                            else:
-                                transcriber.stream_audio(message["bytes"])
+                            for chunk in chunks:
+                                if inspect.iscoroutinefunction(transcriber.stream_audio):
+                                    await transcriber.stream_audio(chunk)
+                                else:
+                                    transcriber.stream_audio(chunk)
                         except Exception as e:
                             logger.error(f"Transcriber error: {e}")
 
                 elif "text" in message:  # Control messages
                     try:
                         data = json.loads(message["text"])
-                        await handle_control_message(session_id, data, on_final_transcript)
+                        await handle_control_message(session_id, data, on_final_transcript, on_partial_transcript)
                     except json.JSONDecodeError:
                         await ws_manager.send_message(session_id, {
                             "type": "ack",
@@ -241,11 +477,14 @@ async def websocket_endpoint(websocket: WebSocket):
         await ws_manager.disconnect(session_id)
 
 
-async def handle_control_message(session_id: str, data: dict, transcript_callback):
+async def handle_control_message(session_id: str, data: dict, transcript_callback, partial_callback=None):
     """Handle control messages like configuration updates."""
     message_type = data.get("type")
 
-    if message_type == "config":
+    if message_type == "interrupt":
+        ws_manager.interrupt_turn(session_id)
+
+    elif message_type == "config":
         # Update API keys and settings
         api_keys = data.get("apiKeys", {})
         settings = data.get("settings", {})
@@ -255,81 +494,410 @@ async def handle_control_message(session_id: str, data: dict, transcript_callbac
             "settings": settings
         })
 
+        # Long-term memory follows a client id the server issued and signed, so it is recalled after a reconnect
+        # but cannot be chosen or guessed by another client. Clients that don't ask for one stay anonymous.
+        context = ws_manager.get_session(session_id).get("context")
+        if context and "clientToken" in data:
+            client_id = verify_client_token(data["clientToken"])
+            if client_id is None:
+                client_id, token = issue_client_token()
+                await ws_manager.send_message(session_id, {
+                    "type": "client_token",
+                    "token": token
+                })
+            context.set_user(f"client:{client_id}")
+
+        # Upstream audio codec negotiation; the reply tells the client what the server will actually decode
+        if "audioCodec" in data:
+            codec = negotiate_codec(data["audioCodec"]) if UpstreamDecoder else "pcm16"
+            if UpstreamDecoder:
+                ws_manager.update_session(session_id, {"upstream_decoder": UpstreamDecoder(codec)})
+            await ws_manager.send_message(session_id, {
+                "type": "codec",
+                "codec": codec,
+                "available": available_codecs() if UpstreamDecoder else ["pcm16"]
+            })
+
         # Initialize transcriber with new API key
         if api_keys.get("assembly"):
             try:
-                # Create transcriber with dynamic API key
-                transcriber = stt.AssemblyAIStreamingTranscriber(
+                # Replace any transcriber from an earlier config message
+                previous = ws_manager.get_session(session_id).get("transcriber")
+                if previous:
+                    await ws_manager.close_transcriber(previous)
+
+                # Create transcriber with dynamic API key; connects in the background on the event loop
+                transcriber = stt.AsyncAssemblyAIStreamingTranscriber(
                     api_key=api_keys["assembly"],
-                    on_final_callback=transcript_callback
+                    on_partial_callback=partial_callback,
+                    on_final_callback=transcript_callback,
+                    on_error_callback=lambda text: ws_manager.send_message(session_id, {"type": "error", "text": text})
                 )
 
                 ws_manager.update_session(session_id, {"transcriber": transcriber})
-
-                await ws_manager.send_message(session_id, {
-                    "type": "status",
-                    "text": "Configuration updated successfully! 🎉",
-                    "level": "success"
-                })
+                # Confirmed (or failed) once the streaming session opens, without holding up incoming audio
+                asyncio.create_task(confirm_transcriber(session_id, transcriber))
             except Exception as e:
                 logger.error(f"Failed to initialize transcriber: {e}")
-                await ws_manager.send_message(session_id, {
-                    "type": "error",
-                    "text": "Failed to initialize speech recognition. Please check your AssemblyAI API key."
-                })
+                await send_transcriber_error(session_id)
 
 
-async def get_agent_response(query: str, history: list, api_keys: dict):
-    """Get agent response with API key support."""
+async def confirm_transcriber(session_id: str, transcriber):
+    """Tell the client whether speech recognition is live; a transcriber that failed to connect is dropped."""
+    if await transcriber.wait_connected():
+        await ws_manager.send_message(session_id, {
+            "type": "status",
+            "text": "Configuration updated successfully! 🎉",
+            "level": "success"
+        })
+        return
+
+    logger.error(f"Failed to initialize transcriber: {transcriber.error or 'connection timed out'}")
+    await ws_manager.close_transcriber(transcriber)
+    if ws_manager.get_session(session_id).get("transcriber") is transcriber:
+        ws_manager.update_session(session_id, {"transcriber": None})
+        await send_transcriber_error(session_id)
+
+
+async def send_transcriber_error(session_id: str):
+    await ws_manager.send_message(session_id, {
+        "type": "error",
+        "text": "Failed to initialize speech recognition. Please check your AssemblyAI API key."
+    })
+
+
+async def stream_agent_response(session_id: str, query: str, history: list, settings: dict, api_keys: dict,
+                                budget: Optional[TurnBudget] = None, timeline: Optional[TurnTimeline] = None):
+    """
+    Stream the agent response, handing each completed sentence to TTS while the LLM is still generating.
+    Every stage takes its timeout from the turn budget and degrades (skips search, shortens the reply) when it runs low.
+    With a conversation context, only the recent turns that fit its token budget are sent, preceded by
+    the rolling summary and recalled memories.
+    A reply speculated from the partial transcript is used when it matches the final one; otherwise an opening
+    question that is self-contained, factual and time-insensitive is answered from the response cache when possible.
+    """
+    if budget is None:
+        budget = TurnBudget()
+
     try:
-        # Simple search trigger check
-        search_triggers = ["latest", "today", "current", "news", "price", "weather"]
-        needs_search = any(trigger in query.lower() for trigger in search_triggers)
-
-        if needs_search and api_keys.get("serpapi"):
-            # Use search (simplified)
-            from app.services.search import web_search
-            search_result = web_search(query)
-            enhanced_query = f"Based on this information: {search_result}\n\nAnswer: {query}"
-            response, updated_history = llm.get_llm_response(enhanced_query, history)
-        else:
-            # Use LLM directly
-            response, updated_history = llm.get_llm_response(query, history)
+        session = ws_manager.get_session(session_id) or {}
+        context = session.get("context")
+        speculator = session.get("speculator")
+        speculative = speculator.claim(query, history) if speculator else None
+
+        response_key = cache_key_for(query, history) if response_cache.enabled else None
+        if response_key and speculative is None:
+            cached_response, result = await asyncio.to_thread(response_cache.get, response_key)
+            RESPONSE_CACHE_LOOKUPS.labels(result).inc()
+            if cached_response is not None:
+                return await speak_cached_response(
+                    session_id, query, cached_response, history, settings, api_keys, budget, timeline, context
+                )
 
+        if speculative is None:
+            sent_history, preamble, user_message = await prepare_prompt(query, history, api_keys, budget, context)
+        stage = create_synthesis_stage(session_id, settings, api_keys, budget, timeline)
+
+        async def on_delta(delta: str):
+            if timeline:
+                timeline.mark("llm_first_token")
+            await ws_manager.send_message(session_id, {
+                "type": "assistant_delta",
+                "text": delta
+            })
+
+        async def on_error(text: str):
+            # A reply cut short mid-stream: tell the client, but keep the notice out of the spoken reply and history
+            await ws_manager.send_message(session_id, {
+                "type": "error",
+                "text": text
+            })
+
+        try:
+            with budget.stage("llm"):
+                if speculative:
+                    reply = await speculative.replay(on_delta, stage.submit)
+                    response, updated_history, sent_history = reply["response"], reply["history"], reply["sent_history"]
+                    shareable = reply["shareable"]
+                    tokens_saved = reply.get("persona_tokens_saved", 0)
+                    if reply.get("error"):
+                        await on_error(reply["error"])
+                else:
+                    response, updated_history = await pipeline.run_streaming_turn(
+                        preamble + user_message, sent_history, api_keys.get("gemini"), on_delta, stage.submit,
+                        session_id, budget, on_error
+                    )
+                    shareable = not preamble and user_message == query and not budget.degraded
+                    tokens_saved = persona_tokens_saved(preamble)
+            # Counted for committed turns only: a discarded speculative prompt saved nothing the user paid for
+            if tokens_saved:
+                PERSONA_TOKENS_SAVED.inc(tokens_saved)
+            if timeline:
+                timeline.mark("llm_complete")
+        except asyncio.CancelledError:
+            # Barge-in: drop every sentence that has not been sent yet
+            stage.cancel()
+            raise
+        finally:
+            if not stage.cancelled:
+                with budget.stage("tts"):
+                    await finish_synthesis(session_id, stage)
+
+        # Only answers produced from the plain question (no recalled context, search or shortening) are shared
+        if response_key and response and updated_history is not sent_history and shareable:
+            await asyncio.to_thread(response_cache.put, response_key, response)
+
+        if context:
+            updated_history = context.commit(query, history, sent_history, updated_history)
         return response, updated_history
 
     except Exception as e:
-        logger.error(f"Error in agent response: {e}")
+        logger.error(f"Error in streaming agent response: {e}")
         return "I apologize, but I encountered an error. Please check your API configuration.", history
 
 
-async def process_tts(session_id: str, text: str, settings: dict, api_keys: dict):
-    """Process text-to-speech."""
+async def prepare_prompt(query: str, history: list, api_keys: dict, budget: TurnBudget,
+                         context: Optional[ConversationContext] = None):
+    """
+    (history to send, context preamble, user message) for a question. The router picks the tools: recent turns
+    and recalled memories from the conversation context, web search results for time-sensitive questions
+    and the Mermaid guidance for diagram requests (run concurrently), and a brevity hint is added when the
+    turn budget is running low.
+    """
+    request = {"history": history, "api_keys": api_keys, "budget": budget, "context": context}
+    results = await router.dispatch(router.route(query), query, request)
+
+    sent_history, preamble = results.get("memory") or (history, "")
+    if results.get("diagram"):
+        preamble = results["diagram"] + (preamble or "[Current message]\n")
+    user_message = query
+    if results.get("search"):
+        user_message = f"Based on this information: {results['search']}\n\nAnswer: {query}"
+
+    if not budget.can_afford(SHORT_REPLY_REMAINING):
+        budget.degrade("short reply requested")
+        user_message += SHORT_REPLY_INSTRUCTION
+
+    return sent_history, preamble, user_message
+
+
+async def memory_tool(query: str, request: dict):
+    """(history to send, preamble) from the conversation context, or the plain history without one."""
+    context, history, budget = request["context"], request["history"], request["budget"]
+    if not context:
+        return history, ""
+    with budget.stage("context"):
+        try:
+            return await context.prepare(query, history, recall_timeout=budget.timeout_for("context"))
+        except asyncio.TimeoutError:
+            budget.degrade("memory recall skipped")
+            return history, ""
+
+
+# Kept out of the system instruction: most turns don't ask for a diagram
+DIAGRAM_GUIDANCE_BLOCK = f"[Diagram guidelines]\n{diagram_guidance.strip()}\n\n"
+DIAGRAM_GUIDANCE_TOKENS = estimate_tokens(DIAGRAM_GUIDANCE_BLOCK)
+
+
+def persona_tokens_saved(preamble: str) -> int:
+    """Tokens a prompt saved by leaving the diagram guidance out of the system instruction."""
+    return 0 if preamble.startswith(DIAGRAM_GUIDANCE_BLOCK) else DIAGRAM_GUIDANCE_TOKENS
+
+
+async def diagram_tool(query: str, request: dict) -> str:
+    """Mermaid guidance for a turn that asks for a diagram."""
+    return DIAGRAM_GUIDANCE_BLOCK
+
+
+async def search_tool(query: str, request: dict) -> Optional[str]:
+    """Web search result for the prompt, bounded by the turn's remaining budget."""
+    if not request["api_keys"].get("serpapi"):
+        return None
+    from app.services.search import web_search
+    budget = request["budget"]
+    if not budget.can_afford(SEARCH_MIN_REMAINING):
+        budget.degrade("search skipped")
+        return None
+    timeout = budget.timeout_for("search")
+    with budget.stage("search"):
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(web_search, query, timeout), timeout=timeout)
+        except asyncio.TimeoutError:
+            budget.degrade("search timed out")
+            return None
+
+
+def create_speculator(session_id: str) -> Speculator:
+    """
+    Speculation from the session's partial transcripts: web search prefetch, and in SPECULATION=llm mode
+    the whole reply, prepared with the same prompt a real turn would use but with its own budget.
+    """
+    def session() -> dict:
+        return ws_manager.get_session(session_id) or {}
+
+    async def prefetch_search(text: str):
+        if not session().get("api_keys", {}).get("serpapi"):
+            return None
+        from app.services.search import web_search
+        timeout = TurnBudget().timeout_for("search")
+        return await asyncio.to_thread(web_search, text, timeout)
+
+    async def generate_reply(text: str, history: list, on_delta) -> dict:
+        api_keys = session().get("api_keys", {})
+        response_key = cache_key_for(text, history) if response_cache.enabled else None
+        if response_key:
+            cached_response, _ = await asyncio.to_thread(response_cache.get, response_key)
+            if cached_response is not None:
+                await on_delta(cached_response)
+                updated_history = list(history) + [{"role": "user", "parts": [text]},
+                                                   {"role": "model", "parts": [cached_response]}]
+                return {"response": cached_response, "history": updated_history, "sent_history": history,
+                        "shareable": False, "persona_tokens_saved": 0}
+
+        budget = TurnBudget()
+        sent_history, preamble, user_message = await prepare_prompt(
+            text, history, api_keys, budget, session().get("context")
+        )
+        errors = []
+
+        async def on_error(message: str):
+            errors.append(message)
+
+        # No session id: a speculative reply that gets discarded must not count towards the session's prompt usage
+        response, updated_history = await pipeline.run_streaming_turn(
+            preamble + user_message, sent_history, api_keys.get("gemini"), on_delta, None, None, budget, on_error
+        )
+        # Errors are held until the reply is claimed; a discarded speculation never reaches the client
+        return {"response": response, "history": updated_history, "sent_history": sent_history,
+                "shareable": not preamble and user_message == text and not budget.degraded and not errors,
+                "persona_tokens_saved": persona_tokens_saved(preamble), "error": errors[0] if errors else None}
+
+    return Speculator(lambda text: router.route(text).needs_search, prefetch_search, generate_reply,
+                      get_history=lambda: session().get("chat_history", []))
+
+
+async def speak_cached_response(session_id: str, query: str, response: str, history: list, settings: dict,
+                                api_keys: dict, budget: TurnBudget, timeline: Optional[TurnTimeline],
+                                context: Optional[ConversationContext]):
+    """Deliver a cached answer the way a streamed one is delivered, without calling Gemini."""
+    stage = create_synthesis_stage(session_id, settings, api_keys, budget, timeline)
     try:
-        # Split into sentences
-        sentences = re.split(r'(?<=[.?!])\s+', text.strip())
-
-        for sentence in sentences:
-            if sentence.strip():
-                # Generate audio
-                loop = asyncio.get_event_loop()
-                audio_bytes = await loop.run_in_executor(
-                    None,
-                    tts.speak,
-                    sentence.strip(),
-                    settings.get("voice", "en-US-natalie"),  # ✅ valid voiceId
-                    "mp3"
-                )
-
-                if audio_bytes:
-                    b64_audio = base64.b64encode(audio_bytes).decode("utf-8")
-                    await ws_manager.send_message(session_id, {
-                        "type": "audio",
-                        "b64": b64_audio
-                    })
-
-    except Exception as e:
-        logger.error(f"TTS processing error: {e}")
+        if timeline:
+            timeline.mark("llm_first_token")
+        await ws_manager.send_message(session_id, {
+            "type": "assistant_delta",
+            "text": response
+        })
+        chunker = pipeline.SentenceChunker()
+        for sentence in chunker.feed(response):
+            stage.submit(sentence)
+        tail = chunker.flush()
+        if tail:
+            stage.submit(tail)
+        if timeline:
+            timeline.mark("llm_complete")
+    except asyncio.CancelledError:
+        stage.cancel()
+        raise
+    finally:
+        if not stage.cancelled:
+            with budget.stage("tts"):
+                await finish_synthesis(session_id, stage)
+
+    updated_history = list(history) + [{"role": "user", "parts": [query]}, {"role": "model", "parts": [response]}]
+    if context:
+        updated_history = context.commit(query, history, history, updated_history)
+    return response, updated_history
+
+
+def create_synthesis_stage(session_id: str, settings: dict, api_keys: dict,
+                           budget: Optional[TurnBudget] = None,
+                           timeline: Optional[TurnTimeline] = None) -> SynthesisStage:
+    """
+    Build a TTS stage for one turn that synthesizes sentences concurrently and sends binary audio frames in order.
+    With TTS_STREAMING, each clip is forwarded in chunks as Murf's audioFile downloads (FLAG_STREAM frames).
+    With a turn budget, each Murf request is bounded by the remaining time (never less than TTS_MIN_TIMEOUT).
+    """
+    voice = settings.get("voice", "en-US-natalie")  # ✅ valid voiceId
+    tts_slots = ws_manager.get_session(session_id).get("tts_slots")
+    turn_id = ws_manager.next_turn_id(session_id)
+
+    def record_frame(audio_bytes: bytes):
+        if timeline:
+            timeline.mark("frame_sent")
+        AUDIO_FRAMES_SENT.inc()
+        AUDIO_BYTES_SENT.inc(len(audio_bytes))
+
+    if TTS_STREAMING:
+        async def synthesize_stream(sentence: str):
+            key = cache_key(voice, sentence, "mp3")
+            audio_bytes = await tts_cache.aget(key)
+            if audio_bytes:
+                TTS_CACHE_LOOKUPS.labels("hit").inc()
+                yield audio_bytes
+                return
+            TTS_CACHE_LOOKUPS.labels("miss").inc()
+
+            if timeline:
+                timeline.mark("tts_request")
+            timeout = budget.timeout_for("tts", floor=TTS_MIN_TIMEOUT) if budget else None
+            parts = []
+            async for chunk in tts.speak_stream_async(sentence, voice, "mp3", api_keys.get("murf"), timeout):
+                if timeline:
+                    timeline.mark("tts_first_audio")
+                parts.append(chunk)
+                yield chunk
+            if parts:
+                await tts_cache.aput(key, b"".join(parts))
+
+        clip = {"seq": 0}
+
+        async def deliver_chunk(chunk: bytes, clip_end: bool):
+            flags = FLAG_STREAM | (FLAG_CLIP_END if clip_end else 0)
+            await ws_manager.send_bytes(session_id, encode_audio_frame(chunk, turn_id, clip["seq"], CODEC_MP3, flags))
+            if clip_end:
+                clip["seq"] += 1
+            elif chunk:
+                record_frame(chunk)
+
+        async def end_turn():
+            await ws_manager.send_bytes(session_id, encode_audio_frame(b"", turn_id, clip["seq"], CODEC_MP3,
+                                                                       FLAG_STREAM | FLAG_TURN_END))
+
+        return StreamingSynthesisStage(synthesize_stream, deliver_chunk, tts_slots, end_turn)
+
+    async def synthesize(sentence: str):
+        key = cache_key(voice, sentence, "mp3")
+        audio_bytes = await tts_cache.aget(key)
+        if audio_bytes:
+            TTS_CACHE_LOOKUPS.labels("hit").inc()
+            return audio_bytes
+        TTS_CACHE_LOOKUPS.labels("miss").inc()
+
+        if timeline:
+            timeline.mark("tts_request")
+        timeout = budget.timeout_for("tts", floor=TTS_MIN_TIMEOUT) if budget else None
+        audio_bytes = await tts.speak_async(sentence, voice, "mp3", api_keys.get("murf"), timeout)
+        if audio_bytes:
+            if timeline:
+                timeline.mark("tts_first_audio")
+            await tts_cache.aput(key, audio_bytes)
+        return audio_bytes
+
+    sequence = itertools.count()
+
+    async def deliver(audio_bytes: bytes):
+        await ws_manager.send_bytes(session_id, encode_audio_frame(audio_bytes, turn_id, next(sequence), CODEC_MP3))
+        record_frame(audio_bytes)
+
+    return SynthesisStage(synthesize, deliver, tts_slots)
+
+
+async def finish_synthesis(session_id: str, stage: SynthesisStage):
+    """Wait for a TTS stage to drain and report failed sentences to the client."""
+    await stage.close()
+    if stage.failed:
+        logger.error(f"TTS processing error: {stage.failed}/{stage.submitted} sentences failed")
         await ws_manager.send_message(session_id, {
             "type": "error",
             "text": "Audio generation failed"
@@ -339,8 +907,17 @@ async def process_tts(session_id: str, text: str, settings: dict, api_keys: dict
 @app.on_event("startup")
 async def startup_event():
     """Application startup event."""
+    # Create or migrate the memory database
+    if memory_manager:
+        await asyncio.to_thread(memory_manager.open)
+
     logger.info("🚀 AI Voice Agent Pro started successfully!")
 
+    # Tools the router may run for a turn, before or alongside the LLM
+    router.register_tool("memory", memory_tool)
+    router.register_tool("search", search_tool)
+    router.register_tool("diagram", diagram_tool)
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -351,6 +928,16 @@ async def shutdown_event():
     for session_id in list(ws_manager.connections.keys()):
         await ws_manager.disconnect(session_id)
 
+    # Store closed sessions' last turns and delete anonymous ones' memories before the memory store closes
+    await ws_manager.finish_cleanup()
+
+    # Release pooled TTS connections
+    await tts.close_async_client()
+
+    # Commit queued memory writes and close the SQLite connections
+    if memory_manager:
+        memory_manager.close()
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -3,11 +3,15 @@ import logging
 from typing import List, Dict, Any, Tuple
 import re
 import os
+import asyncio
 
-from app.services.llm import get_llm_response
+from app.services.llm import get_llm_response_async
+from app.services.router import router
 
 logger = logging.getLogger(__name__)
 
+SERPAPI_BACKEND = os.getenv("SERPAPI_BACKEND")
+
 
 async def agent_response(user_query, history, api_keys: Dict[str, str] = None):
     """
@@ -16,20 +20,12 @@ async def agent_response(user_query, history, api_keys: Dict[str, str] = None):
     if api_keys is None:
         api_keys = {}
 
-    # Simple search trigger detection
-    search_triggers = [
-        "latest", "today", "yesterday", "current", "now", "recent",
-        "price", "cost", "stock", "market", "news", "weather",
-        "2024", "2025", "this year", "last year"
-    ]
-
-    query_lower = user_query.lower()
-    needs_search = any(trigger in query_lower for trigger in search_triggers)
+    needs_search = router.route(user_query).needs_search
 
     if needs_search:
         # Try web search first
         try:
-            search_result = web_search(user_query, api_keys.get("serpapi"))
+            search_result = await asyncio.to_thread(web_search, user_query, api_keys.get("serpapi"))
             if search_result and "couldn't find" not in search_result:
                 # Enhance the query with search results
                 enhanced_query = f"""
@@ -39,7 +35,7 @@ Please answer the user's question: {user_query}
 
 Provide a comprehensive response that incorporates the search results with your knowledge.
 """
-                return get_llm_response(
+                return await get_llm_response_async(
                     enhanced_query,
                     history,
                     api_keys.get("gemini")
@@ -48,12 +44,12 @@ Provide a comprehensive response that incorporates the search results with your
             logger.warning(f"Search failed, using LLM only: {e}")
 
     # Use LLM for general questions
-    return get_llm_response(user_query, history, api_keys.get("gemini"))
+    return await get_llm_response_async(user_query, history, api_keys.get("gemini"))
 
 
-def web_search(query: str, api_key: str = None) -> str:
+def web_search(query: str, api_key: str = None, timeout: float = None) -> str:
     """
-    Perform web search using SerpAPI.
+    Perform web search using SerpAPI. Results are shared through the search cache.
     """
     if not api_key:
         api_key = os.getenv("SERPAPI_KEY")
@@ -61,6 +57,12 @@ def web_search(query: str, api_key: str = None) -> str:
     if not api_key:
         return "Web search is not available. Please configure SerpAPI key."
 
+    from app.services.search_cache import search_cache
+    return search_cache.lookup("agent", query, lambda: _serpapi_search(query, api_key, timeout), timeout)
+
+
+def _serpapi_search(query: str, api_key: str, timeout: float = None) -> Tuple[str, bool]:
+    """Uncached SerpAPI call; returns (text, whether the text is a real result worth caching)."""
     try:
         from serpapi import GoogleSearch
 
@@ -72,11 +74,15 @@ def web_search(query: str, api_key: str = None) -> str:
         }
 
         search = GoogleSearch(params)
+        if SERPAPI_BACKEND:
+            search.BACKEND = SERPAPI_BACKEND
+        if timeout:
+            search.timeout = timeout
         results = search.get_dict()
 
         if "error" in results:
             logger.error(f"Search API error: {results['error']}")
-            return "Search service encountered an error."
+            return "Search service encountered an error.", False
 
         if "organic_results" in results and results["organic_results"]:
             # Format the top results
@@ -89,66 +95,30 @@ def web_search(query: str, api_key: str = None) -> str:
                 formatted_result = f"{title}: {snippet} (Source: {link})"
                 formatted_results.append(formatted_result)
 
-            return " | ".join(formatted_results)
+            return " | ".join(formatted_results), True
         else:
-            return "I couldn't find any reliable information right now."
+            return "I couldn't find any reliable information right now.", False
 
     except ImportError:
         logger.error("SerpAPI library not installed")
-        return "Search functionality requires the serpapi package."
+        return "Search functionality requires the serpapi package.", False
     except Exception as e:
         logger.error(f"Search error: {e}")
-        return "Search service is currently unavailable."
+        return "Search service is currently unavailable.", False
 
 
 def analyze_query_intent(query: str) -> Dict[str, Any]:
     """
-    Analyze query to determine intent and need for search.
+    Analyze query to determine intent and need for search (see app.services.router).
+    'needs_search' is true when any search intent matched, as before the router; whether a turn actually
+    waits for search is the route's own needs_search. 'primary_intent' is now the intent with the most
+    pattern weight rather than the most matches.
     """
-    query_lower = query.lower()
-
-    # Define intent patterns
-    intent_patterns = {
-        'current_info': [
-            r'\b(today|now|current|latest|recent)\b',
-            r'\b(what\'s|whats) (happening|new)\b',
-            r'\b(this (year|month|week))\b'
-        ],
-        'financial': [
-            r'\b(price|cost|stock|market|trading)\b',
-            r'\b(USD|EUR|bitcoin|crypto)\b'
-        ],
-        'weather': [
-            r'\b(weather|temperature|rain|snow)\b'
-        ],
-        'news': [
-            r'\b(news|breaking|headline|announced)\b'
-        ],
-        'factual': [
-            r'\b(what is|who is|where is|when is|how)\b',
-            r'\b(define|explain|meaning)\b'
-        ]
-    }
-
-    detected_intents = {}
-
-    for intent, patterns in intent_patterns.items():
-        score = 0
-        for pattern in patterns:
-            matches = re.findall(pattern, query_lower)
-            score += len(matches)
-
-        if score > 0:
-            detected_intents[intent] = score
-
-    # Determine if search is needed
-    search_intents = ['current_info', 'financial', 'weather', 'news']
-    needs_search = any(intent in detected_intents for intent in search_intents)
-
+    route = router.route(query)
     return {
-        'intents': detected_intents,
-        'needs_search': needs_search,
-        'primary_intent': max(detected_intents, key=detected_intents.get) if detected_intents else 'general'
+        'intents': route.intents,
+        'needs_search': route.wants("search"),
+        'primary_intent': route.primary_intent
     }
 
 
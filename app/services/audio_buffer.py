@@ -0,0 +1,166 @@
+# app/services/audio_buffer.py
+import logging
+import os
+import threading
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Size of each chunk sent upstream; smaller frames cut latency, larger ones cut per-message overhead.
+# AssemblyAI streaming accepts 50-1000 ms per message.
+UPSTREAM_FRAME_MS = int(os.getenv("UPSTREAM_FRAME_MS", "50"))
+# AssemblyAI turn detection, sent explicitly with each streaming session: silence that ends a turn when the
+# turn model is confident, and silence after which the turn is ended regardless
+STT_MIN_END_OF_TURN_SILENCE_MS = int(os.getenv("STT_MIN_END_OF_TURN_SILENCE_MS", "400"))
+STT_MAX_TURN_SILENCE_MS = int(os.getenv("STT_MAX_TURN_SILENCE_MS", "2400"))
+# Audio held per session before the overflow policy kicks in
+INGEST_BUFFER_MS = int(os.getenv("INGEST_BUFFER_MS", "2000"))
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # keep the freshest audio (live conversation)
+OVERFLOW_DROP_NEWEST = "drop_newest"  # keep what is already buffered, reject the incoming tail
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", OVERFLOW_DROP_OLDEST)
+
+
+def frame_bytes_for(frame_ms: int, sample_rate: int = 16000, sample_width: int = 2) -> int:
+    """Bytes in a frame of `frame_ms` milliseconds of mono PCM."""
+    return max(1, sample_rate * frame_ms // 1000) * sample_width
+
+
+class PCMRingBuffer:
+    """
+    Preallocated ring buffer that accepts PCM of any chunk size and hands it out re-framed to a fixed size.
+    Writes copy straight from the caller's buffer (via memoryview) into the ring; reads copy into a single
+    reusable frame buffer, so steady-state ingestion allocates nothing per chunk.
+    Safe to write from one thread and read from another.
+    """
+
+    def __init__(self, capacity_bytes: int, frame_bytes: int, overflow: str = INGEST_OVERFLOW_POLICY,
+                 sample_width: int = 2):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.frame_bytes = frame_bytes
+        self.sample_width = sample_width
+        # Whole number of frames, and room for at least two
+        frames = max(2, -(-capacity_bytes // frame_bytes))
+        self.capacity = frames * frame_bytes
+        self.overflow = overflow
+
+        self._buf = bytearray(self.capacity)
+        self._view = memoryview(self._buf)
+        self._frame = bytearray(frame_bytes)
+        self._frame_view = memoryview(self._frame)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "written_bytes": 0,
+            "dropped_bytes": 0,
+            "frames_out": 0,
+            "overflows": 0,
+        }
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def write(self, data) -> int:
+        """Append PCM (bytes, bytearray or memoryview). Returns the number of bytes dropped by the overflow policy."""
+        src = memoryview(data).cast("B")
+        dropped = 0
+        with self._cond:
+            if self._closed:
+                return len(src)
+
+            free = self.capacity - self._size
+            if len(src) > free:
+                self._stats["overflows"] += 1
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    keep = free - free % self.sample_width
+                    dropped = len(src) - keep
+                    src = src[:keep]
+                else:
+                    if len(src) > self.capacity:
+                        dropped += len(src) - self.capacity
+                        src = src[-self.capacity:]
+                    # Evict whole samples from the head so the stream stays aligned
+                    evict = len(src) - (self.capacity - self._size)
+                    evict += -evict % self.sample_width
+                    evict = min(evict, self._size)
+                    self._start = (self._start + evict) % self.capacity
+                    self._size -= evict
+                    dropped += evict
+
+            n = len(src)
+            if n:
+                end = (self._start + self._size) % self.capacity
+                first = min(n, self.capacity - end)
+                self._view[end:end + first] = src[:first]
+                if first < n:
+                    self._view[:n - first] = src[first:]
+                self._size += n
+                self._stats["written_bytes"] += n
+                self._cond.notify()
+
+            self._stats["dropped_bytes"] += dropped
+        return dropped
+
+    def _read_into_frame(self, n: int) -> memoryview:
+        first = min(n, self.capacity - self._start)
+        self._frame_view[:first] = self._view[self._start:self._start + first]
+        if first < n:
+            self._frame_view[first:n] = self._view[:n - first]
+        self._start = (self._start + n) % self.capacity
+        self._size -= n
+        self._stats["frames_out"] += 1
+        return self._frame_view[:n]
+
+    def read_frame(self) -> Optional[memoryview]:
+        """
+        Next full frame, or None if less than a frame is buffered.
+        The returned view is reused by the next read, so send (or copy) it before reading again.
+        """
+        with self._cond:
+            if self._size < self.frame_bytes:
+                return None
+            return self._read_into_frame(self.frame_bytes)
+
+    def read_frame_blocking(self, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Wait for a full frame. After close(), returns the remaining partial frame once, then None.
+        Also returns None if the timeout expires.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._size >= self.frame_bytes or self._closed, timeout):
+                return None
+            if self._size >= self.frame_bytes:
+                return self._read_into_frame(self.frame_bytes)
+            if self._size:
+                return self._read_into_frame(self._size)
+            return None
+
+    def drain(self) -> Optional[memoryview]:
+        """Return whatever partial frame is left (used when the stream ends)."""
+        with self._cond:
+            if not self._size:
+                return None
+            return self._read_into_frame(min(self._size, self.frame_bytes))
+
+    def close(self):
+        """Reject further writes and wake any blocked reader."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = self._stats.copy()
+            stats["buffered_bytes"] = self._size
+        stats["capacity_bytes"] = self.capacity
+        stats["frame_bytes"] = self.frame_bytes
+        stats["overflow_policy"] = self.overflow
+        return stats
@@ -0,0 +1,129 @@
+# app/services/audio_codecs.py
+import logging
+from typing import Dict, Any
+
+import numpy as np
+
+from app.services.metrics import UPSTREAM_WIRE_BYTES, UPSTREAM_PCM_BYTES
+
+logger = logging.getLogger(__name__)
+
+try:
+    import opuslib
+
+    OPUS_AVAILABLE = True
+except Exception:  # ImportError, or the libopus shared library is missing
+    opuslib = None
+    OPUS_AVAILABLE = False
+
+UPSTREAM_PCM16 = "pcm16"
+UPSTREAM_MULAW = "mulaw"
+UPSTREAM_OPUS = "opus"
+
+# Largest Opus packet is 120 ms
+_OPUS_MAX_FRAME_MS = 120
+
+_MULAW_BIAS = 0x84
+_MULAW_CLIP = 32635
+
+
+def _build_mulaw_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _MULAW_BIAS) << exponent) - _MULAW_BIAS
+    return np.where(sign, -magnitude, magnitude).astype(np.int16)
+
+
+_MULAW_DECODE = _build_mulaw_decode_table()
+# Segment (exponent) lookup by the top byte of the biased magnitude
+_MULAW_EXPONENT = np.concatenate([[0], np.floor(np.log2(np.arange(1, 256))).astype(np.int32)])
+
+
+def mulaw_decode(data: bytes) -> bytes:
+    """G.711 µ-law to 16-bit little-endian PCM, one table lookup per sample."""
+    return _MULAW_DECODE[np.frombuffer(data, dtype=np.uint8)].astype("<i2", copy=False).tobytes()
+
+
+def mulaw_encode(pcm: bytes) -> bytes:
+    """16-bit PCM to G.711 µ-law (for clients, tests and the load generator)."""
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2).astype(np.int32)
+    negative = samples < 0
+    sign = negative.astype(np.int32) << 7
+    magnitude = np.abs(samples)
+    # G.711 works on 14-bit samples; truncating negatives rounds their magnitude up
+    magnitude = np.where(negative, (magnitude + 3) & ~3, magnitude)
+    magnitude = np.minimum(magnitude, _MULAW_CLIP) + _MULAW_BIAS
+    exponent = _MULAW_EXPONENT[magnitude >> 7]
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+def available_codecs():
+    codecs = [UPSTREAM_PCM16, UPSTREAM_MULAW]
+    if OPUS_AVAILABLE:
+        codecs.append(UPSTREAM_OPUS)
+    return codecs
+
+
+def negotiate_codec(requested: str) -> str:
+    """Codec the server will decode: the requested one if supported, else raw PCM."""
+    requested = (requested or UPSTREAM_PCM16).lower()
+    if requested in ("ulaw", "g711", "pcmu"):
+        requested = UPSTREAM_MULAW
+    if requested in available_codecs():
+        return requested
+    logger.warning(f"Upstream codec '{requested}' not supported, falling back to {UPSTREAM_PCM16}")
+    return UPSTREAM_PCM16
+
+
+class UpstreamDecoder:
+    """
+    Turns one client audio message into the 16-bit PCM the transcriber expects,
+    counting bytes on the wire against decoded PCM bytes.
+    """
+
+    def __init__(self, codec: str = UPSTREAM_PCM16, sample_rate: int = 16000):
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.wire_bytes = 0
+        self.pcm_bytes = 0
+        self.errors = 0
+        self._wire_counter = UPSTREAM_WIRE_BYTES.labels(codec)
+        self._pcm_counter = UPSTREAM_PCM_BYTES.labels(codec)
+        self._opus = None
+        if codec == UPSTREAM_OPUS:
+            # Each WebSocket message carries exactly one Opus packet
+            self._opus = opuslib.Decoder(sample_rate, 1)
+            self._opus_frame_size = sample_rate * _OPUS_MAX_FRAME_MS // 1000
+
+    def decode(self, data: bytes) -> bytes:
+        self.wire_bytes += len(data)
+        self._wire_counter.inc(len(data))
+        if self.codec == UPSTREAM_MULAW:
+            pcm = mulaw_decode(data)
+        elif self.codec == UPSTREAM_OPUS:
+            try:
+                pcm = self._opus.decode(bytes(data), self._opus_frame_size)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Opus decode failed: {e}")
+                return b""
+        else:
+            pcm = data
+        self.pcm_bytes += len(pcm)
+        self._pcm_counter.inc(len(pcm))
+        return pcm
+
+    def get_stats(self) -> Dict[str, Any]:
+        seconds = self.pcm_bytes / 2 / self.sample_rate
+        return {
+            "codec": self.codec,
+            "wire_bytes": self.wire_bytes,
+            "pcm_bytes": self.pcm_bytes,
+            "compression_ratio": round(self.pcm_bytes / self.wire_bytes, 2) if self.wire_bytes else None,
+            "wire_kbps": round(self.wire_bytes * 8 / seconds / 1000, 1) if seconds else None,
+            "saved_bytes": self.pcm_bytes - self.wire_bytes,
+            "decode_errors": self.errors,
+        }
@@ -0,0 +1,53 @@
+# app/services/audio_frames.py
+"""
+Binary WebSocket framing for server -> client audio.
+
+Every audio frame is a fixed 12-byte big-endian header followed by raw codec bytes:
+
+    offset  size  field
+    0       1     version   (FRAME_VERSION)
+    1       1     codec     (CODEC_* below)
+    2       2     flags     (FLAG_* below; 0 = one complete clip)
+    4       4     turn_id   (increments per assistant turn within a session)
+    8       4     seq       (0-based position of the clip within the turn)
+
+With FLAG_STREAM a clip arrives as several frames sharing one seq, in order, as it downloads;
+an empty FLAG_CLIP_END frame closes the clip and an empty FLAG_TURN_END frame closes the turn.
+
+JSON text frames remain in use for control and text messages.
+"""
+import struct
+from typing import Tuple
+
+FRAME_VERSION = 1
+HEADER = struct.Struct(">BBHII")
+HEADER_SIZE = HEADER.size
+
+CODEC_MP3 = 1
+CODEC_WAV = 2
+CODEC_PCM16 = 3
+
+FLAG_STREAM = 0x01     # payload is one chunk of a progressively delivered clip
+FLAG_CLIP_END = 0x02   # no more chunks for this seq
+FLAG_TURN_END = 0x04   # no more clips for this turn
+
+CODECS = {
+    "mp3": CODEC_MP3,
+    "wav": CODEC_WAV,
+    "pcm": CODEC_PCM16,
+}
+
+
+def encode_audio_frame(payload: bytes, turn_id: int, seq: int, codec: int = CODEC_MP3, flags: int = 0) -> bytes:
+    """Prefix raw audio bytes with the frame header."""
+    return HEADER.pack(FRAME_VERSION, codec, flags, turn_id & 0xFFFFFFFF, seq & 0xFFFFFFFF) + payload
+
+
+def decode_audio_frame(frame: bytes) -> Tuple[int, int, int, int, memoryview]:
+    """Split a frame into (codec, flags, turn_id, seq, payload)."""
+    if len(frame) < HEADER_SIZE:
+        raise ValueError("Audio frame shorter than header")
+    version, codec, flags, turn_id, seq = HEADER.unpack_from(frame)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported audio frame version: {version}")
+    return codec, flags, turn_id, seq, memoryview(frame)[HEADER_SIZE:]
@@ -0,0 +1,89 @@
+# app/services/budget.py
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# End-to-end latency budget for one turn, measured from the final transcript
+TURN_BUDGET_SECONDS = float(os.getenv("TURN_BUDGET_SECONDS", "12"))
+
+# Upper bounds for individual stages; each stage also never gets more than what is left
+STAGE_CAPS = {
+    "context": 0.5,
+    "search": 3.0,
+    "llm": 10.0,
+    "tts": 8.0,
+}
+
+# Below these amounts of remaining time, stages degrade instead of running in full
+SEARCH_MIN_REMAINING = 6.0     # skip web search, keep the time for LLM + TTS
+RETRY_MIN_REMAINING = 3.0      # don't start another LLM attempt
+SHORT_REPLY_REMAINING = 7.0    # ask the LLM for a short answer
+
+# TTS still gets this much even once the budget is spent, so the user hears something
+TTS_MIN_TIMEOUT = 2.0
+
+SHORT_REPLY_INSTRUCTION = "\n\n(Answer in one or two short sentences.)"
+
+
+class TurnBudget:
+    """
+    Deadline for a single turn (STT final → search → LLM → TTS).
+    Stages ask it for timeouts, use it to decide whether to degrade, and record how long they took.
+    """
+
+    def __init__(self, total: float = TURN_BUDGET_SECONDS, started_at: Optional[float] = None):
+        self.total = total
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.deadline = self.started_at + total
+        self._stages: Dict[str, float] = {}
+        self.degraded: List[str] = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout_for(self, stage: str, floor: float = 0.0) -> float:
+        """Timeout a stage should use: the remaining budget, bounded by the stage cap and a floor."""
+        timeout = min(self.remaining(), STAGE_CAPS.get(stage, self.total))
+        return max(timeout, floor)
+
+    def can_afford(self, reserve: float) -> bool:
+        """True if at least `reserve` seconds remain."""
+        return self.remaining() >= reserve
+
+    def degrade(self, reason: str):
+        """Record that a stage was skipped or shortened to stay within budget."""
+        self.degraded.append(reason)
+        logger.info(f"Turn budget degraded: {reason} ({self.remaining():.2f}s left)")
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage; usable around awaits inside coroutines."""
+        start = time.monotonic()
+        try:
+            yield self
+        finally:
+            self._stages[name] = self._stages.get(name, 0.0) + (time.monotonic() - start)
+
+    def report(self) -> Dict[str, Any]:
+        """Per-stage budget usage for logging and metrics."""
+        return {
+            "budget": self.total,
+            "elapsed": round(self.elapsed(), 3),
+            "remaining": round(self.remaining(), 3),
+            "stages": {
+                name: {"seconds": round(seconds, 3), "share": round(seconds / self.total, 3)}
+                for name, seconds in self._stages.items()
+            },
+            "degraded": list(self.degraded),
+        }
@@ -0,0 +1,38 @@
+# app/services/client_identity.py
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Signs the client ids the server issues; set it so tokens (and the memories keyed on them) survive restarts
+CLIENT_TOKEN_SECRET = os.getenv("CLIENT_TOKEN_SECRET", "")
+
+if not CLIENT_TOKEN_SECRET:
+    logger.warning("CLIENT_TOKEN_SECRET not set; client tokens are only valid until the server restarts")
+_secret = CLIENT_TOKEN_SECRET.encode() if CLIENT_TOKEN_SECRET else secrets.token_bytes(32)
+
+
+def _sign(client_id: str) -> str:
+    digest = hmac.new(_secret, client_id.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def issue_client_token() -> Tuple[str, str]:
+    """(client id, token) for a new client: a random 128-bit id and its HMAC, which only this server can produce."""
+    client_id = secrets.token_hex(16)
+    return client_id, f"{client_id}.{_sign(client_id)}"
+
+
+def verify_client_token(token) -> Optional[str]:
+    """The client id a token was issued for, or None if it is malformed or was not signed by this server."""
+    if not isinstance(token, str) or token.count(".") != 1:
+        return None
+    client_id, signature = token.split(".")
+    if len(client_id) != 32 or not hmac.compare_digest(signature, _sign(client_id)):
+        return None
+    return client_id
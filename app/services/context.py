@@ -0,0 +1,282 @@
+# app/services/context.py
+import asyncio
+import logging
+import os
+import re
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+# Most recent turns (user message + reply) resent to the model verbatim
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "6"))
+# Prompt tokens per turn for summary + recent turns + recalled memories (not counting the new message)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Share of the budget the rolling summary may take
+CONTEXT_SUMMARY_SHARE = float(os.getenv("CONTEXT_SUMMARY_SHARE", "0.25"))
+# Memories recalled per turn, and the lowest similarity worth including
+CONTEXT_RECALL_LIMIT = int(os.getenv("CONTEXT_RECALL_LIMIT", "4"))
+CONTEXT_RECALL_MIN_SCORE = float(os.getenv("CONTEXT_RECALL_MIN_SCORE", "0.2"))
+# Folded turns kept as individual memories; older ones are merged into the rolling summary
+CONTEXT_MEMORY_KEEP = int(os.getenv("CONTEXT_MEMORY_KEEP", "24"))
+# Summarize once this many folded turns are past CONTEXT_MEMORY_KEEP
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "8"))
+
+_SENTENCE_END = re.compile(r"(?<=[.?!])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate: 1 token ≈ 4 characters (same rule llm.get_token_count falls back to)."""
+    return max(1, len(text) // 4)
+
+
+def _content_role(content) -> str:
+    return content.get("role", "") if isinstance(content, dict) else getattr(content, "role", "")
+
+
+def _content_text(content) -> str:
+    parts = content.get("parts", []) if isinstance(content, dict) else getattr(content, "parts", [])
+    texts = []
+    for part in parts:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict):
+            texts.append(part.get("text", ""))
+        else:
+            texts.append(getattr(part, "text", ""))
+    return "".join(texts)
+
+
+def split_turns(history: List[Any]) -> List[List[Any]]:
+    """Group chat history entries into turns, each starting at a user message."""
+    turns: List[List[Any]] = []
+    for content in history:
+        if _content_role(content) == "user" or not turns:
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+def _turn_text(turn: List[Any]) -> str:
+    lines = []
+    for content in turn:
+        speaker = "User" if _content_role(content) == "user" else "Assistant"
+        lines.append(f"{speaker}: {_content_text(content).strip()}")
+    return "\n".join(lines)
+
+
+def extractive_summary(texts: List[str], max_chars: int = 600) -> str:
+    """Offline fallback summarizer: the first sentence of each note, newest kept when over the limit."""
+    firsts = []
+    for text in texts:
+        text = " ".join(text.split())
+        firsts.append(_SENTENCE_END.split(text, 1)[0])
+    summary = " ".join(firsts)
+    return summary if len(summary) <= max_chars else "…" + summary[-max_chars:]
+
+
+class ConversationContext:
+    """
+    Bounded prompt context for one session.
+
+    The session keeps at most CONTEXT_RECENT_TURNS turns of chat history; older turns are folded into
+    MemoryManager as memories, and once enough of those pile up they are merged into a rolling summary
+    with summarize_old. Each turn's prompt carries the summary, the recent turns that fit the token budget
+    and the stored memories most relevant to the new message.
+    """
+
+    def __init__(self, memory_manager, user_id: str, summarizer: Optional[Callable[[List[str]], str]] = None,
+                 recent_turns: int = CONTEXT_RECENT_TURNS, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 ephemeral: bool = False):
+        self.memory = memory_manager
+        self.user_id = user_id
+        # Nothing can recall an ephemeral user's memories once the session ends, so discard() deletes them
+        self.ephemeral = ephemeral
+        self.summarizer = summarizer
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        # Writing folded turns (recall should see them) and merging old memories into the summary (slow, LLM)
+        self._folding: Optional[asyncio.Future] = None
+        self._summarizing: Optional[asyncio.Future] = None
+        self._stats = {
+            "turns_folded": 0, "summaries": 0, "memories_recalled": 0,
+            "history_turns_dropped": 0, "last_prompt_tokens": 0,
+        }
+
+    async def prepare(self, query: str, history: List[Any],
+                      recall_timeout: Optional[float] = None) -> Tuple[List[Any], str]:
+        """
+        Returns (history to send, context preamble to put before the user message).
+        The history is the newest suffix of `history` that fits the budget after the summary.
+        Turns folded last time are waited for within `recall_timeout`; a summary still being rebuilt is not,
+        the previous one is used meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if self._folding and not self._folding.done():
+            # Folding from the previous turn is still writing; recall should see it
+            await asyncio.wait([self._folding], timeout=recall_timeout)
+        if recall_timeout is not None:
+            recall_timeout = max(0.0, recall_timeout - (loop.time() - started))
+
+        summary, memories = await asyncio.wait_for(
+            asyncio.to_thread(self._recall, query), timeout=recall_timeout
+        )
+
+        remaining = self.token_budget
+        summary_block = ""
+        if summary:
+            limit = int(self.token_budget * CONTEXT_SUMMARY_SHARE) * 4
+            summary = summary if len(summary) <= limit else summary[:limit].rsplit(" ", 1)[0] + "…"
+            summary_block = f"[Earlier in this conversation]\n{summary}\n\n"
+            remaining -= estimate_tokens(summary_block)
+
+        turns = split_turns(history)
+        kept = 0
+        for turn in reversed(turns):
+            cost = estimate_tokens(_turn_text(turn))
+            if cost > remaining:
+                break
+            remaining -= cost
+            kept += 1
+        if kept < len(turns):
+            self._stats["history_turns_dropped"] += len(turns) - kept
+        sent = [content for turn in turns[len(turns) - kept:] for content in turn]
+
+        memory_lines = []
+        for item in memories:
+            line = f"- {item['text']}"
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            remaining -= cost
+            memory_lines.append(line)
+        self._stats["memories_recalled"] += len(memory_lines)
+
+        preamble = summary_block
+        if memory_lines:
+            preamble += "[Possibly relevant from earlier]\n" + "\n".join(memory_lines) + "\n\n"
+        if preamble:
+            preamble += "[Current message]\n"
+        self._stats["last_prompt_tokens"] = self.token_budget - remaining
+        return sent, preamble
+
+    def _recall(self, query: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        summary = self.memory.get_summary(self.user_id)
+        memories = self.memory.search_semantic(
+            self.user_id, query, CONTEXT_RECALL_LIMIT, min_score=CONTEXT_RECALL_MIN_SCORE
+        )
+        if not memories and self.memory.embedder is None:
+            memories = self.memory.search_simple(self.user_id, query, CONTEXT_RECALL_LIMIT)
+        return summary, [m for m in memories if not m["metadata"].get("auto_summary")]
+
+    def commit(self, query: str, history: List[Any], sent: List[Any], updated: List[Any]) -> List[Any]:
+        """
+        Merge the model's updated history back into the session history, restoring the plain user message
+        (the model saw it with the context preamble), and fold turns beyond the window in the background.
+        Returns the new session history.
+        """
+        new_entries = updated[len(sent):]
+        if new_entries and _content_role(new_entries[0]) == "user":
+            new_entries = [{"role": "user", "parts": [query]}] + list(new_entries[1:])
+        merged = list(history) + list(new_entries)
+
+        turns = split_turns(merged)
+        if len(turns) <= self.recent_turns:
+            return merged
+        folded, kept = turns[:-self.recent_turns], turns[-self.recent_turns:]
+        previous = self._folding
+        self._folding = asyncio.ensure_future(self._fold_after(previous, [_turn_text(t) for t in folded]))
+        self._folding.add_done_callback(self._folded)
+        return [content for turn in kept for content in turn]
+
+    async def _fold_after(self, previous: Optional[asyncio.Future], texts: List[str]) -> bool:
+        """Keep folds in order: a turn's memories are written after the previous turn's."""
+        if previous and not previous.done():
+            await asyncio.wait([previous])
+        return await asyncio.to_thread(self._fold, texts)
+
+    def _folded(self, task: asyncio.Future):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Folding conversation turns into memory failed: {task.exception()}")
+            return
+        # Summarizing calls the LLM, so it runs on its own and never holds up the next turn's recall
+        if task.result() and (self._summarizing is None or self._summarizing.done()):
+            self._summarizing = asyncio.ensure_future(asyncio.to_thread(self._summarize_old))
+            self._summarizing.add_done_callback(self._summarized)
+
+    @staticmethod
+    def _summarized(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Summarizing old conversation memories failed: {task.exception()}")
+
+    def _fold(self, texts: List[str]) -> bool:
+        """Store folded turns as memories; True once enough have piled up to be summarized."""
+        for text in texts:
+            self.memory.add_memory(self.user_id, text, {"kind": "turn"})
+        self.memory.flush()
+        self._stats["turns_folded"] += len(texts)
+        return self.memory.count_unsummarized(self.user_id) >= CONTEXT_MEMORY_KEEP + CONTEXT_SUMMARY_BATCH
+
+    def _summarize_old(self):
+        self.memory.summarize_old(self.user_id, self._summarize, older_than_days=0, keep_latest=CONTEXT_MEMORY_KEEP)
+        self._stats["summaries"] += 1
+
+    def _summarize(self, texts: List[str]) -> str:
+        texts = [t[len("SUMMARIZED: "):] if t.startswith("SUMMARIZED: ") else t for t in texts]
+        if self.summarizer:
+            try:
+                return self.summarizer(texts)
+            except Exception as e:
+                logger.warning(f"Summarizer failed, using extractive summary: {e}")
+        return extractive_summary(texts)
+
+    def set_user(self, user_id: str, timeout: float = 60.0):
+        """
+        Store and recall memories under a stable user id from now on, keeping them after the session.
+        Memories already folded or summarized under the ephemeral id are moved to it once pending folds and
+        summaries have finished; the next recall and fold wait for the move like they wait for a fold.
+        """
+        previous_id, was_ephemeral = self.user_id, self.ephemeral
+        self.user_id = user_id
+        self.ephemeral = False
+        if not was_ephemeral or previous_id == user_id:
+            return
+        pending = [task for task in (self._folding, self._summarizing) if task and not task.done()]
+        self._folding = asyncio.ensure_future(self._move_after(pending, previous_id, user_id, timeout))
+        self._folding.add_done_callback(self._moved)
+
+    async def _move_after(self, pending: List[asyncio.Future], old_user_id: str, new_user_id: str, timeout: float):
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        await asyncio.to_thread(self.memory.move_user, old_user_id, new_user_id)
+
+    @staticmethod
+    def _moved(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Moving session memories to the client id failed: {task.exception()}")
+
+    async def _wait_pending(self, timeout: float):
+        pending = [task for task in (self._folding, self._summarizing) if task and not task.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+
+    async def discard(self, timeout: float = 60.0):
+        """Delete the user's memories and vector files once pending folds and summaries have finished."""
+        await self._wait_pending(timeout)
+        await asyncio.to_thread(self.memory.clear_user, self.user_id)
+
+    async def close(self, history: List[Any], timeout: float = 60.0):
+        """
+        End the session: once pending folds and summaries have finished, fold the turns still held in
+        `history` too, so even a short session leaves something to recall next time.
+        """
+        await self._wait_pending(timeout)
+        texts = [_turn_text(turn) for turn in split_turns(history)]
+        if texts:
+            await asyncio.to_thread(self._fold, texts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._stats.copy()
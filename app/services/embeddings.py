@@ -0,0 +1,140 @@
+# app/services/embeddings.py
+import hashlib
+import logging
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "hashing" (local, deterministic, no network) or "gemini" (needs GEMINI_API_KEY)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "hashing")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "models/text-embedding-004")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Very frequent words carry little meaning but would dominate short sentences
+_STOPWORDS = frozenset(
+    "a an the i me my you your we our it its is are was were be been am do does did to of in on at "
+    "for and or with that this what".split()
+)
+
+
+class Embedder(ABC):
+    """
+    Interface for embedding providers: `embed` returns an (n, dim) float32 array of L2-normalized rows.
+    `name` identifies the vector space; vectors from embedders with different names are never compared.
+    """
+
+    name: str = "base"
+    dim: int = 0
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a batch of texts."""
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+@lru_cache(maxsize=65536)
+def _feature_slot(feature: str, dim: int):
+    # Stable across processes (unlike hash()), so stored vectors stay valid after a restart
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if h >> 63 else -1.0
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic feature-hashing embedder: words, word bigrams and character trigrams are hashed into
+    `dim` signed buckets with sublinear term weights. No model or network; similar wording gives similar
+    vectors, which is enough for offline recall and tests.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+
+    def _features(self, text: str):
+        words = [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+        counts = {}
+        for w in words:
+            counts["w:" + w] = counts.get("w:" + w, 0.0) + 1.0
+            padded = f"<{w}>"
+            for i in range(len(padded) - 2):
+                key = "c:" + padded[i:i + 3]
+                counts[key] = counts.get(key, 0.0) + 0.25
+        for a, b in zip(words, words[1:]):
+            key = f"b:{a} {b}"
+            counts[key] = counts.get(key, 0.0) + 0.5
+        return counts
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vec = out[row]
+            for feature, weight in self._features(text).items():
+                slot, sign = _feature_slot(feature, self.dim)
+                vec[slot] += sign * (1.0 + math.log(weight) if weight >= 1.0 else weight)
+            norm = float(np.linalg.norm(vec))
+            if norm:
+                vec /= norm
+        return out
+
+
+class GeminiEmbedder(Embedder):
+    """Gemini text embeddings (network call per batch); the API key comes from GEMINI_API_KEY."""
+
+    def __init__(self, api_key: str, model: str = GEMINI_EMBEDDING_MODEL, dim: int = 768):
+        self.api_key = api_key
+        self.model = model
+        self.dim = dim
+        self.name = f"gemini-{model.rsplit('/', 1)[-1]}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        from app.services import llm
+
+        vectors = np.asarray(llm.embed_texts(list(texts), self.api_key, self.model), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+_default_embedder: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    """Process-wide embedder chosen by EMBEDDING_PROVIDER."""
+    global _default_embedder
+    if _default_embedder is None:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if EMBEDDING_PROVIDER == "gemini" and api_key:
+            _default_embedder = GeminiEmbedder(api_key)
+        else:
+            if EMBEDDING_PROVIDER != "hashing":
+                logger.warning(f"Embedding provider '{EMBEDDING_PROVIDER}' unavailable, using local hashing embedder")
+            _default_embedder = HashingEmbedder()
+    return _default_embedder
+
+
+def set_embedder(embedder: Embedder):
+    """Swap the process-wide embedder (e.g. a custom provider)."""
+    global _default_embedder
+    _default_embedder = embedder
+
+
+def to_blob(vector: np.ndarray) -> bytes:
+    """Pack a vector as little-endian float32 for storage."""
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def from_blobs(blobs: List[bytes], dim: int) -> np.ndarray:
+    """Unpack stored float32 vectors into an (n, dim) array in one copy."""
+    if not blobs:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype="<f4").reshape(len(blobs), dim)
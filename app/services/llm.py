@@ -1,36 +1,88 @@
 # Fixed services/llm.py - Compatible with older Google Generative AI versions
 import google.generativeai as genai
-from typing import List, Dict, Any, Tuple, Optional
+from google.generativeai import client as genai_client
+from typing import List, Dict, Any, Tuple, Optional, Callable, Awaitable, AsyncIterator
 import logging
 import asyncio
 import time
 import os
+import threading
+import random
+from concurrent.futures import ThreadPoolExecutor
 
 # Import persona
 from app.persona import merged_persona
+from app.services.budget import TurnBudget, RETRY_MIN_REMAINING
+from app.services.metrics import observe_provider, record_provider_error, record_prompt_usage
 
 logger = logging.getLogger(__name__)
 
-# Cache for configured clients
-_client_cache = {}
+# Global limits for Gemini calls made from async code
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+# Dedicated executor so blocking SDK calls never compete with the default pool or the event loop
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+_STREAM_DONE = object()
+# How long an abandoned stream's worker gets to return after its HTTP response is closed
+LLM_ABORT_GRACE_SECONDS = float(os.getenv("LLM_ABORT_GRACE_SECONDS", "2"))
+
+# Point the SDK at an alternative endpoint (e.g. the local stand-ins in loadtest/) over REST
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# Cache for configured clients: api_key -> (model, created_at, system_instruction_supported)
+_client_cache: Dict[str, Tuple[Any, float, bool]] = {}
 _cache_timeout = 3600
 
+# Per-session chat objects: session_id -> (chat, api_key, last_used)
+_chat_sessions: Dict[str, Tuple[Any, str, float]] = {}
 
-def get_llm_response(user_query: str, history: List[Dict[str, Any]], api_key: str = None) -> Tuple[
-    str, List[Dict[str, Any]]]:
-    """
-    Enhanced LLM response with version compatibility for Google Generative AI.
-    """
-    # Use provided API key or fall back to environment
-    if not api_key:
-        api_key = os.getenv("GEMINI_API_KEY")
+# Prompt tokens reported by Gemini since the session's last take_prompt_usage()
+_prompt_usage: Dict[str, Dict[str, int]] = {}
 
-    if not api_key:
-        return "Please configure your Gemini API key in the settings.", history
+# genai.configure() mutates process-wide state, so model construction is serialized
+_configure_lock = threading.Lock()
+
+_LEGACY_PERSONA_PREFIX = """You are TechTutor Buddy, my personal AI assistant who combines:
+- the friendliness of a personal assistant,
+- the clarity of a patient tutor, 
+- and the enthusiasm of a tech geek.
+
+Keep replies brief, clear, and natural to speak. Always stay under 1500 characters.
+Answer directly — avoid filler or repetition. Stay in role as TechTutor Buddy.
+
+User question: """
 
-    try:
-        # Configure the API key
-        genai.configure(api_key=api_key)
+
+def _evict_expired(now: float):
+    """Drop cached models and idle chat sessions older than the cache timeout (lock held)."""
+    for key, (_, created_at, _) in list(_client_cache.items()):
+        if now - created_at > _cache_timeout:
+            del _client_cache[key]
+    for session_id, (_, _, last_used) in list(_chat_sessions.items()):
+        if now - last_used > _cache_timeout:
+            del _chat_sessions[session_id]
+
+
+def get_cached_model(api_key: str) -> Tuple[Any, bool]:
+    """
+    Return (model, system_instruction_supported) for an API key, building it at most once per TTL.
+    The model is pinned to a client created for its own key so other sessions' keys never leak into it.
+    """
+    now = time.time()
+    with _configure_lock:
+        _evict_expired(now)
+        cached = _client_cache.get(api_key)
+        if cached:
+            return cached[0], cached[2]
+
+        if GEMINI_API_ENDPOINT:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=api_key)
 
         # Create model with version compatibility check
         try:
@@ -39,70 +91,353 @@ def get_llm_response(user_query: str, history: List[Dict[str, Any]], api_key: st
                 'gemini-1.5-flash',
                 system_instruction=merged_persona
             )
+            system_instruction_supported = True
             logger.debug("Using GenerativeModel with system_instruction parameter")
         except TypeError as e:
             if "system_instruction" in str(e):
                 # Fallback for older versions (v0.3.x)
                 model = genai.GenerativeModel('gemini-1.5-flash')
+                system_instruction_supported = False
                 logger.info("Using GenerativeModel without system_instruction (older version)")
+            else:
+                raise e
 
-                # Prepend system instruction to the user query as a workaround
-                enhanced_query = f"""You are TechTutor Buddy, my personal AI assistant who combines:
-- the friendliness of a personal assistant,
-- the clarity of a patient tutor, 
-- and the enthusiasm of a tech geek.
+        if hasattr(model, "_client"):
+            model._client = genai_client.get_default_generative_client()
+
+        _client_cache[api_key] = (model, now, system_instruction_supported)
+        return model, system_instruction_supported
+
+
+def _content_key(content) -> Tuple[str, str]:
+    """(role, text) of a history entry, whether a plain dict or an SDK Content."""
+    if isinstance(content, dict):
+        role, parts = content.get("role", ""), content.get("parts", [])
+    else:
+        role, parts = getattr(content, "role", ""), getattr(content, "parts", [])
+    texts = []
+    for part in parts:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict):
+            texts.append(part.get("text", ""))
+        else:
+            texts.append(getattr(part, "text", ""))
+    return role, "".join(texts)
 
-Keep replies brief, clear, and natural to speak. Always stay under 1500 characters.
-Answer directly — avoid filler or repetition. Stay in role as TechTutor Buddy.
 
-User question: {user_query}"""
-                user_query = enhanced_query
-            else:
-                raise e
+def _same_history(chat_history: List[Any], history: List[Any]) -> bool:
+    if chat_history is history:
+        return True
+    return len(chat_history) == len(history) and all(
+        _content_key(a) == _content_key(b) for a, b in zip(chat_history, history)
+    )
 
-        # Generate response with retry logic
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                chat = model.start_chat(history=history)
-                response = chat.send_message(user_query)
 
-                if response.text and response.text.strip():
-                    logger.info(f"LLM response generated successfully (attempt {attempt + 1})")
-                    return response.text.strip(), chat.history
-                else:
-                    raise ValueError("Empty response from model")
+def get_chat_session(model, api_key: str, history: List[Dict[str, Any]], session_id: Optional[str] = None):
+    """
+    Return a chat object for the session. The cached chat is reused while the history sent matches what
+    it already holds, so only the new turn is appended. When ConversationContext rewrote the history
+    (turns folded or dropped, a preamble stripped from the user message) it no longer matches and the chat
+    is rebuilt on the new history.
+    """
+    now = time.time()
+    if session_id:
+        with _configure_lock:
+            cached = _chat_sessions.get(session_id)
+        if cached and cached[1] == api_key and _same_history(cached[0].history, history):
+            with _configure_lock:
+                _chat_sessions[session_id] = (cached[0], api_key, now)
+            return cached[0]
+
+    chat = model.start_chat(history=history)
+    if session_id:
+        with _configure_lock:
+            _chat_sessions[session_id] = (chat, api_key, now)
+    return chat
+
+
+def reset_chat_session(session_id: str):
+    """Forget the cached chat object for a session (call on disconnect)."""
+    with _configure_lock:
+        _chat_sessions.pop(session_id, None)
+
+
+def _record_usage(response, session_id: Optional[str]):
+    """Feed a response's prompt token count into metrics and the session's tally."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    record_prompt_usage(prompt_tokens)
+    if session_id:
+        with _configure_lock:
+            tally = _prompt_usage.setdefault(session_id, {"calls": 0, "prompt_tokens": 0})
+            tally["calls"] += 1
+            tally["prompt_tokens"] += prompt_tokens
+
+
+def take_prompt_usage(session_id: str) -> Optional[Dict[str, int]]:
+    """Prompt tokens billed for the session since the last call."""
+    with _configure_lock:
+        return _prompt_usage.pop(session_id, None)
+
+
+def _prepare_chat(user_query: str, history: List[Dict[str, Any]], api_key: str, session_id: Optional[str]):
+    """Resolve the cached model and session chat, applying the legacy persona workaround if needed."""
+    model, system_instruction_supported = get_cached_model(api_key)
+    if not system_instruction_supported:
+        # Prepend system instruction to the user query as a workaround
+        user_query = _LEGACY_PERSONA_PREFIX + user_query
+    return get_chat_session(model, api_key, history, session_id), user_query
+
+
+def _generate_once(user_query: str, history: List[Dict[str, Any]], api_key: str,
+                   session_id: Optional[str]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Single blocking Gemini call; raises on failure or an empty reply."""
+    chat, user_query = _prepare_chat(user_query, history, api_key, session_id)
+    response = chat.send_message(user_query)
+    _record_usage(response, session_id)
+
+    if response.text and response.text.strip():
+        return response.text.strip(), chat.history
+    raise ValueError("Empty response from model")
+
+
+def _friendly_error_message(e: Exception) -> str:
+    """Provide contextual error messages."""
+    error_str = str(e).upper()
+    if "API_KEY" in error_str or "INVALID" in error_str:
+        return "Invalid Gemini API key. Please check your configuration."
+    elif "QUOTA" in error_str or "LIMIT" in error_str:
+        return "API quota exceeded. Please check your Gemini API usage limits."
+    elif "NETWORK" in error_str or "CONNECTION" in error_str:
+        return "Network connectivity issue. Please check your internet connection."
+    elif "SYSTEM_INSTRUCTION" in error_str:
+        return "Using older Gemini API version. System instructions will be included in messages."
+    else:
+        return "I'm experiencing technical difficulties. Please try again in a moment."
+
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given 0-based attempt."""
+    return LLM_RETRY_BACKOFF * (2 ** attempt) * (1 + random.random() * 0.25)
+
+
+def get_llm_response(user_query: str, history: List[Dict[str, Any]], api_key: str = None,
+                     session_id: str = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Enhanced LLM response with version compatibility for Google Generative AI.
+    Blocking; async callers should use get_llm_response_async.
+    """
+    # Use provided API key or fall back to environment
+    if not api_key:
+        api_key = os.getenv("GEMINI_API_KEY")
 
-            except Exception as e:
-                logger.warning(f"LLM attempt {attempt + 1} failed: {e}")
-                if attempt == max_retries - 1:
-                    raise
-                time.sleep(1)  # Brief delay before retry
+    if not api_key:
+        return "Please configure your Gemini API key in the settings.", history
 
-    except Exception as e:
-        logger.error(f"Error getting LLM response: {e}")
-
-        # Provide contextual error messages
-        error_str = str(e).upper()
-        if "API_KEY" in error_str or "INVALID" in error_str:
-            error_msg = "Invalid Gemini API key. Please check your configuration."
-        elif "QUOTA" in error_str or "LIMIT" in error_str:
-            error_msg = "API quota exceeded. Please check your Gemini API usage limits."
-        elif "NETWORK" in error_str or "CONNECTION" in error_str:
-            error_msg = "Network connectivity issue. Please check your internet connection."
-        elif "SYSTEM_INSTRUCTION" in error_str:
-            error_msg = "Using older Gemini API version. System instructions will be included in messages."
-        else:
-            error_msg = "I'm experiencing technical difficulties. Please try again in a moment."
+    # Generate response with retry logic
+    for attempt in range(LLM_MAX_RETRIES):
+        try:
+            response_text, updated_history = _generate_once(user_query, history, api_key, session_id)
+            logger.info(f"LLM response generated successfully (attempt {attempt + 1})")
+            return response_text, updated_history
 
-        return error_msg, history
+        except Exception as e:
+            logger.warning(f"LLM attempt {attempt + 1} failed: {e}")
+            if session_id:
+                reset_chat_session(session_id)
+            if attempt == LLM_MAX_RETRIES - 1:
+                logger.error(f"Error getting LLM response: {e}")
+                return _friendly_error_message(e), history
+            time.sleep(_retry_delay(attempt))  # Brief delay before retry
 
 
-async def get_llm_response_async(user_query: str, history: List[Dict[str, Any]], api_key: str = None) -> Tuple[
+async def get_llm_response_async(user_query: str, history: List[Dict[str, Any]], api_key: str = None,
+                                 session_id: str = None, budget: Optional[TurnBudget] = None) -> Tuple[
     str, List[Dict[str, Any]]]:
-    """Async wrapper for LLM response."""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, get_llm_response, user_query, history, api_key)
+    """
+    Non-blocking LLM response. Each attempt runs on the dedicated LLM executor under the
+    global concurrency limiter; backoff between retries is awaited, never slept.
+    With a turn budget, each attempt is bounded by the remaining time and retries stop when it runs low.
+    """
+    if not api_key:
+        api_key = os.getenv("GEMINI_API_KEY")
+
+    if not api_key:
+        return "Please configure your Gemini API key in the settings.", history
+
+    loop = asyncio.get_running_loop()
+    for attempt in range(LLM_MAX_RETRIES):
+        try:
+            async with _llm_slots:
+                started = time.perf_counter()
+                response_text, updated_history = await asyncio.wait_for(
+                    loop.run_in_executor(_llm_executor, _generate_once, user_query, history, api_key, session_id),
+                    timeout=budget.timeout_for("llm") if budget else None
+                )
+                observe_provider("gemini", time.perf_counter() - started)
+            logger.info(f"LLM response generated successfully (attempt {attempt + 1})")
+            return response_text, updated_history
+
+        except Exception as e:
+            record_provider_error("gemini", e)
+            logger.warning(f"LLM attempt {attempt + 1} failed: {e!r}")
+            if session_id:
+                # A timed-out attempt may still be appending to the chat on its worker thread
+                reset_chat_session(session_id)
+            delay = _retry_delay(attempt)
+            out_of_budget = budget is not None and not budget.can_afford(RETRY_MIN_REMAINING + delay)
+            if attempt == LLM_MAX_RETRIES - 1 or out_of_budget:
+                if out_of_budget:
+                    budget.degrade("llm retries cut")
+                logger.error(f"Error getting LLM response: {e!r}")
+                return _friendly_error_message(e), history
+            await asyncio.sleep(delay)
+
+
+class _StreamHandle:
+    """Lets the event loop abort a stream whose worker thread may be blocked waiting for the next chunk."""
+
+    def __init__(self):
+        self.response = None
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+        # The SDK response wraps the transport stream (a grpc call or a REST response iterator); both cancel()
+        cancel = getattr(getattr(self.response, "_iterator", None), "cancel", None)
+        if cancel:
+            try:
+                cancel()
+            except Exception as e:
+                logger.debug(f"Closing LLM stream failed: {e!r}")
+
+
+async def _abort_stream(stream, handle: _StreamHandle, pulling):
+    """Close a stream the turn no longer reads, waiting (bounded) for a worker blocked on it to return."""
+    handle.abort()
+    if pulling is not None and not pulling.done():
+        waiter = asyncio.wrap_future(pulling)
+        await asyncio.wait([waiter], timeout=LLM_ABORT_GRACE_SECONDS)
+        if waiter.done() and not waiter.cancelled():
+            waiter.exception()  # The stream failing once closed is expected
+    if pulling is None or pulling.done():
+        stream.close()
+    else:
+        logger.warning("LLM worker still blocked after closing its stream; releasing the slot anyway")
+
+
+async def generate_streaming_response_async(user_query: str, history: List[Dict[str, Any]], api_key: str = None,
+                                            on_complete: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                                            session_id: str = None,
+                                            budget: Optional[TurnBudget] = None,
+                                            on_error: Optional[Callable[[str], Awaitable[None]]] = None
+                                            ) -> AsyncIterator[str]:
+    """
+    Non-blocking streaming response. The stream is pulled through the dedicated LLM executor while
+    holding a global concurrency slot. Failures before the first chunk are retried with backoff;
+    after that the reply just ends and the error goes to on_error, since partial text has already been delivered.
+    With a turn budget, waiting for each chunk is bounded by the remaining time and retries stop when it runs low.
+    A stream that times out or whose consumer goes away is closed before the slot is released.
+    """
+    if not api_key:
+        api_key = os.getenv("GEMINI_API_KEY")
+
+    if not api_key:
+        yield "Please configure your Gemini API key in the settings."
+        return
+
+    async with _llm_slots:
+        for attempt in range(LLM_MAX_RETRIES):
+            handle = _StreamHandle()
+            stream = EnhancedLLMService.generate_streaming_response(
+                user_query, history, api_key, on_complete, session_id, raise_errors=True,
+                handle=handle, request_timeout=budget.timeout_for("llm") if budget else None
+            )
+            started = False
+            finished = False
+            pulling = None
+            request_started = time.perf_counter()
+            try:
+                while True:
+                    pulling = _llm_executor.submit(next, stream, _STREAM_DONE)
+                    chunk = await asyncio.wait_for(
+                        asyncio.wrap_future(pulling), timeout=budget.timeout_for("llm") if budget else None
+                    )
+                    pulling = None
+                    if chunk is _STREAM_DONE:
+                        finished = True
+                        observe_provider("gemini", time.perf_counter() - request_started)
+                        return
+                    started = True
+                    yield chunk
+
+            except Exception as e:
+                await _abort_stream(stream, handle, pulling)
+                finished = True
+                record_provider_error("gemini", e)
+                logger.warning(f"Streaming LLM attempt {attempt + 1} failed: {e!r}")
+                if session_id:
+                    reset_chat_session(session_id)
+                delay = _retry_delay(attempt)
+                out_of_budget = budget is not None and not budget.can_afford(RETRY_MIN_REMAINING + delay)
+                if started or attempt == LLM_MAX_RETRIES - 1 or out_of_budget:
+                    if out_of_budget:
+                        budget.degrade("llm retries cut")
+                    logger.error(f"Streaming response error: {e!r}")
+                    if not started:
+                        yield _friendly_error_message(e)
+                    elif on_error:
+                        await on_error(_friendly_error_message(e))
+                    return
+                await asyncio.sleep(delay)
+            finally:
+                # Cancelled (barge-in) or closed by the consumer mid-stream
+                if not finished:
+                    await _abort_stream(stream, handle, pulling)
+                    # The half-read stream leaves the chat mid-turn; rebuild it from history next time
+                    if session_id:
+                        reset_chat_session(session_id)
+
+
+def embed_texts(texts: List[str], api_key: str, model: str = "models/text-embedding-004") -> List[List[float]]:
+    """Embed a batch of texts with Gemini (blocking; call from a worker thread)."""
+    started = time.perf_counter()
+    try:
+        with _configure_lock:
+            if GEMINI_API_ENDPOINT:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+            else:
+                genai.configure(api_key=api_key)
+            result = genai.embed_content(model=model, content=texts, task_type="retrieval_document")
+    except Exception as e:
+        record_provider_error("gemini_embed", e)
+        raise
+    observe_provider("gemini_embed", time.perf_counter() - started)
+    return result["embedding"]
+
+
+def summarize_texts(texts: List[str], api_key: str, max_words: int = 120) -> str:
+    """Condense conversation notes into one short factual summary (blocking; call from a worker thread)."""
+    model, _ = get_cached_model(api_key)
+    prompt = (
+        f"Summarize these conversation notes in at most {max_words} words. Keep names, preferences, "
+        "facts and open questions; write plain third-person sentences, no preamble.\n\n"
+        + "\n".join(f"- {text}" for text in texts)
+    )
+    started = time.perf_counter()
+    try:
+        response = model.generate_content(prompt)
+    except Exception as e:
+        record_provider_error("gemini", e)
+        raise
+    observe_provider("gemini", time.perf_counter() - started)
+    _record_usage(response, None)
+    if not response.text or not response.text.strip():
+        raise ValueError("Empty summary from model")
+    return response.text.strip()
 
 
 def validate_gemini_api_key(api_key: str) -> Tuple[bool, str]:
@@ -229,31 +564,43 @@ class EnhancedLLMService:
             return False
 
     @staticmethod
-    def generate_streaming_response(user_query: str, history: List[Dict[str, Any]], api_key: str):
-        """Generate streaming response with version compatibility."""
-        try:
-            genai.configure(api_key=api_key)
-
-            # Try with system instruction first
-            try:
-                model = genai.GenerativeModel('gemini-1.5-flash', system_instruction=merged_persona)
-            except TypeError as e:
-                if "system_instruction" in str(e):
-                    # Fallback for older versions
-                    model = genai.GenerativeModel('gemini-1.5-flash')
-                    # Prepend system instruction to query
-                    user_query = f"System: {merged_persona}\n\nUser: {user_query}"
-                else:
-                    raise e
-
-            chat = model.start_chat(history=history)
-            response = chat.send_message(user_query, stream=True)
+    def generate_streaming_response(user_query: str, history: List[Dict[str, Any]], api_key: str = None,
+                                    on_complete: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                                    session_id: str = None, raise_errors: bool = False,
+                                    handle: Optional[_StreamHandle] = None, request_timeout: Optional[float] = None):
+        """
+        Generate streaming response with version compatibility.
+        If given, on_complete receives the updated chat history once the stream is exhausted.
+        With raise_errors, failures propagate instead of being yielded as text.
+        A handle receives the SDK response so the stream can be aborted from another thread.
+        """
+        if not api_key:
+            api_key = os.getenv("GEMINI_API_KEY")
 
+        try:
+            chat, user_query = _prepare_chat(user_query, history, api_key, session_id)
+            request_options = {"timeout": request_timeout} if request_timeout else None
+            response = chat.send_message(user_query, stream=True, request_options=request_options)
+            if handle is not None:
+                handle.response = response
+                if handle.aborted:
+                    return
+
+            last_chunk = None
             for chunk in response:
+                last_chunk = chunk
                 if chunk.text:
                     yield chunk.text
+            # Usage arrives with the final chunk
+            if last_chunk is not None:
+                _record_usage(last_chunk, session_id)
+
+            if on_complete:
+                on_complete(chat.history)
 
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Streaming response error: {e}")
             yield f"Error: {str(e)}"
 
@@ -1,111 +1,649 @@
 # app/services/memory.py
 import sqlite3
+import hashlib
 import json
+import logging
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from app.services.embeddings import Embedder, get_embedder, to_blob, from_blobs
+    from app.services.vector_index import VectorIndex
+
+    VECTOR_SEARCH_AVAILABLE = True
+except ImportError:
+    logger.warning("Vector memory search not available (numpy missing)")
+    VECTOR_SEARCH_AVAILABLE = False
+
+# Page cache per connection (MB) and memory-mapped I/O window
+MEMORY_CACHE_MB = int(os.getenv("MEMORY_CACHE_MB", "16"))
+MEMORY_MMAP_MB = int(os.getenv("MEMORY_MMAP_MB", "64"))
+# Most queued writes committed in one transaction
+MEMORY_WRITE_BATCH = int(os.getenv("MEMORY_WRITE_BATCH", "256"))
+# Per-user embedding matrices; defaults to "<db name>.vectors" next to the database
+MEMORY_VECTOR_DIR = os.getenv("MEMORY_VECTOR_DIR")
+# Users whose matrices stay mapped in this process
+MEMORY_VECTOR_CACHE_USERS = int(os.getenv("MEMORY_VECTOR_CACHE_USERS", "128"))
+# Texts per embedder call when backfilling
+_EMBED_BATCH = 128
+
+_STOP = object()
+
+# Schema version kept in PRAGMA user_version; bumped when a migration is added
+_SCHEMA_VERSION = 2
+_FTS_TERM = re.compile(r"\w+", re.UNICODE)
+# Left out of full-text queries: they match most rows, add nothing to BM25 and make ranking scan every match
+_FTS_STOPWORDS = frozenset("""
+a an and are as at be but by did do does for from had has have he her his how i if in is it its me my
+no not of on or our she so than that the their them then there they this to was we were what when
+where which who why will with you your
+""".split())
+
+
+class _Insert:
+    """
+    A queued add_memory write. Its embedding is filled in on the writer thread just before the batch's
+    transaction opens, so callers never wait on the embedder and a batch's texts are embedded in one call.
+    """
+    __slots__ = ("user_id", "text", "metadata_json", "created_at", "vector", "model")
+
+    def __init__(self, user_id: str, text: str, metadata_json: str, created_at: str):
+        self.user_id = user_id
+        self.text = text
+        self.metadata_json = metadata_json
+        self.created_at = created_at
+        self.vector = None
+        self.model = None
+
+    def __call__(self, conn: sqlite3.Connection) -> int:
+        blob = to_blob(self.vector) if self.vector is not None else None
+        return conn.execute(
+            "INSERT INTO memory (user_id, text, metadata, created_at, embedding, embedding_model) VALUES (?,?,?,?,?,?)",
+            (self.user_id, self.text, self.metadata_json, self.created_at, blob, self.model)
+        ).lastrowid
 
-# Optional: If you have an embedding function in your llm service, import it.
-# from app.services import llm
 
 class MemoryManager:
-    def __init__(self, db_path: str = "memories.db"):
+    """
+    SQLite-backed memory store.
+    Reads use a long-lived connection per thread; every write goes through one background writer thread
+    that drains whatever has queued up and commits it as a single transaction (group commit).
+    The database runs in WAL mode, so readers never block on the writer.
+    Each memory also stores its embedding (packed float32); semantic search runs over a per-user
+    memory-mapped matrix that is built from those blobs once and then appended to on insert.
+    Construction touches no files: open() creates or migrates the database and starts the writer, and the
+    first read or write calls it if the owner has not.
+    """
+
+    def __init__(self, db_path: str = "memories.db", embedder: Optional["Embedder"] = None):
         self.db_path = db_path
-        self._init_db()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._writes: "queue.Queue" = queue.Queue()
+        self._stats = {
+            "writes": 0, "batches": 0, "largest_batch": 0, "failed_writes": 0,
+            "embed_errors": 0, "index_rebuilds": 0, "index_appends": 0,
+        }
+        self._closed = False
+
+        self.embedder = (embedder or get_embedder()) if VECTOR_SEARCH_AVAILABLE else None
+        self.vector_dir = MEMORY_VECTOR_DIR or os.path.splitext(db_path)[0] + ".vectors"
+        self._indexes: "OrderedDict[str, VectorIndex]" = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        # user_id -> [lock held while that user's matrix is built or dropped, threads using it]
+        self._index_builds: Dict[str, list] = {}
+        self.fts_enabled = False
+        self._writer: Optional[threading.Thread] = None
+        self._open_lock = threading.Lock()
+
+    def open(self) -> "MemoryManager":
+        """Create or migrate the database and start the writer thread (idempotent)."""
+        with self._open_lock:
+            if self._closed:
+                raise RuntimeError("MemoryManager is closed")
+            if self._writer is None:
+                self._init_db()
+                writer = threading.Thread(target=self._writer_loop, name="memory-writer", daemon=True)
+                writer.start()
+                self._writer = writer
+        return self
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly by the writer
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe with WAL
+        conn.execute(f"PRAGMA cache_size=-{MEMORY_CACHE_MB * 1024}")
+        conn.execute(f"PRAGMA mmap_size={MEMORY_MMAP_MB * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """This thread's read connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._writer is None:
+                self.open()
+            conn = self._local.conn = self._connect()
+        return conn
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS memory (
-                id INTEGER PRIMARY KEY,
-                user_id TEXT,
-                text TEXT,
-                metadata TEXT,
-                created_at TEXT,
-                summarized INTEGER DEFAULT 0
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT,
+            text TEXT,
+            metadata TEXT,
+            created_at TEXT,
+            summarized INTEGER DEFAULT 0
+        )
+        """)
+        # Serves every per-user query: WHERE user_id = ? ORDER BY created_at
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_user_created ON memory (user_id, created_at)")
+        self.fts_enabled = self._migrate(conn)
+        self._local.conn = conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> bool:
+        """
+        Bring the schema up to date (tracked in PRAGMA user_version):
+          1. memory_fts full-text index, kept in sync by triggers and backfilled from existing rows
+          2. embedding (packed float32) and embedding_model columns
+        Returns whether FTS5 search is available.
+        """
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= _SCHEMA_VERSION:
+            return True
+
+        fts_enabled = version >= 1 or self._create_fts_index(conn)
+        if version < 2:
+            self._add_embedding_columns(conn)
+        # Without FTS5 the version stays put, so the index is built if a later SQLite supports it
+        if fts_enabled:
+            conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+            logger.info(f"Memory schema migrated to version {_SCHEMA_VERSION}")
+        return fts_enabled
+
+    def _create_fts_index(self, conn: sqlite3.Connection) -> bool:
+        """Migration 1; returns False when SQLite was built without FTS5."""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # External-content table: the text lives only in `memory`, the index stores tokens.
+            # user_id is indexed too, so MATCH can scope to one user before ranking.
+            conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5(
+                user_id, text, content='memory', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
             )
             """)
-            conn.commit()
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_fts_insert AFTER INSERT ON memory BEGIN
+                INSERT INTO memory_fts (rowid, user_id, text) VALUES (new.id, new.user_id, new.text);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_fts_delete AFTER DELETE ON memory BEGIN
+                INSERT INTO memory_fts (memory_fts, rowid, user_id, text) VALUES ('delete', old.id, old.user_id, old.text);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_fts_update AFTER UPDATE OF user_id, text ON memory BEGIN
+                INSERT INTO memory_fts (memory_fts, rowid, user_id, text) VALUES ('delete', old.id, old.user_id, old.text);
+                INSERT INTO memory_fts (rowid, user_id, text) VALUES (new.id, new.user_id, new.text);
+            END
+            """)
+            # Backfill rows written before the index existed
+            conn.execute("INSERT INTO memory_fts (memory_fts) VALUES ('rebuild')")
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if "fts5" not in str(e):
+                raise
+            # SQLite built without FTS5: keep working with LIKE search
+            logger.warning(f"FTS5 unavailable, memory search falls back to LIKE: {e}")
+            return False
+
+        return True
+
+    def _add_embedding_columns(self, conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(memory)")}
+        if "embedding" not in columns:
+            conn.execute("ALTER TABLE memory ADD COLUMN embedding BLOB")
+        if "embedding_model" not in columns:
+            conn.execute("ALTER TABLE memory ADD COLUMN embedding_model TEXT")
+        conn.execute("COMMIT")
+
+    # ---- background writer ----
+
+    def _submit(self, op: Callable[[sqlite3.Connection], Any]) -> Future:
+        if self._closed:
+            raise RuntimeError("MemoryManager is closed")
+        if self._writer is None:
+            self.open()
+        future: Future = Future()
+        self._writes.put((op, future))
+        return future
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._writes.get()
+            if item is _STOP:
+                break
+
+            # Whatever queued up while the previous commit was running goes into this one
+            batch = [item]
+            stop = False
+            while len(batch) < MEMORY_WRITE_BATCH:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._embed_inserts(batch)
+            self._commit_batch(conn, batch)
+            if stop:
+                break
+
+    def _embed_inserts(self, batch):
+        """Embed the batch's new memories in one call, outside the write transaction."""
+        inserts = [op for op, _ in batch if isinstance(op, _Insert)]
+        vectors = self._embed([op.text for op in inserts]) if inserts else None
+        if vectors is not None:
+            for op, vector in zip(inserts, vectors):
+                op.vector, op.model = vector, self.embedder.name
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                # A savepoint per write, so one bad write doesn't roll back the rest of the batch
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    results.append((future, op(conn), None))
+                    conn.execute("RELEASE write_op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Memory write batch failed: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._stats["failed_writes"] += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self._stats["writes"] += len(batch)
+        self._stats["batches"] += 1
+        self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+        for future, result, error in results:
+            if error is not None:
+                self._stats["failed_writes"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every write queued so far has been committed."""
+        self._submit(lambda conn: None).result(timeout)
+
+    def close(self):
+        """Commit pending writes, stop the writer and close all connections."""
+        with self._open_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._writer is not None:
+            self._writes.put(_STOP)
+            self._writer.join(timeout=10)
+        with self._indexes_lock:
+            for index in self._indexes.values():
+                index.flush()
+            self._indexes.clear()
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._stats.copy()
+        stats["queued_writes"] = self._writes.qsize()
+        stats["avg_batch"] = round(stats["writes"] / stats["batches"], 1) if stats["batches"] else 0.0
+        stats["embedder"] = self.embedder.name if self.embedder else None
+        stats["vector_indexes"] = len(self._indexes)
+        return stats
+
+    # ---- embeddings ----
+
+    def _embed(self, texts: List[str]) -> Optional["np.ndarray"]:
+        """Embed in batches; None (and logged) if vector search is off or the provider fails."""
+        if self.embedder is None:
+            return None
+        try:
+            return np.concatenate([
+                self.embedder.embed(texts[i:i + _EMBED_BATCH]) for i in range(0, len(texts), _EMBED_BATCH)
+            ]) if texts else np.zeros((0, self.embedder.dim), dtype=np.float32)
+        except Exception as e:
+            self._stats["embed_errors"] += 1
+            logger.warning(f"Embedding failed, memories stay unindexed until the next rebuild: {e}")
+            return None
+
+    def _index_prefix(self, user_id: str) -> str:
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.vector_dir, self.embedder.name, digest)
+
+    def _build_index(self, user_id: str) -> "VectorIndex":
+        """
+        Map the user's matrix from disk if it still matches the database, otherwise rebuild it from the
+        stored blobs, embedding (and writing back) any rows that have no vector for this embedder yet.
+        """
+        conn = self._reader()
+        model = self.embedder.name
+        index = VectorIndex(self._index_prefix(user_id), self.embedder.dim)
+        count, max_id, missing = conn.execute(
+            "SELECT SUM(embedding_model IS ?), MAX(CASE WHEN embedding_model IS ? THEN id END), "
+            "SUM(embedding_model IS NOT ?) FROM memory WHERE user_id = ?",
+            (model, model, model, user_id)
+        ).fetchone()
+        if not count and not missing:
+            return index  # Nothing to search yet; not written to disk or kept mapped
+        if not missing and index.load() and len(index) == count and index.max_id == max_id:
+            return index
+
+        rows = conn.execute(
+            "SELECT id, embedding FROM memory WHERE user_id = ? AND embedding_model IS ? ORDER BY id",
+            (user_id, model)
+        ).fetchall()
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        vectors = from_blobs([r[1] for r in rows], self.embedder.dim)
+
+        if missing:
+            pending = conn.execute(
+                "SELECT id, text FROM memory WHERE user_id = ? AND embedding_model IS NOT ? ORDER BY id",
+                (user_id, model)
+            ).fetchall()
+            new_vectors = self._embed([r[1] or "" for r in pending])
+            if new_vectors is not None:
+                updates = [(to_blob(v), model, r[0]) for r, v in zip(pending, new_vectors)]
+                self._submit(lambda c: c.executemany(
+                    "UPDATE memory SET embedding = ?, embedding_model = ? WHERE id = ?", updates
+                ))
+                ids = np.concatenate([ids, np.fromiter((r[0] for r in pending), dtype=np.int64, count=len(pending))])
+                vectors = np.concatenate([vectors, new_vectors])
+                order = np.argsort(ids, kind="stable")
+                ids, vectors = ids[order], vectors[order]
+
+        index.rebuild(ids, vectors)
+        self._stats["index_rebuilds"] += 1
+        return index
+
+    def _user_index(self, user_id: str) -> "VectorIndex":
+        with self._indexes_lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+
+        # Built outside the shared lock so the writer's appends for other users don't wait on it, but one
+        # build per user at a time: a second rebuild would unlink the files of the index the first one mapped
+        with self._index_build(user_id):
+            with self._indexes_lock:
+                existing = self._indexes.get(user_id)
+                if existing is not None:
+                    return existing
+
+            index = self._build_index(user_id)
+            if not index.mapped:
+                return index
+
+            with self._indexes_lock:
+                # Rows committed while building; later ones are appended by _index_added
+                rows = self._reader().execute(
+                    "SELECT id, embedding FROM memory WHERE user_id = ? AND embedding_model IS ? AND id > ? ORDER BY id",
+                    (user_id, self.embedder.name, index.max_id)
+                ).fetchall()
+                for memory_id, blob in rows:
+                    index.append(memory_id, from_blobs([blob], self.embedder.dim)[0])
+                self._indexes[user_id] = index
+                while len(self._indexes) > MEMORY_VECTOR_CACHE_USERS:
+                    _, evicted = self._indexes.popitem(last=False)
+                    evicted.flush()
+            return index
+
+    @contextmanager
+    def _index_build(self, user_id: str):
+        """Hold the user's build lock; the entry is removed once no thread needs it."""
+        with self._indexes_lock:
+            entry = self._index_builds.setdefault(user_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._indexes_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._index_builds[user_id]
+
+    def _index_added(self, user_id: str, future: Future, vector: Optional["np.ndarray"]):
+        """Append a committed memory to the user's matrix if it is mapped (runs on the writer thread)."""
+        if vector is None or future.exception() is not None:
+            return
+        memory_id = future.result()
+        with self._indexes_lock:
+            index = self._indexes.get(user_id)
+            if index is not None and memory_id > index.max_id:
+                index.append(memory_id, vector)
+                self._stats["index_appends"] += 1
+
+    def _drop_index(self, user_id: Optional[str] = None):
+        """Discard one user's matrix (or every mapped one) after deletes; rebuilt on the next search."""
+        if self.embedder is None:
+            return
+        if user_id is None:
+            with self._indexes_lock:
+                for index in self._indexes.values():
+                    index.drop()
+                self._indexes.clear()
+            return
+        # Waits for a build in progress, which would otherwise map files this is about to delete
+        with self._index_build(user_id):
+            with self._indexes_lock:
+                index = self._indexes.pop(user_id, None)
+            (index or VectorIndex(self._index_prefix(user_id), self.embedder.dim)).drop()
+
+    # ---- public API ----
 
     def add_memory(self, user_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
-        metadata_json = json.dumps(metadata or {})
-        now = datetime.now(timezone.utc).isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO memory (user_id, text, metadata, created_at) VALUES (?,?,?,?)",
-                (user_id, text, metadata_json, now)
-            )
-            conn.commit()
+        """Queue a memory for the next group commit (embedded on the writer thread); flush() waits for it."""
+        insert = _Insert(user_id, text, json.dumps(metadata or {}), datetime.now(timezone.utc).isoformat())
+        future = self._submit(insert)
+        future.add_done_callback(lambda f: self._index_added(user_id, f, insert.vector))
 
     def get_recent(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT id, text, metadata, created_at FROM memory WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-                (user_id, limit)
-            )
-            rows = cur.fetchall()
+        rows = self._reader().execute(
+            "SELECT id, text, metadata, created_at FROM memory WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
         return [
             {"id": r[0], "text": r[1], "metadata": json.loads(r[2] or "{}"), "created_at": r[3]}
             for r in rows
         ]
 
+    @staticmethod
+    def _fts_query(user_id: str, query: str) -> Optional[str]:
+        """
+        Turn free text into an FTS5 expression: every word other than a stopword becomes a quoted prefix
+        term ("meeting" also finds "meetings"), OR-ed together so partial matches still come back, with rows
+        matching more terms ranked higher by BM25. The terms are AND-ed with the user's id as a phrase on the
+        user_id column, so the index only ranks that user's rows (the SQL join still checks the exact id).
+        """
+        terms = _FTS_TERM.findall(query.lower())
+        terms = [t for t in terms if t not in _FTS_STOPWORDS] or terms
+        if not terms:
+            return None
+        match = " OR ".join(f'"{t}"*' for t in dict.fromkeys(terms))
+        user_terms = _FTS_TERM.findall(user_id.lower())
+        if user_terms:
+            match = f'user_id : ^"{" ".join(user_terms)}" AND ({match})'
+        return match
+
     def search_simple(self, user_id: str, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
-        Lightweight fallback retrieval: simple substring search in memory text.
-        If you have embeddings, swap this for a vector search.
+        Full-text retrieval ranked by BM25 (best match first), with prefix and multi-term matching.
+        Falls back to substring search when FTS5 is unavailable.
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            q = f"%{query}%"
-            cur.execute(
-                "SELECT id, text, metadata, created_at FROM memory WHERE user_id = ? AND text LIKE ? ORDER BY created_at DESC LIMIT ?",
-                (user_id, q, limit)
-            )
-            rows = cur.fetchall()
+        if not self.fts_enabled:
+            return self._search_like(user_id, query, limit)
+
+        match = self._fts_query(user_id, query)
+        if match is None:
+            return self.get_recent(user_id, limit)
+
+        # Weight 0 for the user_id column: only the text contributes to the score
+        rows = self._reader().execute(
+            """
+            SELECT m.id, m.text, m.metadata, m.created_at, bm25(memory_fts, 0.0, 1.0) AS score
+            FROM memory_fts JOIN memory m ON m.id = memory_fts.rowid
+            WHERE memory_fts MATCH ? AND m.user_id = ?
+            ORDER BY score LIMIT ?
+            """,
+            (match, user_id, limit)
+        ).fetchall()
+        return [
+            {"id": r[0], "text": r[1], "metadata": json.loads(r[2] or "{}"), "created_at": r[3], "score": -r[4]}
+            for r in rows
+        ]
+
+    def search_semantic(self, user_id: str, query: str, limit: int = 5,
+                        min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Nearest memories by embedding cosine similarity (best first), each with its "score".
+        Empty when vector search is unavailable.
+        """
+        query_vectors = self._embed([query])
+        if query_vectors is None:
+            return []
+        ids, scores = self._user_index(user_id).search(query_vectors[0], limit)
+        hits = [(int(i), float(s)) for i, s in zip(ids, scores) if min_score is None or s >= min_score]
+        if not hits:
+            return []
+
+        rows = self._reader().execute(
+            f"SELECT id, text, metadata, created_at FROM memory WHERE id IN ({','.join('?' * len(hits))})",
+            [memory_id for memory_id, _ in hits]
+        ).fetchall()
+        by_id = {r[0]: r for r in rows}
+        return [
+            {"id": r[0], "text": r[1], "metadata": json.loads(r[2] or "{}"), "created_at": r[3], "score": score}
+            for r, score in ((by_id.get(memory_id), score) for memory_id, score in hits)
+            if r is not None
+        ]
+
+    def _search_like(self, user_id: str, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Substring search over the user's rows (full scan; pre-FTS behaviour)."""
+        q = f"%{query}%"
+        rows = self._reader().execute(
+            "SELECT id, text, metadata, created_at FROM memory WHERE user_id = ? AND text LIKE ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, q, limit)
+        ).fetchall()
         return [
             {"id": r[0], "text": r[1], "metadata": json.loads(r[2] or "{}"), "created_at": r[3]}
             for r in rows
         ]
 
     def clear_user(self, user_id: str):
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM memory WHERE user_id = ?", (user_id,))
-            conn.commit()
+        self._submit(lambda conn: conn.execute("DELETE FROM memory WHERE user_id = ?", (user_id,))).result()
+        self._drop_index(user_id)
+
+    def move_user(self, old_user_id: str, new_user_id: str):
+        """Re-key every memory of one user id to another (the full-text index follows by trigger)."""
+        self._submit(lambda conn: conn.execute(
+            "UPDATE memory SET user_id = ? WHERE user_id = ?", (new_user_id, old_user_id)
+        )).result()
+        self._drop_index(old_user_id)
+        self._drop_index(new_user_id)
 
     def prune_older_than(self, days: int = 90):
         cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM memory WHERE created_at < ?", (cutoff,))
-            conn.commit()
+        self._submit(lambda conn: conn.execute("DELETE FROM memory WHERE created_at < ?", (cutoff,))).result()
+        # Unmapped users' matrices fail the row-count check on next load and are rebuilt then
+        self._drop_index()
+
+    def get_summary(self, user_id: str) -> Optional[str]:
+        """The user's latest summary note written by summarize_old, without its prefix."""
+        row = self._reader().execute(
+            "SELECT text FROM memory WHERE user_id = ? AND summarized = 1 ORDER BY created_at DESC LIMIT 1",
+            (user_id,)
+        ).fetchone()
+        return row[0][len("SUMMARIZED: "):] if row else None
+
+    def count_unsummarized(self, user_id: str) -> int:
+        return self._reader().execute(
+            "SELECT COUNT(*) FROM memory WHERE user_id = ? AND summarized = 0", (user_id,)
+        ).fetchone()[0]
 
-    def summarize_old(self, user_id: str, summarizer_fn, older_than_days: int = 30):
+    def summarize_old(self, user_id: str, summarizer_fn, older_than_days: float = 30, keep_latest: int = 0):
         """
         Summarize older memories into a compact summary note using your LLM summarizer function.
         summarizer_fn(list_of_texts) -> str
+        The previous summary note comes first among the inputs, so repeated calls roll it forward.
+        keep_latest leaves the user's newest (non-summary) memories out of the summary.
         """
         cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT id, text FROM memory WHERE user_id = ? AND created_at < ?",
-                (user_id, cutoff)
-            )
-            rows = cur.fetchall()
-            if not rows:
-                return None
-            texts = [r[1] for r in rows]
-            summary = summarizer_fn(texts)
-
-            # mark old rows as summarized (or delete and add one summary row)
-            cur.execute("DELETE FROM memory WHERE user_id = ? AND created_at < ?", (user_id, cutoff))
-            now = datetime.now(timezone.utc).isoformat()
-            cur.execute(
-                "INSERT INTO memory (user_id, text, metadata, created_at, summarized) VALUES (?,?,?,?,1)",
-                (user_id, f"SUMMARIZED: {summary}", json.dumps({"auto_summary": True}), now)
+        rows = self._reader().execute(
+            "SELECT id, text FROM memory WHERE user_id = ? AND created_at < ? AND id NOT IN "
+            "(SELECT id FROM memory WHERE user_id = ? AND summarized = 0 ORDER BY created_at DESC LIMIT ?) "
+            "ORDER BY summarized DESC, created_at",
+            (user_id, cutoff, user_id, keep_latest)
+        ).fetchall()
+        if not rows:
+            return None
+        texts = [r[1] for r in rows]
+        summary = summarizer_fn(texts)
+
+        # Replace exactly the rows that were summarized (not ones that aged past the cutoff meanwhile)
+        ids = [r[0] for r in rows]
+        now = datetime.now(timezone.utc).isoformat()
+        text = f"SUMMARIZED: {summary}"
+        vectors = self._embed([text])
+        blob, model = (to_blob(vectors[0]), self.embedder.name) if vectors is not None else (None, None)
+
+        def replace_with_summary(conn: sqlite3.Connection):
+            conn.executemany("DELETE FROM memory WHERE id = ?", [(i,) for i in ids])
+            conn.execute(
+                "INSERT INTO memory (user_id, text, metadata, created_at, summarized, embedding, embedding_model) "
+                "VALUES (?,?,?,?,1,?,?)",
+                (user_id, text, json.dumps({"auto_summary": True}), now, blob, model)
             )
-            conn.commit()
-            return summary
\ No newline at end of file
+
+        self._submit(replace_with_summary).result()
+        self._drop_index(user_id)
+        return summary
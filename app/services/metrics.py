@@ -0,0 +1,296 @@
+# app/services/metrics.py
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Tuple, Sequence, List
+
+# Latency buckets (seconds) spanning fast cache hits to slow LLM completions
+DEFAULT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for a metric family; each distinct label-value tuple gets its own child."""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Child for the given label values (created on first use, then a dict lookup)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        # Snapshot under the lock: labels() may add a child from another thread while this iterates
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = float(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name, labelnames, values):
+        # Counts and sum from the same instant, so _count always matches the buckets and _sum
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """Holds metric families and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TURN_STAGE_SECONDS = REGISTRY.histogram(
+    "voice_turn_stage_seconds", "Latency between pipeline points within a turn", ["stage"]
+)
+TURNS_TOTAL = REGISTRY.counter("voice_turns_total", "Turns handled, by outcome", ["outcome"])
+PROVIDER_REQUEST_SECONDS = REGISTRY.histogram(
+    "voice_provider_request_seconds", "Duration of successful upstream provider requests", ["provider"]
+)
+PROVIDER_ERRORS = REGISTRY.counter(
+    "voice_provider_errors_total", "Failed upstream provider requests, by error class", ["provider", "error"]
+)
+AUDIO_FRAMES_SENT = REGISTRY.counter("voice_audio_frames_sent_total", "Binary audio frames sent to clients")
+AUDIO_BYTES_SENT = REGISTRY.counter("voice_audio_bytes_sent_total", "Audio payload bytes sent to clients")
+TTS_CACHE_LOOKUPS = REGISTRY.counter("voice_tts_cache_lookups_total", "TTS cache lookups", ["result"])
+SEARCH_CACHE_LOOKUPS = REGISTRY.counter(
+    "voice_search_cache_lookups_total", "Web search cache lookups (hit, miss or coalesced onto an in-flight search)",
+    ["result"]
+)
+SPECULATION_OUTCOMES = REGISTRY.counter(
+    "voice_speculation_total", "Speculative work started from partial transcripts, by kind and outcome",
+    ["kind", "outcome"]
+)
+SPECULATION_WASTED_SECONDS = REGISTRY.counter(
+    "voice_speculation_wasted_seconds_total", "Time spent on speculative work that was discarded", ["kind"]
+)
+ROUTE_DECISIONS = REGISTRY.counter(
+    "voice_route_decisions_total", "Routing decisions per turn: tools run before the LLM, plausible but not run (skipped), or none",
+    ["tool", "mode"]
+)
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter(
+    "voice_response_cache_lookups_total", "LLM response cache lookups (exact, semantic or miss)", ["result"]
+)
+STT_DROPPED_BYTES = REGISTRY.counter(
+    "voice_stt_dropped_bytes_total", "Audio bytes dropped by the transcriber ingest buffer's overflow policy"
+)
+UPSTREAM_WIRE_BYTES = REGISTRY.counter(
+    "voice_upstream_wire_bytes_total", "Client audio bytes received, by upstream codec", ["codec"]
+)
+UPSTREAM_PCM_BYTES = REGISTRY.counter(
+    "voice_upstream_pcm_bytes_total", "PCM bytes after decoding client audio, by upstream codec", ["codec"]
+)
+ACTIVE_SESSIONS = REGISTRY.gauge("voice_active_sessions", "Connected WebSocket sessions")
+LLM_PROMPT_TOKENS = REGISTRY.counter("voice_llm_prompt_tokens_total", "Gemini prompt tokens reported per call")
+PERSONA_TOKENS_SAVED = REGISTRY.counter(
+    "voice_persona_tokens_saved_total", "Estimated prompt tokens of diagram guidance left out of non-diagram turns"
+)
+
+
+def observe_provider(provider: str, seconds: float):
+    PROVIDER_REQUEST_SECONDS.labels(provider).observe(seconds)
+
+
+def record_provider_error(provider: str, error):
+    """Count a provider failure; `error` is an exception (classified by type) or a short class name."""
+    error_class = error if isinstance(error, str) else type(error).__name__
+    PROVIDER_ERRORS.labels(provider, error_class).inc()
+
+
+def record_prompt_usage(prompt_tokens: int):
+    """Count one Gemini call's prompt tokens."""
+    LLM_PROMPT_TOKENS.inc(prompt_tokens)
+
+
+class TurnTimeline:
+    """
+    Timestamps for one turn's pipeline points, recorded with a single perf_counter call each.
+    Only the first occurrence of a point counts; intervals are turned into histogram samples once, at the end.
+    """
+    __slots__ = ("marks",)
+
+    # stage name -> (from point, to point)
+    INTERVALS = {
+        "stt_first_partial": ("audio_start", "partial"),
+        "stt_final": ("audio_start", "final"),
+        "llm_first_token": ("final", "llm_first_token"),
+        "llm_complete": ("final", "llm_complete"),
+        "tts_first_audio": ("tts_request", "tts_first_audio"),
+        "time_to_first_audio": ("final", "frame_sent"),
+        "turn_total": ("final", "turn_end"),
+    }
+
+    def __init__(self):
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, point: str):
+        if point not in self.marks:
+            self.marks[point] = time.perf_counter()
+
+    def has(self, point: str) -> bool:
+        return point in self.marks
+
+    def durations(self) -> Dict[str, float]:
+        marks = self.marks
+        return {
+            stage: marks[end] - marks[start]
+            for stage, (start, end) in self.INTERVALS.items()
+            if start in marks and end in marks
+        }
+
+    def observe(self, outcome: str = "completed") -> Dict[str, float]:
+        """Feed the turn's intervals into the stage histograms and count the turn."""
+        self.mark("turn_end")
+        durations = self.durations()
+        for stage, seconds in durations.items():
+            TURN_STAGE_SECONDS.labels(stage).observe(seconds)
+        TURNS_TOTAL.labels(outcome).inc()
+        return durations
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
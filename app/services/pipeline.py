@@ -0,0 +1,99 @@
+# app/services/pipeline.py
+import contextlib
+import logging
+import re
+from typing import List, Dict, Any, Tuple, Optional, Callable, Awaitable, AsyncGenerator
+
+from app.services.budget import TurnBudget
+from app.services.llm import generate_streaming_response_async
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends (., ? or ! followed by whitespace) plus paragraph breaks
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.?!])\s+|\n\s*\n')
+
+
+class SentenceChunker:
+    """
+    Incrementally cuts a token stream into speakable sentences.
+    Fragments shorter than min_chars (list markers like "1.") are held back
+    and merged into the following sentence.
+    """
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a text delta and return any sentences it completed."""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_BOUNDARY.finditer(self._buffer):
+            candidate = self._buffer[start:match.start()].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Return whatever is left once the stream has ended."""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+
+async def relay_deltas(
+        stream: AsyncGenerator[str, None],
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_sentence: Optional[Callable[[str], None]] = None,
+) -> str:
+    """
+    Forward each text delta and every completed sentence; returns the full stripped text.
+    The stream is closed on the way out, so a barge-in releases its LLM slot right away, not at garbage collection.
+    """
+    chunker = SentenceChunker()
+    parts: List[str] = []
+
+    async with contextlib.aclosing(stream):
+        async for delta in stream:
+            parts.append(delta)
+            if on_delta:
+                await on_delta(delta)
+            if on_sentence:
+                for sentence in chunker.feed(delta):
+                    on_sentence(sentence)
+
+    tail = chunker.flush()
+    if tail and on_sentence:
+        on_sentence(tail)
+    return "".join(parts).strip()
+
+
+async def run_streaming_turn(
+        user_query: str,
+        history: List[Dict[str, Any]],
+        api_key: str = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_sentence: Optional[Callable[[str], None]] = None,
+        session_id: str = None,
+        budget: Optional[TurnBudget] = None,
+        on_error: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Stream a Gemini reply, forwarding text deltas and completed sentences as they arrive.
+    Returns the full reply and the updated history (unchanged if the stream failed).
+    A failure after text was delivered ends the reply and is reported to on_error, not spoken.
+    """
+    completed_history: List[List[Dict[str, Any]]] = []
+    stream = generate_streaming_response_async(
+        user_query, history, api_key, on_complete=completed_history.append, session_id=session_id, budget=budget,
+        on_error=on_error
+    )
+    full_response = await relay_deltas(stream, on_delta, on_sentence)
+    if completed_history:
+        logger.info("Streaming LLM response completed (%d chars)", len(full_response))
+        return full_response, completed_history[0]
+    return full_response, history
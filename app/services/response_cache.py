@@ -0,0 +1,247 @@
+# app/services/response_cache.py
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+from app.persona import merged_persona
+from app.services.agent import analyze_query_intent
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from app.services.embeddings import get_embedder, HashingEmbedder
+    SEMANTIC_MATCHING_AVAILABLE = True
+except ImportError:
+    SEMANTIC_MATCHING_AVAILABLE = False
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1").lower() not in ("0", "false", "no")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+# Cosine similarity above which a differently worded question reuses a cached answer. Only used with a real
+# embedding provider (EMBEDDING_PROVIDER=gemini): the local hashing embedder scores reordered words
+# ("celsius to fahrenheit" / "fahrenheit to celsius") above it
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+# Longer questions are too specific to be asked again
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "16"))
+
+# Model the cached answers came from; part of every entry's version tag
+RESPONSE_MODEL = "gemini-1.5-flash"
+
+_PUNCTUATION = re.compile(r"[^\w\s']+", re.UNICODE)
+_LEADING_FILLER = re.compile(r"^(?:(?:um+|uh+|hey|hi|ok(?:ay)?|so|well|can you|could you)\s+)+")
+_PLEASE = re.compile(r"\s*\bplease\b")
+_QUESTION_CONTRACTION = re.compile(r"\b(what|who|where|when|why|how)'s\b")
+# Words that tie a question to the conversation or the user, so its answer can't be shared
+_CONTEXT_WORDS = frozenset(
+    "i i'm i've my mine we our us it it's that this these those they them their he she him her his "
+    "again more else also another previous earlier before above same".split()
+)
+# Requests for something made up on the spot: a shared answer would repeat the same joke or poem to everyone
+_CREATIVE_WORDS = frozenset(
+    "joke jokes poem poems story stories riddle riddles song songs haiku limerick pun puns rhyme rap "
+    "random surprise write compose invent imagine pretend roleplay".split()
+)
+# Left out when comparing the content words of two questions
+_FUNCTION_WORDS = frozenset(
+    "a an the is are was were be do does did to of in on at for and or with what who where when why how "
+    "can could should would will".split()
+)
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, drop punctuation and leading filler so spoken variants of a question share a key."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = " ".join(_PUNCTUATION.sub(" ", text).split())
+    text = _QUESTION_CONTRACTION.sub(r"\1 is", text)
+    text = _LEADING_FILLER.sub("", text)
+    return _PLEASE.sub("", text).strip()
+
+
+def is_cacheable(normalized: str) -> bool:
+    """
+    Short, self-contained, factual questions only; anything referring back to the conversation or asking for
+    something creative is answered fresh.
+    """
+    words = normalized.split()
+    return (0 < len(words) <= RESPONSE_CACHE_MAX_WORDS and not _CONTEXT_WORDS.intersection(words)
+            and not _CREATIVE_WORDS.intersection(words))
+
+
+def cache_key_for(query: str, history: Optional[list] = None) -> Optional[str]:
+    """
+    Normalized key if the query may be answered from the cache, None if it needs a fresh answer.
+    Only a conversation's opening question qualifies: later answers depend on earlier turns (a requested
+    language, tone or topic), which the key does not capture.
+    """
+    if history:
+        return None
+    if analyze_query_intent(query)["needs_search"]:
+        return None  # Time-sensitive: current info, prices, weather, news
+    normalized = normalize_query(query)
+    return normalized if is_cacheable(normalized) else None
+
+
+def _content_words(normalized: str) -> list:
+    return [w for w in normalized.split() if w not in _FUNCTION_WORDS]
+
+
+def is_reordering(a: str, b: str) -> bool:
+    """
+    True if two normalized questions use the same content words in a different order ("is a dolphin a fish" /
+    "is a fish a dolphin"). Embeddings score these as near duplicates, but they usually ask the opposite thing.
+    """
+    words_a, words_b = _content_words(a), _content_words(b)
+    return words_a != words_b and sorted(words_a) == sorted(words_b)
+
+
+def version_tag(model: str = RESPONSE_MODEL, persona: str = merged_persona) -> str:
+    """Identifies the persona and model an answer was produced with; entries from other versions never match."""
+    digest = hashlib.sha256(persona.encode("utf-8")).hexdigest()[:12]
+    return f"{model}:{digest}"
+
+
+class ResponseCache:
+    """
+    LLM answers for time-insensitive questions, shared by every session.
+    Lookups match the normalized question exactly, then by embedding similarity against the stored questions
+    (an in-memory matrix with one row per entry); a stored question with the same content words in another
+    order never matches. Similarity matching needs a real embedding provider: with the default hashing
+    embedder only exact matches are served. Entries expire after `ttl` and the least recently used
+    is evicted once `max_entries` is reached.
+    """
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, similarity: float = RESPONSE_CACHE_SIMILARITY,
+                 embedder=None, tag: Optional[str] = None):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.tag = tag or version_tag()
+        self._embedder = embedder
+        # normalized question -> (answer, version tag, stored at, matrix row or -1)
+        self._entries: "OrderedDict[str, Tuple[str, str, float, int]]" = OrderedDict()
+        self._row_keys: Dict[int, str] = {}
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0}
+
+    @property
+    def embedder(self):
+        if self._embedder is None and SEMANTIC_MATCHING_AVAILABLE:
+            embedder = get_embedder()
+            # Word-overlap vectors can't tell a question from its reversal; a wrong answer is worse than a miss
+            self._embedder = False if isinstance(embedder, HashingEmbedder) else embedder
+        return self._embedder or None
+
+    def _drop(self, key: str):
+        """Remove an entry and free its matrix row (lock held)."""
+        _, _, _, row = self._entries.pop(key)
+        if row >= 0:
+            self._matrix[row] = 0.0
+            del self._row_keys[row]
+            self._free_rows.append(row)
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        """The entry's answer if present, current and unexpired (lock held); stale entries are dropped."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, tag, stored_at, _ = entry
+        if tag != self.tag or now - stored_at > self.ttl:
+            self._drop(key)
+            self._stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def get_exact(self, normalized: str) -> Optional[str]:
+        with self._lock:
+            answer = self._live(normalized, time.time())
+            if answer is not None:
+                self._stats["exact_hits"] += 1
+            return answer
+
+    def get(self, normalized: str) -> Tuple[Optional[str], str]:
+        """(answer, "exact" | "semantic" | "miss") for a normalized, cacheable question."""
+        if not self.enabled:
+            return None, "miss"
+        answer = self.get_exact(normalized)
+        if answer is not None:
+            return answer, "exact"
+
+        embedder = self.embedder
+        if embedder is not None and self._matrix is not None and self._row_keys:
+            try:
+                query = embedder.embed_one(normalized)
+            except Exception as e:
+                logger.warning(f"Response cache embedding failed: {e}")
+                query = None
+            if query is not None:
+                with self._lock:
+                    if self._matrix is not None and self._row_keys:
+                        scores = self._matrix @ query
+                        row = int(np.argmax(scores))
+                        if (scores[row] >= self.similarity and row in self._row_keys
+                                and not is_reordering(self._row_keys[row], normalized)):
+                            answer = self._live(self._row_keys[row], time.time())
+                            if answer is not None:
+                                self._stats["semantic_hits"] += 1
+                                return answer, "semantic"
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, "miss"
+
+    def put(self, normalized: str, answer: str):
+        if not self.enabled or not answer:
+            return
+        vector = None
+        embedder = self.embedder
+        if embedder is not None:
+            try:
+                vector = embedder.embed_one(normalized)
+            except Exception as e:
+                logger.warning(f"Response cache embedding failed: {e}")
+
+        with self._lock:
+            if normalized in self._entries:
+                self._drop(normalized)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            row = -1
+            if vector is not None:
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                row = self._free_rows.pop()
+                self._matrix[row] = vector
+                self._row_keys[row] = normalized
+            self._entries[normalized] = (answer, self.tag, time.time(), row)
+            self._stats["stores"] += 1
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = self._stats.copy()
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        stats["version"] = self.tag
+        return stats
+
+
+# Process-wide cache shared by every session
+response_cache = ResponseCache()
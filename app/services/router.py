@@ -0,0 +1,204 @@
+# app/services/router.py
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, Any, List, Tuple, Callable, Awaitable, Optional
+
+from app.services.metrics import ROUTE_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+# Tools at or above this confidence run before the LLM and feed its prompt
+ROUTER_BLOCKING_CONFIDENCE = float(os.getenv("ROUTER_BLOCKING_CONFIDENCE", "0.7"))
+# Tools between this and the blocking level are plausible but not run, only recorded as "skipped" decisions:
+# a search whose result can't reach the prompt in time would be billed and thrown away
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.3"))
+# Memory lookup also rebuilds the bounded prompt context, so by default it runs on every turn
+ROUTER_MEMORY_FLOOR = float(os.getenv("ROUTER_MEMORY_FLOOR", "1.0"))
+
+# intent -> (lowercase pattern starting at a word boundary, weight); matched against the lowercased query.
+# Weights say how strongly a match implies the intent, so "weather" alone is enough to search while "now"
+# on its own is only recorded as a possible search. The intent with the most weight is the primary one; ties go to the intent
+# declared first, so topics (weather, prices, news) come before the generic time words that often join them.
+INTENT_PATTERNS: Dict[str, List[Tuple[str, float]]] = {
+    "weather": [
+        (r"\b(?:weather|forecast|temperature)\b", 1.0),
+        (r"\b(?:rain(?:ing)?|snow(?:ing)?|sunny)\b", 0.6),
+        (r"\b(?:cold|hot|warm|windy|humid)\b", 0.4),
+    ],
+    "financial": [
+        (r"\bprices?\b", 1.0),
+        (r"\b(?:usd|eur|bitcoin|crypto|exchange rate)\b", 1.0),
+        (r"\b(?:stocks?|markets?|trading|shares)\b", 0.6),
+        (r"\bcosts?\b", 0.5),
+        # Consumes its "cost", so it carries the full weight
+        (r"\bhow much (?:does|do|did|will|would) (?:\w+ ){0,4}?cost\b", 1.0),
+    ],
+    "news": [
+        (r"\b(?:news|headlines?|breaking)\b", 1.0),
+        (r"\bannounc(?:e|ed|es|ement|ements)\b", 1.0),
+        (r"\bscores?\b", 1.0),
+    ],
+    "current_info": [
+        (r"\b(?:today|tonight|latest|current(?:ly)?)\b", 1.0),
+        (r"\b(?:what'?s|whats) (?:happening|new)\b", 1.0),
+        (r"\byesterday\b", 0.8),
+        (r"\b(?:this|last|next) (?:year|month|week|weekend|night)\b", 0.8),
+        (r"\brecent(?:ly)?\b", 0.7),
+        (r"\b20[0-9]{2}\b", 0.6),
+        (r"\b(?:now|tomorrow|what happened)\b", 0.4),
+    ],
+    "memory": [
+        (r"\b(?:remember|remind me|you said|last time|earlier)\b", 1.0),
+        (r"\b(?:i|we) (?:told you|said|mentioned|talked about|discussed)\b", 1.0),
+        (r"\bdid (?:i|we) (?:tell you|say|mention)\b", 1.0),
+        (r"\bmy (?:name|favorite|favourite|birthday)\b", 0.8),
+    ],
+    "factual": [
+        (r"\b(?:what is|who is|where is|when is|how)\b", 1.0),
+        (r"\b(?:define|explain|meaning)\b", 1.0),
+    ],
+    "diagram": [
+        (r"\b(?:diagrams?|flow ?charts?|mermaid|mind ?maps?|uml)\b", 1.0),
+        (r"\b(?:draw|sketch)\b", 0.7),
+        (r"\b(?:visuali[sz]e|illustrate|chart)\b", 0.6),
+        # Explaining a process is not asking for a picture of it; these only add to an explicit ask
+        (r"\b(?:workflows?|process(?:es)?|architecture|pipeline)\b", 0.3),
+    ],
+}
+
+# tool -> intents whose matches raise its confidence
+TOOL_INTENTS: Dict[str, Tuple[str, ...]] = {
+    "search": ("weather", "financial", "news", "current_info"),
+    "memory": ("memory",),
+    "diagram": ("diagram",),
+}
+
+# Handler for a tool: (query, request) -> result; request carries per-turn state (history, budget, keys)
+ToolHandler = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+class Route:
+    """Routing decision for one query: matches and summed weight per intent, and each tool's confidence."""
+    __slots__ = ("intents", "weights", "confidence")
+
+    def __init__(self, intents: Dict[str, int], weights: Dict[str, float], confidence: Dict[str, float]):
+        self.intents = intents
+        self.weights = weights
+        self.confidence = confidence
+
+    @property
+    def primary_intent(self) -> str:
+        return max(self.weights, key=self.weights.get) if self.weights else "general"
+
+    @property
+    def blocking(self) -> List[str]:
+        return [tool for tool, c in self.confidence.items() if c >= ROUTER_BLOCKING_CONFIDENCE]
+
+    @property
+    def skipped(self) -> List[str]:
+        return [tool for tool, c in self.confidence.items() if ROUTER_MIN_CONFIDENCE <= c < ROUTER_BLOCKING_CONFIDENCE]
+
+    @property
+    def needs_search(self) -> bool:
+        """
+        Search results should be in the prompt before the LLM answers (blocking confidence). Stricter than
+        analyze_query_intent's "needs_search", which keeps its original meaning: any search intent matched.
+        """
+        return self.confidence.get("search", 0.0) >= ROUTER_BLOCKING_CONFIDENCE
+
+    def wants(self, tool: str) -> bool:
+        """The tool is plausibly relevant (blocking or skipped confidence)."""
+        return self.confidence.get(tool, 0.0) >= ROUTER_MIN_CONFIDENCE
+
+    def __repr__(self):
+        return f"Route(primary={self.primary_intent!r}, confidence={self.confidence})"
+
+
+class RoutingEngine:
+    """
+    Intent and tool routing. Every pattern is compiled once into a single alternation with one named group per
+    pattern, so a query is scanned once; each match is credited to the pattern that matched at that position.
+    A tool's confidence is the summed weight of its intents' matches (capped at 1) or its floor, whichever is higher.
+    Tool handlers are pluggable: dispatch() awaits the blocking ones concurrently and records the skipped ones
+    as decisions without running them; a route with no blocking tools goes straight to the LLM.
+    """
+
+    def __init__(self, patterns: Dict[str, List[Tuple[str, float]]] = INTENT_PATTERNS,
+                 tool_intents: Dict[str, Tuple[str, ...]] = TOOL_INTENTS,
+                 floors: Optional[Dict[str, float]] = None):
+        self._groups: Dict[str, Tuple[str, float]] = {}
+        alternatives = []
+        for intent, entries in patterns.items():
+            for pattern, weight in entries:
+                name = f"p{len(self._groups)}"
+                self._groups[name] = (intent, weight)
+                # The shared leading \b is hoisted out, so only word starts try the alternatives
+                if pattern.startswith(r"\b"):
+                    pattern = pattern[2:]
+                alternatives.append(f"(?P<{name}>{pattern})")
+        self._matcher = re.compile(r"\b(?:" + "|".join(alternatives) + ")")
+        self._intent_order = list(patterns)
+        self._intent_tools: Dict[str, List[str]] = {}
+        for tool, intents in tool_intents.items():
+            for intent in intents:
+                self._intent_tools.setdefault(intent, []).append(tool)
+        self._tools = list(tool_intents)
+        self._floors = {"memory": ROUTER_MEMORY_FLOOR} if floors is None else dict(floors)
+        self._handlers: Dict[str, ToolHandler] = {}
+
+    def register_tool(self, name: str, handler: ToolHandler, floor: Optional[float] = None):
+        """Attach the handler that runs a tool; a floor makes it run regardless of the query."""
+        self._handlers[name] = handler
+        if name not in self._tools:
+            self._tools.append(name)
+        if floor is not None:
+            self._floors[name] = floor
+
+    def route(self, query: str) -> Route:
+        intents: Dict[str, int] = {}
+        weights: Dict[str, float] = {}
+        groups = self._groups
+        for match in self._matcher.finditer(query.lower()):
+            intent, weight = groups[match.lastgroup]
+            intents[intent] = intents.get(intent, 0) + 1
+            weights[intent] = weights.get(intent, 0.0) + weight
+
+        matched = dict.fromkeys(self._tools, 0.0)
+        for intent, weight in weights.items():
+            for tool in self._intent_tools.get(intent, ()):
+                matched[tool] += weight
+        floors = self._floors
+        confidence = {tool: min(1.0, max(floors.get(tool, 0.0), score)) for tool, score in matched.items()}
+        # Declaration order, so ties for the primary intent resolve the same way for every phrasing
+        if len(weights) > 1:
+            weights = {intent: weights[intent] for intent in self._intent_order if intent in weights}
+        return Route(intents, weights, confidence)
+
+    async def dispatch(self, route: Route, query: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the route's blocking tools; returns their results by name (failed tools are left out)."""
+        for tool in route.skipped:
+            if tool in self._handlers:
+                ROUTE_DECISIONS.labels(tool, "skipped").inc()
+
+        blocking = [tool for tool in route.blocking if tool in self._handlers]
+        if not blocking:
+            ROUTE_DECISIONS.labels("llm", "direct").inc()
+            return {}
+        for tool in blocking:
+            ROUTE_DECISIONS.labels(tool, "blocking").inc()
+        results = await asyncio.gather(
+            *(self._handlers[tool](query, request) for tool in blocking), return_exceptions=True
+        )
+        out = {}
+        for tool, result in zip(blocking, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Tool '{tool}' failed: {result!r}")
+            else:
+                out[tool] = result
+        return out
+
+
+# Process-wide engine; the app registers the tool handlers
+router = RoutingEngine()
@@ -1,23 +1,46 @@
 # services/search.py
 import os
+import time
 from serpapi import GoogleSearch
+from app.services.metrics import observe_provider, record_provider_error
+from app.services.search_cache import search_cache
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+SERPAPI_BACKEND = os.getenv("SERPAPI_BACKEND")
 
-def web_search(query: str) -> str:
+def web_search(query: str, timeout: float = None) -> str:
+    """Top SerpAPI result for the query, shared with concurrent and recent identical searches."""
+    return search_cache.lookup("top1", query, lambda: _fetch(query, timeout), timeout)
+
+
+def _fetch(query: str, timeout: float = None):
     params = {
         "engine": "google",
         "q": query,
         "api_key": SERPAPI_KEY
     }
     search = GoogleSearch(params)
-    results = search.get_dict()
+    if SERPAPI_BACKEND:
+        search.BACKEND = SERPAPI_BACKEND
+    if timeout:
+        search.timeout = timeout
+    started = time.perf_counter()
+    try:
+        results = search.get_dict()
+    except Exception as e:
+        record_provider_error("serpapi", e)
+        raise
+
+    if "error" in results:
+        record_provider_error("serpapi", "ApiError")
+    else:
+        observe_provider("serpapi", time.perf_counter() - started)
 
     if "organic_results" in results:
         first = results["organic_results"][0]
         title = first.get("title")
         snippet = first.get("snippet")
         link = first.get("link")
-        return f"{title} — {snippet} (Source: {link})"
+        return f"{title} — {snippet} (Source: {link})", "error" not in results
     else:
-        return "I couldn’t find any reliable information right now."
\ No newline at end of file
+        return "I couldn’t find any reliable information right now.", False
\ No newline at end of file
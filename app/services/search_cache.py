@@ -0,0 +1,132 @@
+# app/services/search_cache.py
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Optional, Tuple
+
+from app.services.agent import analyze_query_intent
+from app.services.metrics import SEARCH_CACHE_LOOKUPS
+from app.services.response_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE = os.getenv("SEARCH_CACHE", "1").lower() not in ("0", "false", "no")
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+# Longest a caller waits on another caller's identical in-flight search when it has no timeout of its own
+SEARCH_CACHE_WAIT_SECONDS = float(os.getenv("SEARCH_CACHE_WAIT_SECONDS", "10"))
+
+# Seconds a result stays fresh, by analyze_query_intent intent; a query with several intents gets the shortest
+SEARCH_CACHE_TTLS = {
+    "financial": float(os.getenv("SEARCH_TTL_FINANCIAL", "120")),
+    "weather": float(os.getenv("SEARCH_TTL_WEATHER", "600")),
+    "news": float(os.getenv("SEARCH_TTL_NEWS", "900")),
+    "current_info": float(os.getenv("SEARCH_TTL_CURRENT", "900")),
+    "factual": float(os.getenv("SEARCH_TTL_GENERAL", "86400")),
+    "general": float(os.getenv("SEARCH_TTL_GENERAL", "86400")),
+}
+
+
+def search_key(query: str) -> Optional[str]:
+    """
+    The normalized query (case, punctuation, leading filler and "please" removed), None if empty. Word order
+    and interrogatives are kept: "when was X born" and "where was X born" are different searches.
+    """
+    return normalize_query(query) or None
+
+
+def search_ttl(query: str) -> float:
+    intents = analyze_query_intent(query)["intents"] or {"general": 1}
+    return min(SEARCH_CACHE_TTLS.get(intent, SEARCH_CACHE_TTLS["general"]) for intent in intents)
+
+
+class SearchCache:
+    """
+    Web search results shared by every session, keyed by normalized keywords with per-intent TTLs.
+    Concurrent lookups for the same key are coalesced: the first caller fetches, the others wait for its result.
+    Only results the fetcher marks as reliable are stored; failures are never cached.
+    """
+
+    def __init__(self, enabled: bool = SEARCH_CACHE, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        # (namespace, key) -> (result, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "expired": 0, "evictions": 0}
+
+    def lookup(self, namespace: str, query: str, fetch: Callable[[], Tuple[str, bool]],
+               timeout: Optional[float] = None) -> str:
+        """
+        Cached result for the query, or fetch() -> (result, cacheable) run once for all concurrent callers.
+        `namespace` separates differently formatted results (e.g. one snippet vs two). Blocking; callers waiting
+        on another's fetch give up with TimeoutError after `timeout` (SEARCH_CACHE_WAIT_SECONDS if None).
+        """
+        key = search_key(query) if self.enabled else None
+        if key is None:
+            return fetch()[0]
+        cache_key = (namespace, key)
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._entries.move_to_end(cache_key)
+                    self._stats["hits"] += 1
+                    SEARCH_CACHE_LOOKUPS.labels("hit").inc()
+                    return entry[0]
+                del self._entries[cache_key]
+                self._stats["expired"] += 1
+            pending = self._inflight.get(cache_key)
+            if pending is None:
+                pending = self._inflight[cache_key] = Future()
+                leader = True
+                self._stats["misses"] += 1
+            else:
+                leader = False
+                self._stats["coalesced"] += 1
+        SEARCH_CACHE_LOOKUPS.labels("miss" if leader else "coalesced").inc()
+
+        if not leader:
+            # Bounded even without a timeout, so a hung search can't pin every waiting worker thread
+            return pending.result(timeout or SEARCH_CACHE_WAIT_SECONDS)
+
+        try:
+            result, cacheable = fetch()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(cache_key, None)
+            if cacheable:
+                self._entries[cache_key] = (result, time.time() + search_ttl(query))
+                self._entries.move_to_end(cache_key)
+                self._stats["stores"] += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        pending.set_result(result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = self._stats.copy()
+            stats["entries"] = len(self._entries)
+            stats["inflight"] = len(self._inflight)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+
+# Process-wide cache shared by every session
+search_cache = SearchCache()
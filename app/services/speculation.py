@@ -0,0 +1,247 @@
+# app/services/speculation.py
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Callable, Awaitable, Dict, Any, List, AsyncIterator
+
+from app.services.metrics import SPECULATION_OUTCOMES, SPECULATION_WASTED_SECONDS
+from app.services.pipeline import relay_deltas
+from app.services.response_cache import normalize_query
+from app.services.search_cache import search_key
+
+logger = logging.getLogger(__name__)
+
+# "off", "search" (prefetch web search from partial transcripts) or "llm" (also generate the reply early).
+# Off by default: every prefetch is a billed search, and it is only used when the final transcript yields the
+# same search key. Check search_hit_rate in /sessions/{id}/stats on real traffic before turning it on.
+SPECULATION_MODE = os.getenv("SPECULATION", "off").lower()
+# A partial transcript that hasn't changed for this long (the user paused) is speculated on
+SPECULATION_STABLE_MS = int(os.getenv("SPECULATION_STABLE_MS", "300"))
+SPECULATION_MIN_WORDS = int(os.getenv("SPECULATION_MIN_WORDS", "3"))
+# Speculative replies started per utterance at most; each restart throws the previous one away
+SPECULATION_MAX_REPLIES = int(os.getenv("SPECULATION_MAX_REPLIES", "2"))
+
+
+# Words a final transcript may add at the end without changing the question
+_TRAILING_FILLER = frozenset("um umm uh uhh hmm please so okay ok right thanks".split())
+
+
+def _question_tokens(text: str) -> list:
+    tokens = normalize_query(text).split()
+    while tokens and tokens[-1] in _TRAILING_FILLER:
+        tokens.pop()
+    return tokens
+
+
+def transcripts_match(a: str, b: str) -> bool:
+    """
+    True if two transcripts ask the same thing: identical normalized words, ignoring punctuation, case and
+    trailing filler. Near matches are not enough ("10 miles" vs "100 miles", "safe" vs "unsafe").
+    """
+    return _question_tokens(a) == _question_tokens(b)
+
+
+class SpeculativeReply:
+    """
+    A reply generated from a partial transcript before the final one arrived.
+    Deltas are buffered until the turn claims the reply; replay() then forwards them (and any still to come)
+    exactly as a live stream would be, and returns what `generate` returned.
+    """
+
+    def __init__(self, text: str, history: list,
+                 generate: Callable[[Callable[[str], Awaitable[None]]], Awaitable[Dict[str, Any]]]):
+        self.text = text
+        self.history = history
+        self.started_at = time.perf_counter()
+        self.deltas: List[str] = []
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run(generate))
+        self.task.add_done_callback(self._finished)
+
+    async def _run(self, generate):
+        async def on_delta(delta: str):
+            self.deltas.append(delta)
+            self._changed.set()
+
+        try:
+            return await generate(on_delta)
+        finally:
+            self._changed.set()
+
+    @staticmethod
+    def _finished(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Speculative reply failed: {task.exception()!r}")
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and (self.task.cancelled() or self.task.exception() is not None)
+
+    async def _stream(self) -> AsyncIterator[str]:
+        sent = 0
+        while True:
+            if sent < len(self.deltas):
+                sent += 1
+                yield self.deltas[sent - 1]
+            elif self.task.done():
+                return
+            else:
+                self._changed.clear()
+                await self._changed.wait()
+
+    async def replay(self, on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+                     on_sentence: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        await relay_deltas(self._stream(), on_delta, on_sentence)
+        return await self.task
+
+    def cancel(self):
+        self.task.cancel()
+
+
+class Speculator:
+    """
+    Per-session speculative execution driven by partial transcripts.
+
+    Once a partial stops changing for SPECULATION_STABLE_MS it is analysed: if it needs a web search the search is
+    prefetched (warming the shared search cache, which the final turn's lookup then hits or joins), and in "llm"
+    mode the whole reply is generated ahead with `generate_reply`. claim() compares the final transcript with
+    what was speculated on: matching work is committed, the rest is counted as wasted and the turn runs
+    from the final transcript.
+    """
+
+    def __init__(self, needs_search: Callable[[str], bool],
+                 prefetch_search: Optional[Callable[[str], Awaitable[Any]]] = None,
+                 generate_reply: Optional[Callable[[str, list, Callable], Awaitable[Dict[str, Any]]]] = None,
+                 get_history: Callable[[], list] = list, mode: str = SPECULATION_MODE):
+        self.needs_search = needs_search
+        self.prefetch_search = prefetch_search
+        self.generate_reply = generate_reply
+        self.get_history = get_history
+        self.mode = mode
+        self._partial = ""
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # (search key, prefetch task, started at)
+        self._search = None
+        self._reply: Optional[SpeculativeReply] = None
+        self._replies_started = 0
+        self._stats = {
+            "search_started": 0, "search_committed": 0, "search_discarded": 0,
+            "llm_started": 0, "llm_committed": 0, "llm_discarded": 0, "wasted_seconds": 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("search", "llm")
+
+    def on_partial(self, text: str):
+        """Feed a partial transcript (on the event loop); speculation starts once it stops changing."""
+        if not self.enabled:
+            return
+        normalized = normalize_query(text)
+        if normalized == self._partial:
+            return
+        self._partial = normalized
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if len(normalized.split()) >= SPECULATION_MIN_WORDS:
+            self._timer = asyncio.get_running_loop().call_later(
+                SPECULATION_STABLE_MS / 1000, self._speculate, text
+            )
+
+    def _speculate(self, text: str):
+        self._timer = None
+
+        if self.prefetch_search and self.needs_search(text):
+            key = search_key(text)
+            if key and (self._search is None or self._search[0] != key):
+                if self._search:
+                    self._discard("search", self._search[1], self._search[2])
+                task = asyncio.ensure_future(self.prefetch_search(text))
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                self._search = (key, task, time.perf_counter())
+                self._stats["search_started"] += 1
+
+        if self.mode == "llm" and self.generate_reply:
+            if self._reply and not self._reply.failed and transcripts_match(self._reply.text, text):
+                return  # Already speculating on (nearly) this text
+            if self._replies_started >= SPECULATION_MAX_REPLIES:
+                return
+            if self._reply:
+                self._reply.cancel()
+                self._discard("llm", self._reply.task, self._reply.started_at)
+            history = self.get_history()
+            self._reply = SpeculativeReply(
+                text, history, lambda on_delta: self.generate_reply(text, history, on_delta)
+            )
+            self._replies_started += 1
+            self._stats["llm_started"] += 1
+
+    def _discard(self, kind: str, task: asyncio.Future, started_at: float):
+        """Count discarded work; its cost is the time it ran (until now if it is still running)."""
+        self._stats[f"{kind}_discarded"] += 1
+        SPECULATION_OUTCOMES.labels(kind, "discarded").inc()
+
+        def record(_=None):
+            wasted = time.perf_counter() - started_at
+            self._stats["wasted_seconds"] += wasted
+            SPECULATION_WASTED_SECONDS.labels(kind).inc(wasted)
+
+        if task.done() or kind == "llm":
+            record()
+        else:
+            task.add_done_callback(record)
+
+    def _commit(self, kind: str):
+        self._stats[f"{kind}_committed"] += 1
+        SPECULATION_OUTCOMES.labels(kind, "committed").inc()
+
+    def claim(self, final_text: str, history: list) -> Optional[SpeculativeReply]:
+        """
+        Settle the utterance's speculation against its final transcript. Returns the speculative reply if it
+        answered (nearly) the same question on the same history, for the turn to use instead of a new call.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._search:
+            key, task, started_at = self._search
+            if self.needs_search(final_text) and search_key(final_text) == key:
+                self._commit("search")
+            else:
+                self._discard("search", task, started_at)
+
+        reply, claimed = self._reply, None
+        if reply:
+            if not reply.failed and reply.history is history and transcripts_match(reply.text, final_text):
+                self._commit("llm")
+                claimed = reply
+            else:
+                reply.cancel()
+                self._discard("llm", reply.task, reply.started_at)
+
+        self._partial = ""
+        self._search = None
+        self._reply = None
+        self._replies_started = 0
+        return claimed
+
+    def close(self):
+        """Cancel pending speculation (session ended)."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._reply:
+            self._reply.cancel()
+            self._reply = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._stats.copy()
+        stats["mode"] = self.mode
+        for kind in ("search", "llm"):
+            settled = stats[f"{kind}_committed"] + stats[f"{kind}_discarded"]
+            stats[f"{kind}_hit_rate"] = stats[f"{kind}_committed"] / settled if settled else 0.0
+        stats["wasted_seconds"] = round(stats["wasted_seconds"], 3)
+        return stats
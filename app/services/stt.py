@@ -1,13 +1,36 @@
 # Fixed services/stt.py for deployment - handles missing assemblyai.streaming
 import os
+import re
+import json
+import asyncio
+import inspect
 import logging
-import queue
+from urllib.parse import urlencode
 import threading
 from typing import Optional, Callable, Dict, Any
 import time
 
+from app.services.audio_buffer import (
+    PCMRingBuffer, frame_bytes_for, UPSTREAM_FRAME_MS, INGEST_BUFFER_MS, INGEST_OVERFLOW_POLICY,
+    STT_MIN_END_OF_TURN_SILENCE_MS, STT_MAX_TURN_SILENCE_MS
+)
+from app.services.metrics import record_provider_error, STT_DROPPED_BYTES
+
 logger = logging.getLogger(__name__)
 
+ASSEMBLYAI_STREAMING_URL = os.getenv("ASSEMBLYAI_STREAMING_URL", "wss://streaming.assemblyai.com/v3/ws")
+# Seconds to wait for the streaming session to open before the config step fails
+STT_CONNECT_TIMEOUT = float(os.getenv("STT_CONNECT_TIMEOUT", "10"))
+# Reconnects after an established stream drops unexpectedly (audio is buffered meanwhile)
+STT_RECONNECT_ATTEMPTS = int(os.getenv("STT_RECONNECT_ATTEMPTS", "3"))
+# AssemblyAI rejects audio messages shorter than this
+STT_MIN_FRAME_MS = 50
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
 # Try to import AssemblyAI with fallback
 ASSEMBLYAI_AVAILABLE = False
 STREAMING_AVAILABLE = False
@@ -68,6 +91,31 @@ def _on_error(client, error):
     logger.error("AssemblyAI error: %s", error)
 
 
+def _clean_transcript_text(text: str) -> str:
+    """Process and clean transcript text."""
+    if not text:
+        return ""
+
+    # Basic text cleaning
+    text = text.strip()
+
+    # Remove excessive whitespace
+    text = re.sub(r'\s+', ' ', text)
+
+    # Auto-capitalize first letter if needed
+    if text and not text[0].isupper():
+        text = text[0].upper() + text[1:]
+
+    return text
+
+
+def _create_ring(sample_rate: int, frame_ms: int, buffer_ms: int,
+                 overflow: str = INGEST_OVERFLOW_POLICY) -> PCMRingBuffer:
+    """Per-session ingest buffer; AssemblyAI accepts 50-1000 ms per message, so the frame size is clamped to that."""
+    frame_ms = min(1000, max(50, frame_ms))
+    return PCMRingBuffer(frame_bytes_for(buffer_ms, sample_rate), frame_bytes_for(frame_ms, sample_rate), overflow)
+
+
 class AssemblyAIStreamingTranscriber:
     """
     AssemblyAI transcriber with fallback support for missing streaming module.
@@ -82,6 +130,9 @@ class AssemblyAIStreamingTranscriber:
             language_code: str = "en",
             enable_automatic_punctuation: bool = True,
             enable_format_text: bool = True,
+            on_error_callback: Optional[Callable[[str], None]] = None,
+            frame_ms: int = UPSTREAM_FRAME_MS,
+            buffer_ms: int = INGEST_BUFFER_MS,
     ):
         # Use provided API key or environment variable
         if not api_key:
@@ -91,6 +142,8 @@ class AssemblyAIStreamingTranscriber:
             raise ValueError("AssemblyAI API key is required")
 
         self.api_key = api_key
+        self.frame_ms = frame_ms
+        self.buffer_ms = buffer_ms
         self.sample_rate = sample_rate
         self.on_partial_callback = on_partial_callback
         self.on_final_callback = on_final_callback
@@ -132,7 +185,7 @@ class AssemblyAIStreamingTranscriber:
             return
 
         # Internal streaming state
-        self._q: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._ring = _create_ring(self.sample_rate, self.frame_ms, self.buffer_ms)
         self._thread: Optional[threading.Thread] = None
         self._connected = threading.Event()
         self._session_id: Optional[str] = None
@@ -156,7 +209,7 @@ class AssemblyAIStreamingTranscriber:
         """Initialize fallback transcriber when streaming is not available."""
         self._use_fallback = True
         self.client = None
-        self._q = queue.Queue()
+        self._ring = None
         self._thread = None
         self._connected = threading.Event()
         self._connected.set()  # Mark as "connected" for fallback mode
@@ -221,21 +274,7 @@ class AssemblyAIStreamingTranscriber:
 
     def _process_transcript_text(self, text: str) -> str:
         """Process and clean transcript text."""
-        if not text:
-            return ""
-
-        # Basic text cleaning
-        text = text.strip()
-
-        # Remove excessive whitespace
-        import re
-        text = re.sub(r'\s+', ' ', text)
-
-        # Auto-capitalize first letter if needed
-        if text and not text[0].isupper():
-            text = text[0].upper() + text[1:]
-
-        return text
+        return _clean_transcript_text(text)
 
     def stream_audio(self, audio_chunk: bytes):
         """Feed raw audio bytes to the transcriber."""
@@ -249,8 +288,10 @@ class AssemblyAIStreamingTranscriber:
                     logger.error(f"Fallback callback error: {e}")
             return
 
-        if audio_chunk and self._q:
-            self._q.put(audio_chunk)
+        if audio_chunk and self._ring:
+            dropped = self._ring.write(audio_chunk)
+            if dropped:
+                STT_DROPPED_BYTES.inc(dropped)
 
     def close(self):
         """Stop streaming and terminate session."""
@@ -263,9 +304,9 @@ class AssemblyAIStreamingTranscriber:
             logger.info("Closed fallback transcriber")
             return
 
-        # Signal generator to finish
-        if self._q:
-            self._q.put(None)
+        # Signal generator to finish (it drains what is buffered first)
+        if self._ring:
+            self._ring.close()
 
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=5)
@@ -274,15 +315,16 @@ class AssemblyAIStreamingTranscriber:
         self._log_session_stats()
 
     def _audio_generator(self):
-        """Generate audio chunks from queue."""
+        """Generate fixed-size upstream frames from the ingest ring buffer."""
         try:
             while True:
-                chunk = self._q.get(timeout=30)
-                if chunk is None:
+                frame = self._ring.read_frame_blocking(timeout=30)
+                if frame is None:
+                    if not self._ring.closed:
+                        logger.warning("Audio generator timeout")
                     break
-                yield chunk
-        except queue.Empty:
-            logger.warning("Audio generator timeout")
+                # The SDK queues frames internally, so it gets its own copy of the reused frame buffer
+                yield bytes(frame)
         except Exception as e:
             logger.error(f"Audio generator error: {e}")
 
@@ -350,12 +392,259 @@ class AssemblyAIStreamingTranscriber:
             return {}
 
         stats = self._stats.copy()
+        if self._ring:
+            stats["ingest"] = self._ring.get_stats()
         if self._stats["start_time"]:
             current_time = time.time()
             stats["current_duration"] = current_time - self._stats["start_time"]
         return stats
 
 
+class AsyncAssemblyAIStreamingTranscriber:
+    """
+    asyncio-native AssemblyAI v3 streaming transcriber.
+    Connects in the background without blocking the caller, buffers audio in a preallocated ring buffer and
+    delivers turn events straight onto the event loop: no thread, no cross-thread hand-off.
+    Exposes the same stream_audio / close / get_stats surface as AssemblyAIStreamingTranscriber.
+    Must be constructed from within a running event loop; wait_connected() reports whether the session opened.
+    A stream that drops after connecting is reopened up to STT_RECONNECT_ATTEMPTS times, after which
+    on_error_callback is told.
+    """
+
+    def __init__(
+            self,
+            api_key: str = None,
+            sample_rate: int = 16000,
+            on_partial_callback: Optional[Callable[[str], None]] = None,
+            on_final_callback: Optional[Callable[[str], None]] = None,
+            language_code: str = "en",
+            enable_automatic_punctuation: bool = True,
+            enable_format_text: bool = True,
+            on_error_callback: Optional[Callable[[str], None]] = None,
+            frame_ms: int = UPSTREAM_FRAME_MS,
+            buffer_ms: int = INGEST_BUFFER_MS,
+            overflow: str = INGEST_OVERFLOW_POLICY,
+    ):
+        # Use provided API key or environment variable
+        if not api_key:
+            api_key = os.getenv("ASSEMBLYAI_API_KEY")
+
+        if not api_key:
+            raise ValueError("AssemblyAI API key is required")
+
+        if websockets is None:
+            raise ImportError("websockets library is not installed")
+
+        self.api_key = api_key
+        self.sample_rate = sample_rate
+        self.on_partial_callback = on_partial_callback
+        self.on_final_callback = on_final_callback
+        self.language_code = language_code
+        self.enable_automatic_punctuation = enable_automatic_punctuation
+        self.enable_format_text = enable_format_text
+        self.on_error_callback = on_error_callback
+        # Last connection failure, if any
+        self.error: Optional[Exception] = None
+
+        self._ring = _create_ring(sample_rate, frame_ms, buffer_ms, overflow)
+        self._data_ready = asyncio.Event()
+        self._closing = False
+        self._ws = None
+        self._closed = False
+        self._connected = asyncio.Event()
+        self._session_id: Optional[str] = None
+        self._stats = {
+            "start_time": None,
+            "end_time": None,
+            "total_audio_duration": 0,
+            "turns_processed": 0,
+            "errors_count": 0,
+            "reconnects": 0
+        }
+
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _url(self) -> str:
+        params = {
+            "sample_rate": self.sample_rate,
+            "encoding": "pcm_s16le",
+            "format_turns": str(self.enable_format_text).lower(),
+            # Explicit, so the VAD hangover (derived from the same settings) always outlasts them
+            "min_end_of_turn_silence_when_confident": STT_MIN_END_OF_TURN_SILENCE_MS,
+            "max_turn_silence": STT_MAX_TURN_SILENCE_MS,
+        }
+        return f"{ASSEMBLYAI_STREAMING_URL}?{urlencode(params)}"
+
+    async def _run(self):
+        """Connect, then pump audio up and events down until closed, reconnecting if an open stream drops."""
+        self._stats["start_time"] = time.time()
+        reconnects = 0
+        try:
+            while True:
+                try:
+                    await self._stream()
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("AssemblyAI async stream failed: %s", e)
+                    record_provider_error("assemblyai", e)
+                    self._stats["errors_count"] += 1
+                    self.error = e
+                    if not self._connected.is_set():
+                        return  # Never connected (bad key, unreachable): wait_connected() reports it
+                    if self._closing or reconnects >= STT_RECONNECT_ATTEMPTS:
+                        self._dispatch(self.on_error_callback, f"Speech recognition connection lost: {e}", "Error")
+                        return
+                reconnects += 1
+                self._stats["reconnects"] = reconnects
+                await asyncio.sleep(min(0.5 * 2 ** reconnects, 5))
+        finally:
+            self._ws = None
+            self._closed = True
+
+    async def _stream(self):
+        async with websockets.connect(
+                self._url(),
+                extra_headers={"Authorization": self.api_key},
+                open_timeout=STT_CONNECT_TIMEOUT,
+        ) as ws:
+            self._ws = ws
+            self._connected.set()
+            sender = asyncio.create_task(self._send_audio(ws))
+            try:
+                await self._receive_events(ws)
+            finally:
+                sender.cancel()
+        if not self._closing:
+            raise ConnectionError("stream ended by the server")
+
+    async def wait_connected(self, timeout: Optional[float] = STT_CONNECT_TIMEOUT) -> bool:
+        """True once the streaming session is open; False if connecting failed (see `error`) or timed out."""
+        connected = asyncio.ensure_future(self._connected.wait())
+        try:
+            await asyncio.wait([connected, self._task], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            connected.cancel()
+        return self._connected.is_set() and not self._closed
+
+    async def _send_audio(self, ws):
+        """Send fixed-size frames straight out of the ring buffer as they fill up."""
+        while True:
+            frame = self._ring.read_frame()
+            if frame is None:
+                if self._closing:
+                    tail = self._ring.drain()
+                    if tail is not None:
+                        # Pad a short last frame with silence rather than have it rejected
+                        min_bytes = self.sample_rate * STT_MIN_FRAME_MS // 1000 * 2
+                        await ws.send(bytes(tail) + bytes(max(0, min_bytes - len(tail))))
+                    await ws.send(json.dumps({"type": "Terminate"}))
+                    return
+                # No await between the empty read and clear(), so a write can't slip in unnoticed
+                self._data_ready.clear()
+                await self._data_ready.wait()
+                continue
+            # websockets serializes the frame before send() returns, so the reused buffer is free again
+            await ws.send(frame)
+            self._stats["total_audio_duration"] += len(frame) / 2 / self.sample_rate
+
+    async def _receive_events(self, ws):
+        async for raw in ws:
+            try:
+                event = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+
+            event_type = event.get("type")
+            if event_type == "Begin":
+                self._session_id = event.get("id")
+                logger.info(f"AssemblyAI session started: {self._session_id}")
+            elif event_type == "Turn":
+                self._on_turn(event)
+            elif event_type == "Termination":
+                duration = event.get("audio_duration_seconds")
+                logger.info(f"AssemblyAI session terminated after {duration}s")
+                return
+            elif event_type == "Error" or "error" in event:
+                logger.error("AssemblyAI streaming error: %s", event.get("error", event))
+                record_provider_error("assemblyai", "StreamingError")
+                self._stats["errors_count"] += 1
+
+    def _on_turn(self, event: Dict[str, Any]):
+        text = _clean_transcript_text(event.get("transcript") or "")
+        if not text:
+            return
+
+        self._stats["turns_processed"] += 1
+
+        if event.get("end_of_turn"):
+            # With format_turns on, each turn ends twice; only the formatted one is final
+            if self.enable_format_text and not event.get("turn_is_formatted"):
+                return
+            self._dispatch(self.on_final_callback, text, "Final")
+        else:
+            self._dispatch(self.on_partial_callback, text, "Partial")
+
+    def _dispatch(self, callback, text: str, label: str):
+        if not callback:
+            return
+        try:
+            result = callback(text)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception as cb_err:
+            logger.exception("%s-callback error: %s", label, cb_err)
+
+    def stream_audio(self, audio_chunk: bytes):
+        """Buffer raw audio for upload; never blocks. Overflow is handled by the ring buffer's policy."""
+        if not audio_chunk or self._closed or self._closing:
+            return
+        dropped = self._ring.write(audio_chunk)
+        if dropped:
+            STT_DROPPED_BYTES.inc(dropped)
+        if len(self._ring) >= self._ring.frame_bytes:
+            self._data_ready.set()
+
+    async def close(self):
+        """Stop streaming and terminate session."""
+        logger.info("Closing AssemblyAI async transcriber...")
+        self._stats["end_time"] = time.time()
+
+        if not self._closed and self._connected.is_set():
+            self._closing = True
+            self._data_ready.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                pass
+
+        if not self._task.done():
+            self._task.cancel()
+        self._closed = True
+
+        self._log_session_stats()
+
+    def _log_session_stats(self):
+        if self._stats["start_time"] and self._stats["end_time"]:
+            duration = self._stats["end_time"] - self._stats["start_time"]
+            logger.info(
+                f"AssemblyAI session stats: "
+                f"Duration: {duration:.1f}s, "
+                f"Turns: {self._stats['turns_processed']}, "
+                f"Errors: {self._stats['errors_count']}"
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get current session statistics."""
+        stats = self._stats.copy()
+        stats["connected"] = self._connected.is_set() and not self._closed
+        stats["ingest"] = self._ring.get_stats()
+        if self._stats["start_time"]:
+            stats["current_duration"] = time.time() - self._stats["start_time"]
+        return stats
+
+
 # Factory functions for creating transcribers
 def create_transcriber(api_key: str = None, **kwargs) -> AssemblyAIStreamingTranscriber:
     """Factory function to create transcriber with validation."""
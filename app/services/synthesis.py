@@ -0,0 +1,189 @@
+# app/services/synthesis.py
+import asyncio
+import logging
+import os
+from typing import Optional, Callable, Awaitable, AsyncIterator, List
+
+logger = logging.getLogger(__name__)
+
+# Concurrency caps for TTS synthesis
+TTS_GLOBAL_CONCURRENCY = int(os.getenv("TTS_GLOBAL_CONCURRENCY", "16"))
+TTS_SESSION_CONCURRENCY = int(os.getenv("TTS_SESSION_CONCURRENCY", "3"))
+# Forward TTS audio to the client chunk by chunk as it downloads (vs. one frame per finished clip)
+TTS_STREAMING = os.getenv("TTS_STREAMING", "1") not in ("0", "false", "False")
+
+# Shared by every session in the process
+_global_slots = asyncio.Semaphore(TTS_GLOBAL_CONCURRENCY)
+
+
+class SynthesisStage:
+    """
+    Synthesizes several sentences at once but delivers their audio strictly in sentence order.
+    Concurrency is bounded by the per-session semaphore and the process-wide one.
+    """
+
+    def __init__(
+            self,
+            synthesize: Callable[[str], Awaitable[Optional[bytes]]],
+            deliver: Callable[[bytes], Awaitable[None]],
+            session_slots: Optional[asyncio.Semaphore] = None,
+    ):
+        self._synthesize_fn = synthesize
+        self._deliver_fn = deliver
+        self._session_slots = session_slots or asyncio.Semaphore(TTS_SESSION_CONCURRENCY)
+        self._pending: "asyncio.Queue[Optional[asyncio.Task]]" = asyncio.Queue()
+        self._sender = asyncio.create_task(self._deliver_in_order())
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.cancelled = False
+
+    def submit(self, sentence: str):
+        """Queue a sentence for synthesis; audio is delivered after all earlier sentences."""
+        sentence = sentence.strip()
+        if not sentence or self.cancelled:
+            return
+        self.submitted += 1
+        self._pending.put_nowait(asyncio.create_task(self._synthesize(sentence)))
+
+    async def close(self):
+        """Wait until every submitted sentence has been delivered (or has failed)."""
+        self._pending.put_nowait(None)
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+    def cancel(self):
+        """Abandon the stage: cancel pending syntheses and stop delivering audio."""
+        self.cancelled = True
+        self._sender.cancel()
+        while not self._pending.empty():
+            task = self._pending.get_nowait()
+            if task is not None:
+                task.cancel()
+
+    async def _synthesize(self, sentence: str) -> Optional[bytes]:
+        async with self._session_slots:
+            async with _global_slots:
+                return await self._synthesize_fn(sentence)
+
+    async def _deliver_in_order(self):
+        while True:
+            task = await self._pending.get()
+            if task is None:
+                break
+
+            try:
+                audio_bytes = await task
+            except Exception as e:
+                logger.error(f"Sentence synthesis failed: {e}")
+                self.failed += 1
+                continue
+
+            if not audio_bytes:
+                self.failed += 1
+                continue
+
+            try:
+                await self._deliver_fn(audio_bytes)
+                self.delivered += 1
+            except Exception as e:
+                logger.error(f"Audio delivery failed: {e}")
+                self.failed += 1
+
+
+class StreamingSynthesisStage(SynthesisStage):
+    """
+    SynthesisStage that forwards audio chunk by chunk while it downloads.
+    The sentence at the head of the line streams straight through; later sentences download concurrently
+    and hold their chunks only until every earlier sentence has been sent.
+    """
+
+    def __init__(
+            self,
+            synthesize_stream: Callable[[str], AsyncIterator[bytes]],
+            deliver: Callable[[bytes, bool], Awaitable[None]],
+            session_slots: Optional[asyncio.Semaphore] = None,
+            on_drained: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self._on_drained = on_drained
+        self._producers: List[asyncio.Task] = []
+        super().__init__(synthesize_stream, deliver, session_slots)
+
+    def submit(self, sentence: str):
+        """Start streaming a sentence; its chunks are delivered after all earlier sentences."""
+        sentence = sentence.strip()
+        if not sentence or self.cancelled:
+            return
+        self.submitted += 1
+        chunks: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+        task = asyncio.create_task(self._produce(sentence, chunks))
+        self._producers.append(task)
+        self._pending.put_nowait((task, chunks))
+
+    async def close(self):
+        """Wait until every sentence has been streamed, then signal the end of the turn's audio."""
+        await super().close()
+        if self._on_drained and not self.cancelled:
+            await self._on_drained()
+
+    def cancel(self):
+        self.cancelled = True
+        self._sender.cancel()
+        for task in self._producers:
+            task.cancel()
+        while not self._pending.empty():
+            self._pending.get_nowait()
+
+    async def _produce(self, sentence: str, chunks: "asyncio.Queue[Optional[bytes]]"):
+        try:
+            async with self._session_slots:
+                async with _global_slots:
+                    async for chunk in self._synthesize_fn(sentence):
+                        if chunk:
+                            chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(None)
+
+    async def _deliver_in_order(self):
+        while True:
+            item = await self._pending.get()
+            if item is None:
+                break
+
+            task, chunks = item
+            sent = 0
+            failed = False
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if failed:
+                    continue
+                try:
+                    await self._deliver_fn(chunk, False)
+                    sent += 1
+                except Exception as e:
+                    logger.error(f"Audio delivery failed: {e}")
+                    failed = True
+
+            try:
+                await task
+            except Exception as e:
+                logger.error(f"Sentence synthesis failed: {e}")
+                failed = True
+
+            if sent:
+                # Close the clip even after a mid-stream failure so the client can play what it has
+                try:
+                    await self._deliver_fn(b"", True)
+                except Exception as e:
+                    logger.error(f"Audio delivery failed: {e}")
+                    failed = True
+
+            if failed or not sent:
+                self.failed += 1
+            else:
+                self.delivered += 1
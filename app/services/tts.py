@@ -1,21 +1,40 @@
-
-
 # app/services/tts.py
+import asyncio
 import logging
+import os
+import time
+from typing import Optional, AsyncIterator
+
+import httpx
 import requests
 import config
+from app.services.metrics import observe_provider, record_provider_error
 
 logger = logging.getLogger("app.services.tts")
 
-MURF_API_URL = "https://api.murf.ai/v1/speech/generate"
+MURF_API_URL = os.getenv("MURF_API_URL", "https://api.murf.ai/v1/speech/generate")
 
-def speak(text: str, voice_id: str = "en-US-natalie", format: str = "MP3"):
-    """
-    Wrapper to synthesize speech using Murf API.
-    Returns audio bytes or None.
-    """
+# Connection pool and timeouts shared by every TTS request
+MURF_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+MURF_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+# Read size when streaming the audioFile download through to the client
+TTS_STREAM_CHUNK_BYTES = int(os.getenv("TTS_STREAM_CHUNK_BYTES", "8192"))
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_session: Optional[requests.Session] = None
+
+
+def _build_request(text: str, voice_id: str, format: str, api_key: Optional[str]):
     headers = {
-        "api-key": config.MURF_API_KEY,
+        "api-key": api_key or config.MURF_API_KEY,
         "Content-Type": "application/json"
     }
     payload = {
@@ -23,9 +42,148 @@ def speak(text: str, voice_id: str = "en-US-natalie", format: str = "MP3"):
         "text": text,
         "format": format
     }
+    return headers, payload
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the pooled keep-alive client for the running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            timeout=MURF_TIMEOUT,
+            limits=MURF_LIMITS,
+            http2=HTTP2_AVAILABLE,
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client():
+    """Close the pooled client (call on application shutdown)."""
+    global _async_client, _async_client_loop
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
+
+async def speak_async(text: str, voice_id: str = "en-US-natalie", format: str = "MP3", api_key: str = None,
+                      timeout: Optional[float] = None):
+    """
+    Native-async Murf synthesis over the shared connection pool.
+    The audioFile download is issued as soon as the generate response arrives.
+    `timeout` bounds the whole generate + download exchange. Returns audio bytes or None.
+    """
+    headers, payload = _build_request(text, voice_id, format, api_key)
+    client = get_async_client()
+
+    async def generate_and_download():
+        response = await client.post(MURF_API_URL, json=payload, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+
+        audio_url = data.get("audioFile")
+        if not audio_url:
+            logger.error("Murf response missing audioFile: %s", data)
+            return None
+
+        audio_response = await client.get(audio_url)
+        audio_response.raise_for_status()
+        return audio_response.content
+
+    started = time.perf_counter()
+    try:
+        audio = await asyncio.wait_for(generate_and_download(), timeout=timeout)
+        if audio is None:
+            record_provider_error("murf", "MissingAudioFile")
+        else:
+            observe_provider("murf", time.perf_counter() - started)
+        return audio
+
+    except asyncio.TimeoutError as e:
+        record_provider_error("murf", e)
+        logger.error("TTS error: timed out after %.2fs", timeout)
+        return None
+    except Exception as e:
+        record_provider_error("murf", e)
+        logger.error("TTS error: %s", e)
+        return None
+
+
+async def speak_stream_async(text: str, voice_id: str = "en-US-natalie", format: str = "MP3", api_key: str = None,
+                             timeout: Optional[float] = None,
+                             chunk_size: int = TTS_STREAM_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """
+    Streaming variant of speak_async: yields the audioFile in chunks as it downloads instead of buffering it whole.
+    `timeout` bounds the whole exchange. A failure before any audio is logged and yields nothing; a failure
+    mid-download is re-raised so a truncated clip is never mistaken for a complete one.
+    """
+    headers, payload = _build_request(text, voice_id, format, api_key)
+    client = get_async_client()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - loop.time())
+
+    started = time.perf_counter()
+    streaming = False
+    try:
+        response = await asyncio.wait_for(client.post(MURF_API_URL, json=payload, headers=headers), remaining())
+        response.raise_for_status()
+        data = response.json()
+
+        audio_url = data.get("audioFile")
+        if not audio_url:
+            record_provider_error("murf", "MissingAudioFile")
+            logger.error("Murf response missing audioFile: %s", data)
+            return
+
+        audio_response = await asyncio.wait_for(
+            client.send(client.build_request("GET", audio_url), stream=True), remaining()
+        )
+        try:
+            audio_response.raise_for_status()
+            chunks = audio_response.aiter_bytes(chunk_size)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining())
+                except StopAsyncIteration:
+                    break
+                streaming = True
+                yield chunk
+        finally:
+            await audio_response.aclose()
+
+        observe_provider("murf", time.perf_counter() - started)
+
+    except asyncio.TimeoutError as e:
+        record_provider_error("murf", e)
+        logger.error("TTS stream error: timed out after %.2fs", timeout)
+        if streaming:
+            raise
+    except Exception as e:
+        record_provider_error("murf", e)
+        logger.error("TTS stream error: %s", e)
+        if streaming:
+            raise
+
+
+def speak(text: str, voice_id: str = "en-US-natalie", format: str = "MP3", api_key: str = None):
+    """
+    Wrapper to synthesize speech using Murf API.
+    Returns audio bytes or None.
+    """
+    global _sync_session
+    if _sync_session is None:
+        _sync_session = requests.Session()
+
+    headers, payload = _build_request(text, voice_id, format, api_key)
+    timeout = (MURF_TIMEOUT.connect, MURF_TIMEOUT.read)
 
     try:
-        response = requests.post(MURF_API_URL, json=payload, headers=headers)
+        response = _sync_session.post(MURF_API_URL, json=payload, headers=headers, timeout=timeout)
         response.raise_for_status()
         data = response.json()
 
@@ -34,10 +192,10 @@ def speak(text: str, voice_id: str = "en-US-natalie", format: str = "MP3"):
             logger.error("Murf response missing audioFile: %s", data)
             return None
 
-        audio_response = requests.get(audio_url)
+        audio_response = _sync_session.get(audio_url, timeout=timeout)
         audio_response.raise_for_status()
         return audio_response.content
 
     except Exception as e:
         logger.error("TTS error: %s", e)
-        return None
\ No newline at end of file
+        return None
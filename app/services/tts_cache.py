@@ -0,0 +1,210 @@
+# app/services/tts_cache.py
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_MEMORY_ENTRIES = int(os.getenv("TTS_CACHE_MEMORY_ENTRIES", "2000"))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different spellings of a phrase share an entry."""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def cache_key(voice_id: str, text: str, format: str = "mp3") -> str:
+    """Content address for a synthesized phrase (only what the Murf request depends on)."""
+    raw = "\x1f".join([voice_id, normalize_text(text), format.lower()])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """
+    Two-tier cache for synthesized audio: a bounded in-memory LRU in front of a
+    size-capped on-disk store. Disk entries are evicted oldest-access first.
+    The cache directory is created (and measured) on the first write, not at construction.
+    """
+
+    def __init__(
+            self,
+            cache_dir: Optional[str] = TTS_CACHE_DIR,
+            max_memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+            max_memory_entries: int = TTS_CACHE_MEMORY_ENTRIES,
+            max_disk_bytes: int = TTS_CACHE_DISK_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._disk_ready = False
+        self._lock = threading.Lock()
+        # Serializes disk-tier writes, size accounting and eviction; kept apart from _lock so memory hits
+        # (served on the event loop) never wait on a directory scan
+        self._disk_lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def _prepare_disk(self) -> bool:
+        """Create the cache directory and measure what it already holds, once (disk lock held)."""
+        if not self._disk_ready:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                                       if entry.is_file())
+            except OSError as e:
+                logger.warning(f"TTS disk cache disabled: {e}")
+                self.cache_dir = None
+                return False
+            self._disk_ready = True
+        return True
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.audio")
+
+    def _remember(self, key: str, audio: bytes):
+        """Insert into the memory tier and evict least recently used entries (lock held)."""
+        if len(audio) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+
+        while self._memory and (self._memory_bytes > self.max_memory_bytes
+                                or len(self._memory) > self.max_memory_entries):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats["memory_evictions"] += 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return audio
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)  # Refresh access time for disk eviction order
+            except FileNotFoundError:
+                audio = None
+            except OSError as e:
+                logger.warning(f"TTS disk cache read failed: {e}")
+                audio = None
+
+            if audio is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, audio)
+                return audio
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+
+        with self._lock:
+            self._remember(key, audio)
+            self._stats["stores"] += 1
+
+        if not self.cache_dir or len(audio) > self.max_disk_bytes:
+            return
+
+        with self._disk_lock:
+            if not self._prepare_disk():
+                return
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                existed = os.path.exists(path)
+                with open(tmp_path, "wb") as f:
+                    f.write(audio)
+                os.replace(tmp_path, path)
+                if not existed:
+                    self._disk_bytes += len(audio)
+            except OSError as e:
+                logger.warning(f"TTS disk cache write failed: {e}")
+                return
+
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """Drop least recently accessed files until the disk tier is back under 90% of its cap (disk lock held)."""
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.cache_dir)
+                 if entry.is_file() and entry.name.endswith(".audio")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except OSError as e:
+            logger.warning(f"TTS disk cache scan failed: {e}")
+            return
+
+        target = int(self.max_disk_bytes * 0.9)
+        for entry in entries:
+            if self._disk_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
+            with self._lock:
+                self._stats["disk_evictions"] += 1
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        """Async lookup; memory hits are served inline, disk reads go to a worker thread."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return audio
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, audio: bytes):
+        await asyncio.to_thread(self.put, key, audio)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = self._stats.copy()
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# Process-wide cache shared by every session
+tts_cache = TTSAudioCache()
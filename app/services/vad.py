@@ -0,0 +1,171 @@
+# app/services/vad.py
+import logging
+import os
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+from app.services.audio_buffer import STT_MAX_TURN_SILENCE_MS
+
+logger = logging.getLogger(__name__)
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") not in ("0", "false", "False")
+
+# Keep forwarding this long after the last speech frame so the transcriber can detect end of turn itself;
+# it must outlast the transcriber's max_turn_silence, or an unconfident end of turn waits for a keepalive,
+# so a shorter setting is raised to that floor (with a warning)
+VAD_HANGOVER_MS = max(int(os.getenv("VAD_HANGOVER_MS", "0")), STT_MAX_TURN_SILENCE_MS + 300)
+
+if "VAD_HANGOVER_MS" in os.environ and VAD_HANGOVER_MS > int(os.environ["VAD_HANGOVER_MS"]):
+    logger.warning(f"VAD_HANGOVER_MS={os.environ['VAD_HANGOVER_MS']} is shorter than STT_MAX_TURN_SILENCE_MS + 300; "
+                   f"using {VAD_HANGOVER_MS}")
+# Audio kept from just before speech onset so the first syllable isn't clipped
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))
+# During long silences, forward one chunk this often so the upstream session stays alive
+VAD_KEEPALIVE_MS = int(os.getenv("VAD_KEEPALIVE_MS", "5000"))
+
+
+class VoiceActivityDetector:
+    """
+    Energy + zero-crossing voice activity detector for 16-bit mono PCM.
+    Each incoming chunk is split into short analysis frames and scored in one vectorized pass;
+    silent chunks outside the hangover window are dropped (thinned to a periodic keepalive).
+    """
+
+    def __init__(
+            self,
+            sample_rate: int = 16000,
+            frame_ms: int = 20,
+            energy_threshold_db: float = -50.0,
+            noise_margin_db: float = 10.0,
+            zcr_max: float = 0.35,
+            hangover_ms: int = VAD_HANGOVER_MS,
+            preroll_ms: int = VAD_PREROLL_MS,
+            keepalive_ms: int = VAD_KEEPALIVE_MS,
+            on_speech_start: Optional[Callable[[], None]] = None,
+            on_speech_end: Optional[Callable[[], None]] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_samples = max(1, sample_rate * frame_ms // 1000)
+        self.energy_threshold_db = energy_threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.zcr_max = zcr_max
+        self.hangover_s = hangover_ms / 1000
+        self.preroll_s = preroll_ms / 1000
+        self.keepalive_s = keepalive_ms / 1000
+        self.on_speech_start = on_speech_start
+        self.on_speech_end = on_speech_end
+
+        self._noise_floor_db = energy_threshold_db - noise_margin_db
+        self._in_speech = False
+        self._hangover_left = 0.0
+        self._since_forward = 0.0
+        self._preroll: "deque[bytes]" = deque()
+        self._preroll_duration = 0.0
+        self._stats = {
+            "speech_seconds": 0.0,
+            "silence_seconds": 0.0,
+            "forwarded_bytes": 0,
+            "dropped_bytes": 0,
+            "speech_segments": 0,
+            "last_speech_end": None,
+        }
+
+    def _classify(self, samples: np.ndarray) -> bool:
+        """Return True if any analysis frame in the chunk looks like speech."""
+        n_frames = len(samples) // self.frame_samples
+        if n_frames == 0:
+            frames = samples.reshape(1, -1)
+        else:
+            frames = samples[:n_frames * self.frame_samples].reshape(n_frames, self.frame_samples)
+
+        frames = frames.astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+        energy_db = 20.0 * np.log10(rms)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(1, frames.shape[1] - 1)
+
+        threshold = max(self.energy_threshold_db, self._noise_floor_db + self.noise_margin_db)
+        # High zero-crossing rate at modest energy is hiss, not voice
+        voiced = (energy_db > threshold) & ((zcr < self.zcr_max) | (energy_db > threshold + 10.0))
+
+        if not voiced.any():
+            # Track the background level from the quietest frame so the threshold adapts to the room
+            self._noise_floor_db = 0.95 * self._noise_floor_db + 0.05 * float(energy_db.min())
+            return False
+        return True
+
+    def process(self, chunk: bytes) -> List[bytes]:
+        """Feed one PCM chunk; returns the chunks that should be forwarded upstream (possibly none)."""
+        if len(chunk) < 2:
+            return []
+
+        samples = np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+        duration = len(samples) / self.sample_rate
+        is_speech = self._classify(samples)
+
+        if is_speech:
+            self._stats["speech_seconds"] += duration
+            self._hangover_left = self.hangover_s
+            forward = list(self._preroll) if not self._in_speech else []
+            self._preroll.clear()
+            self._preroll_duration = 0.0
+            if not self._in_speech:
+                self._in_speech = True
+                self._stats["speech_segments"] += 1
+                if self.on_speech_start:
+                    self.on_speech_start()
+            forward.append(chunk)
+            return self._forward(forward)
+
+        self._stats["silence_seconds"] += duration
+
+        if self._in_speech:
+            self._hangover_left -= duration
+            if self._hangover_left > 0:
+                return self._forward([chunk])
+            self._in_speech = False
+            self._stats["last_speech_end"] = time.time()
+            if self.on_speech_end:
+                self.on_speech_end()
+
+        # Silence: thin down to a periodic keepalive, holding a short pre-roll for the next onset
+        self._since_forward += duration
+        if self._since_forward >= self.keepalive_s:
+            self._drop_preroll()
+            return self._forward([chunk])
+
+        self._preroll.append(chunk)
+        self._preroll_duration += duration
+        while self._preroll and self._preroll_duration - self._chunk_duration(self._preroll[0]) >= self.preroll_s:
+            dropped = self._preroll.popleft()
+            self._preroll_duration -= self._chunk_duration(dropped)
+            self._stats["dropped_bytes"] += len(dropped)
+        return []
+
+    def _drop_preroll(self):
+        self._stats["dropped_bytes"] += sum(len(c) for c in self._preroll)
+        self._preroll.clear()
+        self._preroll_duration = 0.0
+
+    def _chunk_duration(self, chunk: bytes) -> float:
+        return len(chunk) / 2 / self.sample_rate
+
+    def _forward(self, chunks: List[bytes]) -> List[bytes]:
+        self._since_forward = 0.0
+        self._stats["forwarded_bytes"] += sum(len(c) for c in chunks)
+        return chunks
+
+    @property
+    def in_speech(self) -> bool:
+        return self._in_speech
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._stats.copy()
+        total = stats["forwarded_bytes"] + stats["dropped_bytes"]
+        stats["forwarded_ratio"] = stats["forwarded_bytes"] / total if total else 1.0
+        stats["noise_floor_db"] = round(self._noise_floor_db, 1)
+        stats["in_speech"] = self._in_speech
+        return stats
@@ -0,0 +1,168 @@
+# app/services/vector_index.py
+import glob
+import logging
+import os
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Smallest row capacity allocated for a user's matrix; it doubles as memories are added
+VECTOR_INDEX_MIN_ROWS = int(os.getenv("VECTOR_INDEX_MIN_ROWS", "1024"))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first, without sorting the whole array."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+class VectorIndex:
+    """
+    One user's embeddings as a memory-mapped float32 matrix (`<prefix>.<capacity>.vec.npy`) with the
+    matching memory ids (`<prefix>.<capacity>.ids.npy`, -1 for unused rows).
+    Rows are appended in id order; capacity doubles by writing a new pair of files, so a mapping that
+    is still being searched is never resized underneath a reader.
+    """
+
+    def __init__(self, prefix: str, dim: int):
+        self.prefix = prefix
+        self.dim = dim
+        self._vecs: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def mapped(self) -> bool:
+        return self._vecs is not None
+
+    @property
+    def max_id(self) -> int:
+        return int(self._ids[self._count - 1]) if self._count else 0
+
+    def _paths(self, capacity: int) -> Tuple[str, str]:
+        return f"{self.prefix}.{capacity}.vec.npy", f"{self.prefix}.{capacity}.ids.npy"
+
+    def _existing_capacities(self):
+        capacities = []
+        for path in glob.glob(glob.escape(self.prefix) + ".*.vec.npy"):
+            try:
+                capacities.append(int(path[len(self.prefix) + 1:-len(".vec.npy")]))
+            except ValueError:
+                continue
+        return sorted(capacities)
+
+    def _remove_files(self):
+        for capacity in self._existing_capacities():
+            for path in self._paths(capacity):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # Still mapped on Windows; replaced on the next rebuild
+
+    def load(self) -> bool:
+        """Map the newest files from disk. Returns False if there are none or they don't match `dim`."""
+        capacities = self._existing_capacities()
+        if not capacities:
+            return False
+        vec_path, ids_path = self._paths(capacities[-1])
+        try:
+            vecs = np.load(vec_path, mmap_mode="r+")
+            ids = np.load(ids_path, mmap_mode="r+")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable vector index {vec_path}: {e}")
+            return False
+        if vecs.ndim != 2 or vecs.shape[1] != self.dim or len(ids) != len(vecs):
+            return False
+        unused = np.flatnonzero(ids < 0)
+        with self._lock:
+            self._vecs, self._ids = vecs, ids
+            self._count = int(unused[0]) if len(unused) else len(ids)
+        return True
+
+    def _allocate(self, capacity: int) -> Tuple[np.memmap, np.memmap]:
+        os.makedirs(os.path.dirname(self.prefix) or ".", exist_ok=True)
+        vec_path, ids_path = self._paths(capacity)
+        vecs = np.lib.format.open_memmap(vec_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        ids = np.lib.format.open_memmap(ids_path, mode="w+", dtype=np.int64, shape=(capacity,))
+        ids[:] = -1
+        return vecs, ids
+
+    @staticmethod
+    def _capacity_for(rows: int) -> int:
+        capacity = VECTOR_INDEX_MIN_ROWS
+        while capacity < rows:
+            capacity *= 2
+        return capacity
+
+    def rebuild(self, ids: np.ndarray, vectors: np.ndarray):
+        """Replace the index with `vectors` (row i belongs to memory ids[i]; ids ascending)."""
+        n = len(ids)
+        capacity = self._capacity_for(n)
+        with self._lock:
+            self._vecs = self._ids = None
+            self._remove_files()
+            vecs, id_map = self._allocate(capacity)
+            if n:
+                vecs[:n] = vectors
+                id_map[:n] = ids
+            self._vecs, self._ids, self._count = vecs, id_map, n
+
+    def append(self, memory_id: int, vector: np.ndarray):
+        with self._lock:
+            if self._vecs is None:
+                return
+            if self._count == len(self._ids):
+                # Full: copy into files twice the size, then drop the old pair
+                vecs, ids = self._allocate(len(self._ids) * 2)
+                vecs[:self._count] = self._vecs[:self._count]
+                ids[:self._count] = self._ids[:self._count]
+                old_capacity = len(self._ids)
+                self._vecs, self._ids = vecs, ids
+                for path in self._paths(old_capacity):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self._vecs[self._count] = vector
+            # Id last: a row only counts once its vector is in place
+            self._ids[self._count] = memory_id
+            self._count += 1
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(memory ids, cosine scores) of the k nearest rows, best first. Vectors are L2-normalized."""
+        with self._lock:
+            vecs, ids, n = self._vecs, self._ids, self._count
+        if vecs is None or not n:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = vecs[:n] @ np.asarray(query, dtype=np.float32)
+        best = top_k(scores, k)
+        return np.asarray(ids[best]), scores[best]
+
+    def flush(self):
+        with self._lock:
+            if self._vecs is not None:
+                self._vecs.flush()
+                self._ids.flush()
+
+    def drop(self):
+        """Forget the index and delete its files."""
+        with self._lock:
+            self._vecs = self._ids = None
+            self._count = 0
+            self._remove_files()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self._count,
+            "capacity": len(self._ids) if self._ids is not None else 0,
+            "dim": self.dim,
+        }
@@ -0,0 +1,163 @@
+# benchmarks/memory_search.py
+"""
+MemoryManager retrieval benchmark: FTS5/BM25 search_simple against the old LIKE '%query%' scan.
+
+For each row count it builds a throwaway database through the pre-FTS schema, times the
+migration that backfills the full-text index, then runs the same random queries through both paths:
+
+    python -m benchmarks.memory_search --rows 100000,1000000 --users 100 --queries 200
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from app.services.memory import MemoryManager
+
+COMMON_WORDS = (
+    "coffee tea python music guitar piano travel paris tokyo london hiking running swimming "
+    "birthday meeting project deadline doctor dentist allergy peanut vegetarian pizza sushi "
+    "weather rain sunny movie book novel podcast sister brother mother father dog cat garden "
+    "budget salary invoice flight hotel train morning evening weekend holiday exam homework"
+).split()
+# Filler that makes up a share of every sentence, as in real speech
+FILLER_WORDS = "i my the a to and is was of in for on with that it".split()
+_SYLLABLES = "ka lo mi ne ru sa ti vo ze ba do fu gi ha ju ke".split()
+
+
+def vocabulary(size: int) -> List[str]:
+    """Common words followed by made-up ones, so word frequency has a long tail."""
+    words = list(COMMON_WORDS)
+    i = 0
+    while len(words) < size:
+        n, word = i, ""
+        for _ in range(3):
+            word += _SYLLABLES[n % len(_SYLLABLES)]
+            n //= len(_SYLLABLES)
+        words.append(word + str(i // len(_SYLLABLES) ** 3))
+        i += 1
+    return words
+
+
+def zipf_weights(n: int, shift: int = 20) -> List[float]:
+    """Cumulative Zipf-Mandelbrot weights (for random.choices): the word at `rank` gets a 1/(rank + shift) share."""
+    return list(itertools.accumulate(1.0 / (rank + shift) for rank in range(n)))
+
+
+def sentence(rng: random.Random, words: List[str], weights: List[float]) -> str:
+    content = rng.choices(words, cum_weights=weights, k=rng.randint(4, 10))
+    filler = rng.choices(FILLER_WORDS, k=rng.randint(2, 6))
+    mixed = content + filler
+    rng.shuffle(mixed)
+    return " ".join(mixed)
+
+
+def build_legacy_db(path: str, rows: int, users: int, words: List[str], seed: int = 7):
+    """The schema as it was before full-text search, filled with synthetic memories."""
+    rng = random.Random(seed)
+    weights = zipf_weights(len(words))
+    now = datetime.now(timezone.utc)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+    CREATE TABLE memory (
+        id INTEGER PRIMARY KEY, user_id TEXT, text TEXT, metadata TEXT,
+        created_at TEXT, summarized INTEGER DEFAULT 0
+    )
+    """)
+    conn.executemany(
+        "INSERT INTO memory (user_id, text, metadata, created_at) VALUES (?,?,?,?)",
+        (
+            (
+                f"user{rng.randrange(users)}",
+                sentence(rng, words, weights),
+                "{}",
+                (now - timedelta(seconds=i)).isoformat(),
+            )
+            for i in range(rows)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"mean": statistics.fmean(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def time_queries(fn, queries) -> List[float]:
+    samples = []
+    for user_id, query in queries:
+        t0 = time.perf_counter()
+        fn(user_id, query, 5)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run(rows: int, users: int, vocab: int, n_queries: int, seed: int):
+    rng = random.Random(seed)
+    words = vocabulary(vocab)
+    weights = zipf_weights(len(words))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        build_legacy_db(path, rows, users, words, seed)
+        print(f"\n== {rows:,} rows, {users} users, {vocab} words (built in {time.perf_counter() - t0:.1f}s)")
+
+        t0 = time.perf_counter()
+        manager = MemoryManager(path).open()
+        print(f"migration + FTS backfill: {time.perf_counter() - t0:.2f}s (fts_enabled={manager.fts_enabled})")
+
+        # Mix of single words, word prefixes and two-word queries, drawn with the same word frequencies
+        queries = []
+        for _ in range(n_queries):
+            kind = rng.random()
+            if kind < 0.4:
+                query = rng.choices(words, cum_weights=weights)[0]
+            elif kind < 0.7:
+                query = rng.choices(words, cum_weights=weights)[0][:4]
+            else:
+                # e.g. "my coffee dentist": LIKE looks for the literal string
+                query = " ".join([rng.choice(FILLER_WORDS)] + rng.choices(words, cum_weights=weights, k=2))
+            queries.append((f"user{rng.randrange(users)}", query))
+
+        # Warm the page cache so both paths are measured from memory
+        manager.search_simple(*queries[0], 5)
+        manager._search_like(*queries[0], 5)
+
+        for name, fn in (("LIKE", manager._search_like), ("FTS5", manager.search_simple)):
+            stats = percentiles(time_queries(fn, queries))
+            print(f"{name:5s} mean {stats['mean']:7.2f} ms  p50 {stats['p50']:7.2f}  "
+                  f"p95 {stats['p95']:7.2f}  p99 {stats['p99']:7.2f}")
+
+        # Multi-word queries the substring scan cannot answer (words not adjacent in the text)
+        multi = [(u, q) for u, q in queries if " " in q]
+        like_hits = sum(bool(manager._search_like(u, q, 5)) for u, q in multi)
+        fts_hits = sum(bool(manager.search_simple(u, q, 5)) for u, q in multi)
+        print(f"multi-word queries with results: LIKE {like_hits}/{len(multi)}  FTS5 {fts_hits}/{len(multi)}")
+        manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MemoryManager search: FTS5 vs LIKE")
+    parser.add_argument("--rows", default="100000,1000000", help="Comma-separated row counts")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--vocab", type=int, default=20000, help="Distinct words in the synthetic text")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for rows in (int(r) for r in args.rows.split(",")):
+        run(rows, args.users, args.vocab, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
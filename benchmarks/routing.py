@@ -0,0 +1,172 @@
+# benchmarks/routing.py
+"""
+Intent/tool routing benchmark: the RoutingEngine against the checks it replaced (the per-module
+trigger substring lists plus analyze_query_intent's per-intent re.findall loop), which each turn ran
+one after the other. Throughput is measured on a synthetic spoken-query corpus, accuracy on the
+hand-labelled cases in routing_fixtures.json. Those labels say what the product should do with each
+question (a rain forecast waits for search, a joke never searches), not what either router returns:
+
+    python -m benchmarks.routing --queries 200000 --seed 7
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, Any, List
+
+from app.services.router import RoutingEngine, router
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "routing_fixtures.json")
+
+# Legacy routing, copied from before the router: app.py's and agent.py's trigger lists...
+LEGACY_APP_TRIGGERS = ["latest", "today", "current", "news", "price", "weather"]
+LEGACY_AGENT_TRIGGERS = [
+    "latest", "today", "yesterday", "current", "now", "recent",
+    "price", "cost", "stock", "market", "news", "weather",
+    "2024", "2025", "this year", "last year"
+]
+# ...and analyze_query_intent's patterns, compiled by re's cache on every call
+LEGACY_INTENT_PATTERNS = {
+    'current_info': [
+        r'\b(today|now|current|latest|recent)\b',
+        r'\b(what\'s|whats) (happening|new)\b',
+        r'\b(this (year|month|week))\b'
+    ],
+    'financial': [
+        r'\b(price|cost|stock|market|trading)\b',
+        r'\b(USD|EUR|bitcoin|crypto)\b'
+    ],
+    'weather': [
+        r'\b(weather|temperature|rain|snow)\b'
+    ],
+    'news': [
+        r'\b(news|breaking|headline|announced)\b'
+    ],
+    'factual': [
+        r'\b(what is|who is|where is|when is|how)\b',
+        r'\b(define|explain|meaning)\b'
+    ]
+}
+LEGACY_SEARCH_INTENTS = ['current_info', 'financial', 'weather', 'news']
+
+
+def legacy_needs_web_search(query: str) -> bool:
+    query_lower = query.lower()
+    return any(trigger in query_lower for trigger in LEGACY_APP_TRIGGERS)
+
+
+def legacy_analyze_query_intent(query: str) -> Dict[str, Any]:
+    query_lower = query.lower()
+    detected_intents = {}
+    for intent, patterns in LEGACY_INTENT_PATTERNS.items():
+        score = 0
+        for pattern in patterns:
+            score += len(re.findall(pattern, query_lower))
+        if score > 0:
+            detected_intents[intent] = score
+    return {
+        'intents': detected_intents,
+        'needs_search': any(intent in detected_intents for intent in LEGACY_SEARCH_INTENTS),
+        'primary_intent': max(detected_intents, key=detected_intents.get) if detected_intents else 'general'
+    }
+
+
+def legacy_route(query: str):
+    """What one streamed turn used to evaluate: the search trigger check, then the response cache's intent check."""
+    return legacy_needs_web_search(query), legacy_analyze_query_intent(query)
+
+
+SUBJECTS = (
+    "london paris tokyo the eiffel tower bitcoin tesla apple the fed interest rates my sister the mars rover "
+    "photosynthesis the roman empire jazz python pasta the world cup my dentist appointment the premier league"
+).split(" ")
+TEMPLATES = [
+    "what's the weather in {s} {t}", "what is the {t} price of {s}", "tell me the latest news about {s}",
+    "how does {s} work", "who is {s}", "explain {s} to me", "do you remember what i said about {s}",
+    "what did we talk about last time", "tell me a joke about {s}", "how much does {s} cost",
+    "is it going to rain in {s} {t}", "what happened with {s} in 2023", "any breaking headlines on {s}",
+    "um so can you like tell me about {s}", "what's new with {s}", "write a short poem about {s}",
+    "remind me about {s}", "thanks that was really helpful", "what are {s} shares trading at right now",
+    "i think {s} is interesting but i don't really know much about it could you help me understand",
+]
+TIMES = ["today", "tomorrow", "now", "this week", "", "tonight", "this year"]
+
+
+def corpus(n: int, seed: int) -> List[str]:
+    """Synthetic spoken queries: templates with random subjects and times, in random case."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        query = rng.choice(TEMPLATES).format(s=rng.choice(SUBJECTS), t=rng.choice(TIMES)).strip()
+        if rng.random() < 0.3:
+            query = query.capitalize() + "?"
+        queries.append(query)
+    return queries
+
+
+def throughput(fn, queries: List[str]) -> float:
+    t0 = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return len(queries) / (time.perf_counter() - t0)
+
+
+def search_mode(route) -> str:
+    if route.needs_search:
+        return "blocking"
+    return "skipped" if route.wants("search") else "none"
+
+
+def accuracy(engine: RoutingEngine):
+    with open(FIXTURES) as f:
+        cases = json.load(f)
+    legacy = {"primary_intent": 0, "search": 0}
+    routed = {"primary_intent": 0, "search": 0}
+    misses = []
+    for case in cases:
+        needs_search, intent = legacy_route(case["query"])
+        legacy["primary_intent"] += intent["primary_intent"] == case["primary_intent"]
+        # The old code had no middle band: a question either waited for search or got none
+        legacy["search"] += ("blocking" if needs_search else "none") == case["search"]
+
+        route = engine.route(case["query"])
+        ok_intent = route.primary_intent == case["primary_intent"]
+        ok_search = search_mode(route) == case["search"]
+        routed["primary_intent"] += ok_intent
+        routed["search"] += ok_search
+        if not (ok_intent and ok_search):
+            misses.append((case, route.primary_intent, search_mode(route)))
+
+    total = len(cases)
+    print(f"\n== accuracy on {total} fixtures")
+    for name, scores in (("legacy", legacy), ("router", routed)):
+        print(f"{name:7s} primary intent {scores['primary_intent']:3d}/{total}  "
+              f"search mode {scores['search']:3d}/{total}")
+    for case, intent, mode in misses:
+        print(f"  router miss: {case['query']!r}: {intent}/{mode}, "
+              f"expected {case['primary_intent']}/{case['search']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark intent/tool routing: RoutingEngine vs legacy checks")
+    parser.add_argument("--queries", type=int, default=200000, help="Synthetic queries to route")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation; the best is reported")
+    args = parser.parse_args()
+
+    queries = corpus(args.queries, args.seed)
+    print(f"== throughput on {len(queries):,} synthetic queries (best of {args.repeat})")
+    results = {}
+    for name, fn in (("legacy", legacy_route), ("router", router.route)):
+        fn(queries[0])  # Compile patterns outside the timing
+        results[name] = max(throughput(fn, queries) for _ in range(args.repeat))
+        print(f"{name:7s} {results[name]:12,.0f} routes/s  {1e6 / results[name]:7.2f} µs/route")
+    print(f"speedup {results['router'] / results['legacy']:.2f}x")
+
+    accuracy(router)
+
+
+if __name__ == "__main__":
+    main()
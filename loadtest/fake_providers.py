@@ -0,0 +1,311 @@
+# loadtest/fake_providers.py
+"""
+Local stand-ins for AssemblyAI streaming, Gemini, Murf and SerpAPI with configurable
+latency and error distributions, for capacity planning without touching the real providers.
+
+Run:
+    python -m loadtest.fake_providers --port 9100 --latency gemini=600:0.4 --errors murf=0.02
+
+Then start the app pointed at it:
+    ASSEMBLYAI_STREAMING_URL=ws://127.0.0.1:9100/v3/ws \\
+    GEMINI_API_ENDPOINT=http://127.0.0.1:9100 \\
+    MURF_API_URL=http://127.0.0.1:9100/v1/speech/generate \\
+    SERPAPI_BACKEND=http://127.0.0.1:9100 SERPAPI_KEY=fake \\
+    uvicorn app.app:app --port 8000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+logger = logging.getLogger("loadtest.fake_providers")
+
+# What the fake transcriber "hears"; some phrases trip the search triggers
+CANNED_TRANSCRIPTS = [
+    "What is an API?",
+    "Explain recursion in simple terms.",
+    "What's the weather today in London?",
+    "How does a hash map work?",
+    "What is the latest news about AI?",
+    "Can you draw a flowchart of a web request?",
+]
+
+CANNED_REPLY = (
+    "Great question! Here is a short answer. "
+    "An API is a contract that lets two programs talk to each other. "
+    "You send a request in an agreed format and get a response back. "
+    "Think of it like a restaurant menu for software."
+)
+
+
+@dataclass
+class ProviderProfile:
+    """Latency is lognormal around median_ms with shape sigma; error_rate is the chance a call fails."""
+    median_ms: float
+    sigma: float = 0.3
+    error_rate: float = 0.0
+
+    def sample_delay(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(np.log(self.median_ms / 1000.0), self.sigma)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+DEFAULT_PROFILES: Dict[str, ProviderProfile] = {
+    "assemblyai": ProviderProfile(300),     # final transcript after endpoint silence
+    "gemini": ProviderProfile(500),         # time to first token
+    "gemini_token": ProviderProfile(40),    # gap between streamed chunks
+    "murf": ProviderProfile(350),           # generate call
+    "murf_download": ProviderProfile(60),   # audioFile download, time to first byte
+    "murf_chunk": ProviderProfile(5),       # gap between 4 KB pieces of the download
+    "serpapi": ProviderProfile(700),
+}
+
+
+def create_app(profiles: Dict[str, ProviderProfile], endpoint_silence_ms: int = 700,
+               partial_word_ms: int = 250) -> FastAPI:
+    app = FastAPI(title="Fake voice-agent providers")
+    stats = {name: {"calls": 0, "errors": 0} for name in ("assemblyai", "gemini", "murf", "serpapi")}
+    audio_store: Dict[str, bytes] = {}
+
+    def record(name: str, failed: bool):
+        stats[name]["calls"] += 1
+        if failed:
+            stats[name]["errors"] += 1
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    # AssemblyAI v3 streaming
+    @app.websocket("/v3/ws")
+    async def assemblyai_stream(websocket: WebSocket):
+        await websocket.accept()
+        profile = profiles["assemblyai"]
+        sample_rate = int(websocket.query_params.get("sample_rate", 16000))
+        formatted = websocket.query_params.get("format_turns", "false") == "true"
+        failed = profile.should_fail()
+        record("assemblyai", failed)
+        if failed:
+            await websocket.send_json({"type": "Error", "error": "Simulated AssemblyAI failure"})
+            await websocket.close()
+            return
+
+        await websocket.send_json({"type": "Begin", "id": uuid.uuid4().hex})
+        heard_speech = False
+        silence_s = 0.0
+        speech_s = 0.0
+        audio_s = 0.0
+        revealed = 0
+        turn = 0
+
+        async def emit_partial(text: str, words: int):
+            # Partials are unformatted, like the real service's
+            partial = " ".join(text.lower().rstrip("?.").split()[:words])
+            await websocket.send_json({"type": "Turn", "transcript": partial, "end_of_turn": False})
+
+        async def emit_final(text: str):
+            await asyncio.sleep(profile.sample_delay())
+            if formatted:
+                await websocket.send_json({"type": "Turn", "transcript": text.lower().rstrip("?."),
+                                           "end_of_turn": True, "turn_is_formatted": False})
+            await websocket.send_json({"type": "Turn", "transcript": text,
+                                       "end_of_turn": True, "turn_is_formatted": formatted})
+
+        try:
+            while True:
+                message = await websocket.receive()
+                if message.get("type") == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    samples = np.frombuffer(message["bytes"], dtype=np.int16).astype(np.float32)
+                    duration = len(samples) / sample_rate
+                    audio_s += duration
+                    loud = len(samples) and np.sqrt(np.mean(samples * samples)) > 500
+                    text = CANNED_TRANSCRIPTS[turn % len(CANNED_TRANSCRIPTS)]
+                    if loud:
+                        if not heard_speech:
+                            speech_s = 0.0
+                            revealed = 0
+                        heard_speech = True
+                        silence_s = 0.0
+                        # One more word every partial_word_ms of speech; the last one once the speaker pauses
+                        speech_s += duration
+                        words = min(len(text.split()) - 1, 1 + int(speech_s * 1000 / partial_word_ms))
+                        if words > revealed:
+                            revealed = words
+                            await emit_partial(text, words)
+                    elif heard_speech:
+                        silence_s += duration
+                        if revealed < len(text.split()) and silence_s * 1000 >= 150:
+                            revealed = len(text.split())
+                            await emit_partial(text, revealed)
+                        if silence_s * 1000 >= endpoint_silence_ms:
+                            asyncio.create_task(emit_final(text))
+                            turn += 1
+                            heard_speech = False
+                            silence_s = 0.0
+                elif message.get("text"):
+                    if json.loads(message["text"]).get("type") == "Terminate":
+                        await websocket.send_json({"type": "Termination", "audio_duration_seconds": audio_s})
+                        break
+        except WebSocketDisconnect:
+            pass
+
+    # Gemini REST (generateContent / streamGenerateContent)
+    def estimate_tokens(payload) -> int:
+        return len(json.dumps(payload)) // 4
+
+    def gemini_chunk(text: str, final: bool, usage: dict = None) -> dict:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if final:
+            candidate["finishReason"] = 1
+        return {"candidates": [candidate],
+                "usageMetadata": {**(usage or {"promptTokenCount": 900}), "candidatesTokenCount": len(text) // 4}}
+
+    async def prompt_usage(request: Request) -> dict:
+        """Usage for a generate request: the system instruction and contents it actually sent."""
+        body = await request.json()
+        return {"promptTokenCount": estimate_tokens({k: body.get(k) for k in ("contents", "systemInstruction")})}
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def gemini_generate(model: str, request: Request):
+        usage = await prompt_usage(request)
+        profile = profiles["gemini"]
+        await asyncio.sleep(profile.sample_delay())
+        failed = profile.should_fail()
+        record("gemini", failed)
+        if failed:
+            return JSONResponse({"error": {"code": 503, "message": "Simulated Gemini overload",
+                                           "status": "UNAVAILABLE"}}, status_code=503)
+        return gemini_chunk(CANNED_REPLY, True, usage)
+
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def gemini_stream(model: str, request: Request):
+        usage = await prompt_usage(request)
+        profile = profiles["gemini"]
+        failed = profile.should_fail()
+        record("gemini", failed)
+        if failed:
+            await asyncio.sleep(profile.sample_delay())
+            return JSONResponse({"error": {"code": 503, "message": "Simulated Gemini overload",
+                                           "status": "UNAVAILABLE"}}, status_code=503)
+
+        words = CANNED_REPLY.split(" ")
+        pieces = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+
+        async def body():
+            await asyncio.sleep(profile.sample_delay())
+            yield "["
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(profiles["gemini_token"].sample_delay())
+                    yield ","
+                yield json.dumps(gemini_chunk(piece, i == len(pieces) - 1, usage))
+            yield "]"
+
+        return StreamingResponse(body(), media_type="application/json")
+
+    # Murf generate + audioFile download
+    @app.post("/v1/speech/generate")
+    async def murf_generate(request: Request):
+        profile = profiles["murf"]
+        payload = await request.json()
+        await asyncio.sleep(profile.sample_delay())
+        failed = profile.should_fail()
+        record("murf", failed)
+        if failed:
+            return JSONResponse({"errorMessage": "Simulated Murf failure"}, status_code=500)
+
+        # Roughly 1 KB of "MP3" per 10 characters (~32 kbit/s speech)
+        audio_id = uuid.uuid4().hex
+        audio_store[audio_id] = random.randbytes(max(1024, len(payload.get("text", "")) * 100))
+        return {"audioFile": f"{request.base_url}murf/audio/{audio_id}.mp3", "audioLengthInSeconds": 2.0}
+
+    @app.get("/murf/audio/{audio_id}.mp3")
+    async def murf_download(audio_id: str):
+        await asyncio.sleep(profiles["murf_download"].sample_delay())
+        audio = audio_store.pop(audio_id, None)
+        if audio is None:
+            return Response(status_code=404)
+
+        async def body():
+            # Trickle the file out so progressive delivery is observable
+            for start in range(0, len(audio), 4096):
+                if start:
+                    await asyncio.sleep(profiles["murf_chunk"].sample_delay())
+                yield audio[start:start + 4096]
+
+        return StreamingResponse(body(), media_type="audio/mpeg")
+
+    # SerpAPI
+    @app.get("/search")
+    async def serpapi_search(q: str = ""):
+        profile = profiles["serpapi"]
+        await asyncio.sleep(profile.sample_delay())
+        failed = profile.should_fail()
+        record("serpapi", failed)
+        if failed:
+            return {"error": "Simulated SerpAPI failure"}
+        return {"organic_results": [
+            {"title": f"Result for {q}", "snippet": "A plausible snippet about the topic.", "link": "https://example.com/1"},
+            {"title": "Second result", "snippet": "Another snippet.", "link": "https://example.com/2"},
+        ]}
+
+    return app
+
+
+def parse_overrides(items: List[str], field: str, profiles: Dict[str, ProviderProfile]):
+    """Apply NAME=VALUE overrides; latency values are MEDIAN_MS[:SIGMA]."""
+    for item in items or []:
+        name, _, value = item.partition("=")
+        if name not in profiles:
+            raise SystemExit(f"Unknown provider '{name}'. Choose from: {', '.join(profiles)}")
+        if field == "latency":
+            median, _, sigma = value.partition(":")
+            profiles[name].median_ms = float(median)
+            if sigma:
+                profiles[name].sigma = float(sigma)
+        else:
+            profiles[name].error_rate = float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake AssemblyAI / Gemini / Murf / SerpAPI servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=MEDIAN_MS[:SIGMA]",
+                        help=f"Providers: {', '.join(DEFAULT_PROFILES)}")
+    parser.add_argument("--errors", action="append", metavar="PROVIDER=RATE")
+    parser.add_argument("--endpoint-silence-ms", type=int, default=700,
+                        help="Trailing silence after which the fake transcriber ends a turn")
+    parser.add_argument("--partial-word-ms", type=int, default=250,
+                        help="Speech per additional word in the fake transcriber's partials")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    profiles = {name: ProviderProfile(p.median_ms, p.sigma, p.error_rate) for name, p in DEFAULT_PROFILES.items()}
+    parse_overrides(args.latency, "latency", profiles)
+    parse_overrides(args.errors, "errors", profiles)
+
+    import uvicorn
+    app = create_app(profiles, args.endpoint_silence_ms, args.partial_word_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# loadtest/load_generator.py
+"""
+Concurrent WebSocket load generator for /ws.
+
+Each simulated session sends the `config` message, then streams 16 kHz PCM derived from the
+repo's recorded .webm files (decoded with pydub/ffmpeg) at real time or faster, followed by
+trailing silence so the transcriber can end the turn. It records, per turn:
+
+    stt          end of speech      -> "final" message
+    llm_first    "final"            -> first "assistant_delta"
+    llm_total    "final"            -> "assistant" (turn complete, all audio sent)
+    tts_first    first delta        -> first binary audio frame
+    ttfa         end of speech      -> first binary audio frame (time to first audio)
+
+Run against the local stand-ins in loadtest.fake_providers:
+    python -m loadtest.load_generator --url ws://127.0.0.1:8000/ws --sessions 1,10,50 --turns 3 --speed 2
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+from app.services.audio_codecs import mulaw_encode
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 4096  # Same frame size the browser client sends
+STAGES = ["stt", "llm_first", "llm_total", "tts_first", "ttfa"]
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_clips(pattern: str, synthetic: bool) -> List[bytes]:
+    """Decode the recorded .webm files to 16-bit mono PCM (requires ffmpeg), or synthesize clips."""
+    if synthetic:
+        t = np.arange(int(SAMPLE_RATE * 2.0)) / SAMPLE_RATE
+        # Amplitude-modulated tone: loud enough for the VAD, varied enough to look voiced
+        clip = 6000 * np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+        return [clip.astype(np.int16).tobytes()]
+
+    from pydub import AudioSegment
+
+    clips = []
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, pattern), recursive=True)):
+        segment = AudioSegment.from_file(path).set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+        clips.append(segment.raw_data)
+    if not clips:
+        raise SystemExit(f"No audio clips matched {pattern!r}")
+    return clips
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class SessionResult:
+    def __init__(self):
+        self.turns: List[Dict[str, float]] = []
+        self.errors: List[str] = []
+        self.audio_frames = 0
+        self.audio_bytes = 0
+        self.upstream_bytes = 0
+
+
+def encode_clip(pcm: bytes, codec: str) -> bytes:
+    return mulaw_encode(pcm) if codec == "mulaw" else pcm
+
+
+async def run_session(url: str, clips: List[bytes], turns: int, speed: float, silence_s: float,
+                      turn_timeout: float, api_keys: Dict[str, str], offset: int,
+                      codec: str = "pcm16") -> SessionResult:
+    result = SessionResult()
+    silence = encode_clip(bytes(int(SAMPLE_RATE * silence_s) * 2), codec)
+    frame_bytes = FRAME_SAMPLES * (1 if codec == "mulaw" else 2)
+    frame_interval = FRAME_SAMPLES / SAMPLE_RATE / speed
+
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=30) as ws:
+            await ws.send(json.dumps({
+                "type": "config",
+                "apiKeys": api_keys,
+                "settings": {"voice": "en-US-natalie", "speechRate": 1.0},
+                "audioCodec": codec
+            }))
+
+            marks: Dict[str, float] = {}
+            turn_done = asyncio.Event()
+
+            async def receive():
+                async for message in ws:
+                    now = time.perf_counter()
+                    if isinstance(message, bytes):
+                        # Skip empty clip/turn-end markers (12-byte header only)
+                        if len(message) > 12:
+                            result.audio_frames += 1
+                            result.audio_bytes += len(message) - 12
+                            marks.setdefault("first_audio", now)
+                        continue
+                    msg = json.loads(message)
+                    kind = msg.get("type")
+                    if kind == "final":
+                        marks.setdefault("final", now)
+                    elif kind == "assistant_delta":
+                        marks.setdefault("first_delta", now)
+                    elif kind == "assistant":
+                        marks["assistant"] = now
+                        turn_done.set()
+                    elif kind == "error":
+                        result.errors.append(msg.get("text", "error"))
+
+            receiver = asyncio.create_task(receive())
+            try:
+                for turn in range(turns):
+                    clip = clips[(offset + turn) % len(clips)]
+                    marks.clear()
+                    turn_done.clear()
+
+                    next_send = time.perf_counter()
+                    for start in range(0, len(clip), frame_bytes):
+                        await ws.send(clip[start:start + frame_bytes])
+                        result.upstream_bytes += min(frame_bytes, len(clip) - start)
+                        next_send += frame_interval
+                        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+                    speech_end = time.perf_counter()
+
+                    async def send_silence():
+                        deadline = time.perf_counter()
+                        for start in range(0, len(silence), frame_bytes):
+                            await ws.send(silence[start:start + frame_bytes])
+                            result.upstream_bytes += min(frame_bytes, len(silence) - start)
+                            deadline += frame_interval
+                            await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+
+                    silence_task = asyncio.create_task(send_silence())
+                    try:
+                        await asyncio.wait_for(turn_done.wait(), timeout=turn_timeout)
+                    except asyncio.TimeoutError:
+                        result.errors.append("turn timeout")
+                        await silence_task
+                        continue
+                    await silence_task
+
+                    timings = {}
+                    if "final" in marks:
+                        timings["stt"] = marks["final"] - speech_end
+                        if "first_delta" in marks:
+                            timings["llm_first"] = marks["first_delta"] - marks["final"]
+                        timings["llm_total"] = marks["assistant"] - marks["final"]
+                    if "first_audio" in marks:
+                        timings["ttfa"] = marks["first_audio"] - speech_end
+                        if "first_delta" in marks:
+                            timings["tts_first"] = marks["first_audio"] - marks["first_delta"]
+                    result.turns.append(timings)
+            finally:
+                receiver.cancel()
+
+    except Exception as e:
+        result.errors.append(f"{type(e).__name__}: {e}")
+
+    return result
+
+
+async def run_level(args, clips: List[bytes], sessions: int) -> Dict[str, object]:
+    api_keys = {"gemini": "AIza-fake", "assembly": "fake-assembly-key", "murf": "fake-murf-key",
+                "serpapi": "fake-serpapi-key"}
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        run_session(args.url, clips, args.turns, args.speed, args.silence, args.turn_timeout, api_keys, i, args.codec)
+        for i in range(sessions)
+    ])
+    wall = time.perf_counter() - started
+
+    stages = {stage: [t[stage] * 1000 for r in results for t in r.turns if stage in t] for stage in STAGES}
+    completed = sum(len(r.turns) for r in results)
+    return {
+        "sessions": sessions,
+        "turns": completed,
+        "errors": sum(len(r.errors) for r in results),
+        "error_samples": [e for r in results for e in r.errors][:5],
+        "wall_seconds": round(wall, 2),
+        "turns_per_second": round(completed / wall, 2) if wall else 0.0,
+        "audio_frames": sum(r.audio_frames for r in results),
+        "upstream_bytes": sum(r.upstream_bytes for r in results),
+        "stages_ms": {
+            stage: {p: (round(percentile(values, q), 1) if values else None)
+                    for p, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+            for stage, values in stages.items()
+        },
+    }
+
+
+def print_report(level: Dict[str, object]):
+    print(f"\n=== {level['sessions']} concurrent sessions: {level['turns']} turns in {level['wall_seconds']}s "
+          f"({level['turns_per_second']} turns/s), {level['errors']} errors ===")
+    print(f"upstream audio sent: {level['upstream_bytes'] / 1e6:.2f} MB")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, pct in level["stages_ms"].items():
+        cells = "".join(f"{'-' if pct[p] is None else pct[p]:>10}" for p in ("p50", "p95", "p99"))
+        print(f"{stage:<12}{cells}")
+    for sample in level["error_samples"]:
+        print(f"  error: {sample}")
+
+
+async def main_async(args):
+    clips = [encode_clip(clip, args.codec) for clip in load_clips(args.clips, args.synthetic)]
+    levels = []
+    for sessions in [int(n) for n in args.sessions.split(",")]:
+        level = await run_level(args, clips, sessions)
+        print_report(level)
+        levels.append(level)
+
+    print("\nThroughput vs session count:")
+    print(f"{'sessions':>10}{'turns/s':>10}{'ttfa p95':>10}")
+    for level in levels:
+        ttfa = level["stages_ms"]["ttfa"]["p95"]
+        print(f"{level['sessions']:>10}{level['turns_per_second']:>10}{'-' if ttfa is None else ttfa:>10}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(levels, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /ws load generator")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    parser.add_argument("--sessions", default="1,10,50", help="Comma-separated concurrency levels to sweep")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--speed", type=float, default=1.0, help="Audio send rate relative to real time")
+    parser.add_argument("--silence", type=float, default=1.5, help="Seconds of trailing silence per turn")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--clips", default="**/*.webm", help="Glob (relative to the repo) of recordings to stream")
+    parser.add_argument("--synthetic", action="store_true", help="Use a generated tone instead of decoding .webm")
+    parser.add_argument("--codec", choices=["pcm16", "mulaw"], default="pcm16", help="Upstream audio codec")
+    parser.add_argument("--json", help="Also write the results to this file")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
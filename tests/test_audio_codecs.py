@@ -0,0 +1,41 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from app.services.audio_codecs import (
+    UPSTREAM_MULAW, UPSTREAM_PCM16, UpstreamDecoder, mulaw_decode, mulaw_encode, negotiate_codec,
+)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    audioop = pytest.importorskip("audioop")
+
+EVERY_SAMPLE = np.arange(-32768, 32768, dtype="<i2").tobytes()
+
+
+def test_mulaw_encode_matches_audioop():
+    assert mulaw_encode(EVERY_SAMPLE) == audioop.lin2ulaw(EVERY_SAMPLE, 2)
+
+
+def test_mulaw_decode_matches_audioop():
+    every_code = bytes(range(256))
+    assert mulaw_decode(every_code) == audioop.ulaw2lin(every_code, 2)
+
+
+def test_mulaw_round_trip_stays_within_quantization_error():
+    original = np.frombuffer(EVERY_SAMPLE, dtype="<i2").astype(np.int32)
+    decoded = np.frombuffer(mulaw_decode(mulaw_encode(EVERY_SAMPLE)), dtype="<i2").astype(np.int32)
+    # The coarsest µ-law step is 1024; decoding returns a value inside the step the sample fell in
+    assert np.abs(decoded - original).max() <= 1024
+
+
+def test_negotiation_falls_back_to_pcm():
+    assert negotiate_codec("PCMU") == UPSTREAM_MULAW
+    assert negotiate_codec("aac") == UPSTREAM_PCM16
+    assert negotiate_codec(None) == UPSTREAM_PCM16
+
+
+def test_upstream_decoder_expands_mulaw():
+    decoder = UpstreamDecoder(UPSTREAM_MULAW)
+    assert decoder.decode(mulaw_encode(b"\x00\x10" * 80)) == mulaw_decode(mulaw_encode(b"\x00\x10" * 80))
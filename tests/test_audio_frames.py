@@ -0,0 +1,30 @@
+import pytest
+
+from app.services.audio_frames import (
+    CODEC_PCM16, FLAG_CLIP_END, FLAG_STREAM, HEADER_SIZE, decode_audio_frame, encode_audio_frame,
+)
+
+
+def test_header_round_trip():
+    frame = encode_audio_frame(b"\x01\x02\x03", turn_id=7, seq=2, codec=CODEC_PCM16, flags=FLAG_STREAM)
+    assert len(frame) == HEADER_SIZE + 3
+    codec, flags, turn_id, seq, payload = decode_audio_frame(frame)
+    assert (codec, flags, turn_id, seq) == (CODEC_PCM16, FLAG_STREAM, 7, 2)
+    assert bytes(payload) == b"\x01\x02\x03"
+
+
+def test_header_layout_is_big_endian():
+    frame = encode_audio_frame(b"", turn_id=1, seq=0x0102, flags=FLAG_CLIP_END)
+    assert frame == bytes([1, 1, 0, FLAG_CLIP_END, 0, 0, 0, 1, 0, 0, 1, 2])
+
+
+def test_ids_wrap_at_32_bits():
+    _, _, turn_id, seq, _ = decode_audio_frame(encode_audio_frame(b"", turn_id=2 ** 32 + 5, seq=-1))
+    assert (turn_id, seq) == (5, 2 ** 32 - 1)
+
+
+def test_bad_frames_are_rejected():
+    with pytest.raises(ValueError):
+        decode_audio_frame(b"\x01\x01")
+    with pytest.raises(ValueError):
+        decode_audio_frame(b"\x09" + encode_audio_frame(b"", 1, 0)[1:])
@@ -0,0 +1,44 @@
+import time
+
+from app.services.budget import (
+    SEARCH_MIN_REMAINING, SHORT_REPLY_REMAINING, STAGE_CAPS, TTS_MIN_TIMEOUT, TurnBudget,
+)
+
+
+def budget_with(remaining: float, total: float = 12.0) -> TurnBudget:
+    return TurnBudget(total, started_at=time.monotonic() - (total - remaining))
+
+
+def test_fresh_budget_runs_every_stage_in_full():
+    budget = budget_with(12.0)
+    assert budget.can_afford(SEARCH_MIN_REMAINING)
+    assert budget.can_afford(SHORT_REPLY_REMAINING)
+    assert budget.timeout_for("search") == STAGE_CAPS["search"]
+    assert budget.timeout_for("llm") == STAGE_CAPS["llm"]
+
+
+def test_low_budget_skips_search_and_asks_for_a_short_reply():
+    budget = budget_with(5.0)
+    assert not budget.can_afford(SEARCH_MIN_REMAINING)
+    assert not budget.can_afford(SHORT_REPLY_REMAINING)
+    assert 4.9 < budget.timeout_for("llm") <= 5.0
+
+
+def test_spent_budget_still_leaves_tts_its_floor():
+    budget = budget_with(-1.0)
+    assert budget.expired
+    assert budget.remaining() == 0.0
+    assert budget.timeout_for("tts", floor=TTS_MIN_TIMEOUT) == TTS_MIN_TIMEOUT
+
+
+def test_report_records_stages_and_degradations():
+    budget = TurnBudget(10.0)
+    with budget.stage("search"):
+        pass
+    with budget.stage("search"):
+        pass
+    budget.degrade("search skipped")
+    report = budget.report()
+    assert report["budget"] == 10.0
+    assert list(report["stages"]) == ["search"]
+    assert report["degraded"] == ["search skipped"]
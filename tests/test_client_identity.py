@@ -0,0 +1,18 @@
+from app.services.client_identity import issue_client_token, verify_client_token
+
+
+def test_issued_token_verifies():
+    client_id, token = issue_client_token()
+    assert len(client_id) == 32
+    assert verify_client_token(token) == client_id
+
+
+def test_forged_or_malformed_tokens_are_rejected():
+    client_id, token = issue_client_token()
+    other_id, other_token = issue_client_token()
+    assert verify_client_token(f"{other_id}.{token.split('.')[1]}") is None
+    assert verify_client_token(token[:-1]) is None
+    assert verify_client_token(client_id) is None
+    assert verify_client_token(f"{token}.x") is None
+    assert verify_client_token(None) is None
+    assert verify_client_token({"id": client_id}) is None
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.services.context import ConversationContext, split_turns
+from app.services.memory import MemoryManager
+
+
+def turn(question, answer):
+    return [{"role": "user", "parts": [question]}, {"role": "model", "parts": [answer]}]
+
+
+@pytest.fixture
+def memory(tmp_path):
+    manager = MemoryManager(str(tmp_path / "memories.db"))
+    yield manager
+    manager.close()
+
+
+def test_split_turns_starts_each_turn_at_a_user_message():
+    history = turn("hi", "hello") + turn("how are you", "fine")
+    assert [len(t) for t in split_turns(history)] == [2, 2]
+
+
+def test_folded_turns_follow_the_client_id(memory):
+    async def session():
+        context = ConversationContext(memory, "session-1", recent_turns=1, ephemeral=True)
+        history = turn("my dog is called Rex", "Nice name") + turn("what is 2+2", "4")
+        history = context.commit("what is 2+2", history[:2], history[:2], history)
+        context.set_user("client:abc")
+        await context.close(history)
+
+    asyncio.run(session())
+    assert memory.get_recent("session-1") == []
+    texts = [m["text"] for m in memory.get_recent("client:abc")]
+    assert any("Rex" in text for text in texts)
+    assert any("2+2" in text for text in texts)
+
+
+def test_discard_deletes_an_anonymous_session(memory):
+    async def session():
+        context = ConversationContext(memory, "session-2", recent_turns=1, ephemeral=True)
+        history = turn("my dog is called Rex", "Nice name") + turn("what is 2+2", "4")
+        context.commit("what is 2+2", history[:2], history[:2], history)
+        await context.discard()
+
+    asyncio.run(session())
+    assert memory.get_recent("session-2") == []
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from app.services.pipeline import SentenceChunker, relay_deltas
+
+
+def test_relay_closes_the_stream_when_cancelled():
+    closed = asyncio.Event()
+
+    async def stream():
+        try:
+            yield "Hello there. "
+            yield "Never sent."
+        finally:
+            closed.set()
+
+    async def on_delta(delta):
+        # Barge-in arrives while a delta is being forwarded, with the generator parked at its yield
+        await asyncio.sleep(10)
+
+    async def turn():
+        task = asyncio.ensure_future(relay_deltas(stream(), on_delta))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return closed.is_set()
+
+    assert asyncio.run(turn())
+
+
+def test_chunker_cuts_sentences_across_deltas():
+    chunker = SentenceChunker()
+    assert chunker.feed("The sky is blue") == []
+    assert chunker.feed(" today. And the grass") == ["The sky is blue today."]
+    assert chunker.feed(" is green!\n\nNext") == ["And the grass is green!"]
+    assert chunker.flush() == "Next"
+    assert chunker.flush() is None
+
+
+def test_chunker_merges_short_fragments_into_the_next_sentence():
+    chunker = SentenceChunker()
+    assert chunker.feed("1. Preheat the oven. 2. Mix ") == ["1. Preheat the oven."]
+    assert chunker.flush() == "2. Mix"
@@ -0,0 +1,60 @@
+import numpy as np
+
+from app.services.embeddings import HashingEmbedder
+from app.services.response_cache import ResponseCache, cache_key_for, is_reordering, normalize_query
+
+
+class BagOfWordsEmbedder:
+    """Order-blind vectors: the worst case for questions that only differ in word order."""
+    name = "bag-of-words"
+    dim = 64
+
+    def embed_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            vector[hash(word) % self.dim] += 1.0
+        return vector / np.linalg.norm(vector)
+
+
+def test_normalize_query_drops_filler_and_punctuation():
+    assert normalize_query("Um, hey... What's the capital of France, please?") == "what is the capital of france"
+
+
+def test_cache_key_only_for_opening_self_contained_questions():
+    assert cache_key_for("What is the capital of France?") == "what is the capital of france"
+    assert cache_key_for("What is the capital of France?", [{"role": "user", "parts": ["hi"]}]) is None
+    assert cache_key_for("Tell me a joke about cats") is None
+    assert cache_key_for("Explain that again") is None
+
+
+def test_reordered_words_never_share_an_answer():
+    cache = ResponseCache(embedder=BagOfWordsEmbedder(), tag="test", similarity=0.9)
+    cache.put(normalize_query("How to convert Celsius to Fahrenheit?"), "Multiply by 9/5 and add 32.")
+    cache.put(normalize_query("Is a dolphin a fish?"), "No, dolphins are mammals.")
+
+    assert cache.get(normalize_query("how to convert fahrenheit to celsius")) == (None, "miss")
+    assert cache.get(normalize_query("is a fish a dolphin")) == (None, "miss")
+
+
+def test_semantic_hit_for_rewording():
+    cache = ResponseCache(embedder=BagOfWordsEmbedder(), tag="test", similarity=0.9)
+    cache.put(normalize_query("What is the capital of France?"), "Paris.")
+
+    assert cache.get(normalize_query("what is the capital of france")) == ("Paris.", "exact")
+    assert cache.get(normalize_query("what is capital of france")) == ("Paris.", "semantic")
+
+
+def test_is_reordering():
+    assert is_reordering("is a dolphin a fish", "is a fish a dolphin")
+    assert not is_reordering("is a dolphin a fish", "is a dolphin a fish")
+    assert not is_reordering("capital of france", "capital of spain")
+
+
+def test_hashing_embedder_serves_exact_matches_only(monkeypatch):
+    monkeypatch.setattr("app.services.response_cache.get_embedder", lambda: HashingEmbedder())
+    cache = ResponseCache(tag="test")
+    assert cache.embedder is None
+
+    cache.put("how to convert celsius to fahrenheit", "Multiply by 9/5 and add 32.")
+    assert cache.get("how to convert celsius to fahrenheit")[1] == "exact"
+    assert cache.get("how to convert fahrenheit to celsius") == (None, "miss")
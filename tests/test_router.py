@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.routing import FIXTURES, search_mode
+from app.services.router import RoutingEngine, router
+
+with open(FIXTURES) as f:
+    CASES = json.load(f)
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case["query"] for case in CASES])
+def test_fixture_routes(case):
+    route = router.route(case["query"])
+    assert route.primary_intent == case["primary_intent"]
+    assert search_mode(route) == case["search"]
+
+
+def test_dispatch_runs_only_blocking_tools():
+    engine = RoutingEngine(floors={})
+    calls = []
+
+    async def search(query, request):
+        calls.append(query)
+        return "results"
+
+    engine.register_tool("search", search)
+    assert asyncio.run(engine.dispatch(engine.route("weather in paris"), "weather in paris", {})) == {"search": "results"}
+
+    route = engine.route("what time is it now")
+    assert route.skipped == ["search"]
+    assert asyncio.run(engine.dispatch(route, "what time is it now", {})) == {}
+    assert calls == ["weather in paris"]
+
+
+def test_failed_tool_is_left_out():
+    engine = RoutingEngine(floors={})
+
+    async def search(query, request):
+        raise RuntimeError("quota")
+
+    engine.register_tool("search", search)
+    assert asyncio.run(engine.dispatch(engine.route("weather in paris"), "weather in paris", {})) == {}
+
+
+@pytest.mark.parametrize("query, blocking", [
+    ("draw a diagram of the login flow", True),
+    ("can you draw the pipeline", True),
+    ("how does the ci pipeline work", False),
+    ("explain the architecture of kafka", False),
+])
+def test_diagram_guidance_needs_an_explicit_ask(query, blocking):
+    assert ("diagram" in router.route(query).blocking) == blocking
@@ -0,0 +1,75 @@
+import asyncio
+
+from app.services.synthesis import StreamingSynthesisStage, SynthesisStage
+
+
+def test_audio_is_delivered_in_sentence_order():
+    delays = {"first": 0.03, "second": 0.01, "third": 0.0}
+    delivered = []
+
+    async def synthesize(sentence):
+        await asyncio.sleep(delays[sentence])
+        return sentence.encode()
+
+    async def deliver(audio):
+        delivered.append(audio)
+
+    async def turn():
+        stage = SynthesisStage(synthesize, deliver)
+        for sentence in delays:
+            stage.submit(sentence)
+        stage.submit("   ")
+        await stage.close()
+        return stage
+
+    stage = asyncio.run(turn())
+    assert delivered == [b"first", b"second", b"third"]
+    assert (stage.submitted, stage.delivered, stage.failed) == (3, 3, 0)
+
+
+def test_failed_sentence_is_skipped():
+    delivered = []
+
+    async def synthesize(sentence):
+        if sentence == "bad":
+            raise RuntimeError("quota")
+        return sentence.encode() if sentence != "empty" else None
+
+    async def deliver(audio):
+        delivered.append(audio)
+
+    async def turn():
+        stage = SynthesisStage(synthesize, deliver)
+        for sentence in ("one", "bad", "empty", "two"):
+            stage.submit(sentence)
+        await stage.close()
+        return stage
+
+    stage = asyncio.run(turn())
+    assert delivered == [b"one", b"two"]
+    assert stage.failed == 2
+
+
+def test_streamed_chunks_keep_sentence_order():
+    delivered = []
+
+    async def synthesize_stream(sentence):
+        for i in range(2):
+            # Later sentences download faster, so their chunks are ready first
+            await asyncio.sleep(0.02 if sentence == "a" else 0.0)
+            yield f"{sentence}{i}".encode()
+
+    async def deliver(chunk, clip_end):
+        delivered.append("end" if clip_end else chunk.decode())
+
+    async def drained():
+        delivered.append("turn end")
+
+    async def turn():
+        stage = StreamingSynthesisStage(synthesize_stream, deliver, on_drained=drained)
+        stage.submit("a")
+        stage.submit("b")
+        await stage.close()
+
+    asyncio.run(turn())
+    assert delivered == ["a0", "a1", "end", "b0", "b1", "end", "turn end"]